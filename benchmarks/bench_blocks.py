@@ -0,0 +1,70 @@
+"""
+块识别基准：构造含深层 div/section 嵌套的大章节文件，比较旧的 find_all 逐元素查找
+与单遍遍历的块识别耗时，并校验两者识别出的块完全一致。
+
+用法: python benchmarks/bench_blocks.py [段落数] [嵌套深度]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.epub_anchor_processor import EPubAnchorProcessor
+
+TAGS = list(EPubAnchorProcessor.TRANSLATABLE_TAGS)
+
+
+def legacy_elements(soup):
+    """单遍实现之前的块识别逻辑（只比较识别结果，不提取文本）"""
+    result = []
+    for element in soup.find_all(TAGS):
+        if any(child.name in TAGS for child in element.find_all(TAGS, recursive=False)):
+            if not "".join([t for t in element.find_all(string=True, recursive=False) if t.strip()]):
+                continue
+        result.append(element)
+    return result
+
+
+def make_chapter(paragraphs, depth):
+    # 每若干段落包在一串嵌套的 section/div 中，模拟排版工具导出的多层布局
+    parts = []
+    for i in range(0, paragraphs, 10):
+        body = "".join(f'<p class="p{j}">Paragraph {j} <span>with</span> <b>inline</b> markup.</p>'
+                       for j in range(i, min(i + 10, paragraphs)))
+        for d in range(depth):
+            tag = "section" if d % 2 else "div"
+            body = f'<{tag} class="l{d}">{body}</{tag}>'
+        parts.append(body)
+    return f'<html xmlns="http://www.w3.org/1999/xhtml"><body>{"".join(parts)}</body></html>'
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    proc = EPubAnchorProcessor()
+    markup = make_chapter(paragraphs, depth)
+    print(f"段落 {paragraphs}，嵌套深度 {depth}，文件 {len(markup) / 2**20:.1f} MB")
+    print(f"{'后端':<12} {'旧实现(s)':>10} {'单遍(s)':>10} {'加速比':>8}")
+    same = True
+    for backend in EPubAnchorProcessor.PARSER_BACKENDS:
+        soup = proc.parse_markup(markup, backend)
+        t_legacy, expected = timed(lambda: legacy_elements(soup))
+        # 单遍实现同时完成文本提取，旧实现再加上提取耗时才可比较
+        t_extract, _ = timed(lambda: [proc.extract_block_with_local_ids(e) for e in expected])
+        t_single, blocks = timed(lambda: proc.create_blocks_from_soup(soup))
+        same = same and [b['element'] for b in blocks] == expected
+        t_legacy += t_extract
+        print(f"{backend:<12} {t_legacy:>10.3f} {t_single:>10.3f} {t_legacy / max(t_single, 1e-9):>7.1f}x")
+    print(f"识别结果一致: {same}")
+    sys.exit(0 if same else 1)
@@ -0,0 +1,111 @@
+"""
+缓存格式基准：构造 run 密集的 DOCX，经真实的提取与分组流程生成缓存，
+比较旧格式（all_blocks 带 formats/raw_xml、逐块 block_to_file，indent=4）与紧凑格式的文件大小及加载/保存耗时，
+并校验迁移后的缓存与直接生成的紧凑缓存一致。
+
+用法: python benchmarks/bench_cache.py [段落数]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.processor import Processor
+from src.core.docx_anchor_processor import DocxAnchorProcessor
+
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def make_docx(path, paragraphs):
+    # 每段多个带格式的 run，模拟排版复杂的学术文档
+    runs = ('<w:r><w:rPr><w:b/><w:i/><w:sz w:val="24"/><w:rFonts w:ascii="Times New Roman"/></w:rPr>'
+            '<w:t xml:space="preserve">Sentence {0} with some emphasis. </w:t></w:r>')
+    body = "".join("<w:p>" + "".join(runs.format(f"{i}-{j}") for j in range(8)) + "</w:p>"
+                   for i in range(paragraphs))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', '<?xml version="1.0"?><Types/>')
+        z.writestr('word/document.xml', f'<?xml version="1.0"?><w:document {W_NS}><w:body>{body}</w:body></w:document>')
+
+
+def legacy_blocks(path):
+    """旧版本写入缓存的 all_blocks：每块带完整 formats"""
+    docx = DocxAnchorProcessor()
+    docx.open_docx(path)
+    blocks = []
+    for rel_path in docx.get_xml_files():
+        soup = BeautifulSoup(docx.read_part(rel_path), 'xml')
+        blocks.extend({"text": b['text'], "formats": b['formats']} for b in docx.create_blocks_from_soup(soup))
+    docx.archive.close()
+    return blocks
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    work = tempfile.mkdtemp(prefix="bench_cache_")
+    try:
+        src = os.path.join(work, "doc.docx")
+        make_docx(src, paragraphs)
+        processor = Processor(work)
+        cache_file = processor.get_cache_filename(src)
+        compact = processor.process_docx_anchor_init(src, 2000)
+
+        legacy = dict(compact)
+        legacy.pop("cache_version")
+        legacy.pop("journal_generation", None)
+        legacy["all_blocks"] = legacy_blocks(src)
+        legacy["block_to_file"] = {b_idx: f["rel_path"] for f in legacy.pop("file_ranges")
+                                   for b_idx in range(*f["block_range"])}
+        legacy_path = os.path.join(work, "legacy.json")
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump(legacy, f, ensure_ascii=False, indent=4)
+
+        def load_legacy():
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                json.load(f)
+
+        def save_legacy():
+            with open(legacy_path, 'w', encoding='utf-8') as f:
+                json.dump(legacy, f, ensure_ascii=False, indent=4)
+
+        t_legacy_load = timed(load_legacy)
+        t_legacy_save = timed(save_legacy)
+        t_load = timed(lambda: processor.load_cache(cache_file))
+        # 与 JSON 往返后的数据比较
+        expected = processor.load_cache(cache_file)
+        t_save = timed(lambda: processor.save_cache(cache_file, compact))
+        size_legacy = os.path.getsize(legacy_path)
+        size = os.path.getsize(os.path.join(work, cache_file))
+
+        # 迁移：旧缓存放到缓存文件名下，首次加载即转换并写回
+        shutil.copy(legacy_path, os.path.join(work, cache_file))
+        start = time.perf_counter()
+        migrated = processor.load_cache(cache_file)
+        t_migrate = time.perf_counter() - start
+        # journal_generation 每次写出都会递增，不参与比较
+        strip = lambda data: {k: v for k, v in data.items() if k != "journal_generation"}
+        same = strip(migrated) == strip(expected) and strip(processor.load_cache(cache_file)) == strip(expected)
+
+        print(f"段落 {paragraphs}，块 {len(compact['all_blocks'])}，分组 {len(compact['files'][0]['chunks'])}")
+        print(f"{'格式':<8} {'大小(MB)':>10} {'加载(s)':>10} {'保存(s)':>10}")
+        print(f"{'旧格式':<8} {size_legacy / 2**20:>10.2f} {t_legacy_load:>10.3f} {t_legacy_save:>10.3f}")
+        print(f"{'紧凑':<8} {size / 2**20:>10.2f} {t_load:>10.3f} {t_save:>10.3f}")
+        print(f"首次加载迁移 {t_migrate:.3f}s，迁移结果一致: {same}")
+        sys.exit(0 if same else 1)
+    finally:
+        shutil.rmtree(work)
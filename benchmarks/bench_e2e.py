@@ -0,0 +1,243 @@
+"""
+端到端吞吐基准：生成指定规模与锚点密度的合成 EPUB/DOCX，启动本地模拟 LLM 服务，
+对每个用例计时 初始化 -> process_run -> 导出，结果写入 JSON 以便跨版本比较。
+
+每个用例在独立的子进程中运行，峰值内存 (ru_maxrss) 互不影响；
+导出时进程池的内存单独记为 peak_rss_children_mb。
+
+用法:
+    python benchmarks/bench_e2e.py --sizes 2000 --anchors 4 --latency 0.05 --tps 2000 --fail-rate 0.02
+    python benchmarks/bench_e2e.py --formats epub --sizes 500 5000 --output results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_llm_server import MockLLMServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULT_VERSION = 1
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+WORDS = ("the quick brown fox jumps over a lazy dog while seven wizards quietly "
+         "judge every box of mixed liquor near the old harbour").split()
+
+
+def sentence(seed, words=24):
+    # 段落编号保证各段互不相同，否则书内重复块会被去重而不进入分组
+    return f"{seed}. " + " ".join(WORDS[(seed * 7 + k * 3) % len(WORDS)] for k in range(words))
+
+
+def make_epub(path, paragraphs, anchors, chapters=20):
+    """anchors 为每段内联标记数（<b>/<i>/<a>/<span> 轮换），决定锚点密度"""
+    inline = ("<b>{}</b>", "<i>{}</i>", '<a href="#n{}">note</a>', '<span class="s">{}</span>')
+    texts = []
+    for p in range(paragraphs):
+        marks = "".join(inline[k % len(inline)].format(WORDS[(p + k) % len(WORDS)]) + " " for k in range(anchors))
+        texts.append(f"{sentence(p)} {marks}end.")
+    make_epub_from_texts(path, texts, chapters)
+
+
+def make_epub_from_texts(path, texts, chapters=20):
+    """texts 为各段落的内部标记，按顺序平均分到 chapters 个章节"""
+    per_chapter = max(1, len(texts) // chapters)
+    manifest, spine = [], []
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        z.writestr('META-INF/container.xml',
+                   '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                   '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                   '</rootfiles></container>')
+        for c in range(chapters):
+            end = (c + 1) * per_chapter if c < chapters - 1 else len(texts)
+            body = [f"<p>{text}</p>" for text in texts[c * per_chapter:end]]
+            z.writestr(f'OEBPS/Text/chap{c}.xhtml',
+                       f'<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+                       f'<head><title>Chapter {c}</title></head><body><h1>Chapter {c}</h1>{"".join(body)}</body></html>')
+            manifest.append(f'<item id="c{c}" href="Text/chap{c}.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="c{c}"/>')
+        z.writestr('OEBPS/content.opf',
+                   '<?xml version="1.0" encoding="utf-8"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+                   '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>Bench</dc:title></metadata>'
+                   f'<manifest>{"".join(manifest)}</manifest><spine>{"".join(spine)}</spine></package>')
+
+
+def make_docx(path, paragraphs, anchors):
+    """anchors 为每段额外的带格式 run 数"""
+    props = ("<w:b/>", "<w:i/>", "<w:u w:val=\"single\"/>", "<w:sz w:val=\"28\"/>")
+    body = []
+    for p in range(paragraphs):
+        runs = [f'<w:r><w:t xml:space="preserve">{sentence(p)} </w:t></w:r>']
+        runs.extend(f'<w:r><w:rPr>{props[k % len(props)]}</w:rPr>'
+                    f'<w:t xml:space="preserve">{WORDS[(p + k) % len(WORDS)]} </w:t></w:r>' for k in range(anchors))
+        body.append("<w:p>" + "".join(runs) + "</w:p>")
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', '<?xml version="1.0"?><Types/>')
+        z.writestr('word/document.xml',
+                   f'<?xml version="1.0"?><w:document {W_NS}><w:body>{"".join(body)}</w:body></w:document>')
+
+
+def peak_rss_mb(who):
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux 以 KB 计，macOS 以字节计
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def run_case(case, server_url, queue):
+    """子进程：完整跑一遍 初始化 -> 翻译 -> 导出，把计时与计数放入 queue"""
+    from src.core.processor import Processor
+    from src.core.translator import Translator
+    from src.core.request_scheduler import RequestScheduler
+    from src.core.grouping import build_grouper
+    from src.core.metrics import metrics
+    from src.config import DEFAULT_PROMPT
+
+    metrics.enable()
+
+    work = case["work_dir"]
+    processor = Processor(os.path.join(work, "cache"))
+    failed = []
+
+    def on_progress(idx, total, orig, trans, is_finished):
+        if is_finished and not trans:
+            failed.append(idx)
+
+    start = time.perf_counter()
+    init = processor.process_docx_anchor_init if case["format"] == "docx" else processor.process_epub_anchor_init
+    cache_data = init(case["path"], case["chunk_size"], grouper=build_grouper({"chunk_size": case["chunk_size"]}))
+    init_s = time.perf_counter() - start
+
+    # 退避缩短到毫秒级，失败率只反映重试次数而不是等待时间
+    scheduler = RequestScheduler(max_retries=case["max_retries"], base_delay=0.01, max_delay=0.1)
+    translator = Translator("bench", server_url, "bench-model", 0.3, DEFAULT_PROMPT, scheduler=scheduler)
+    start = time.perf_counter()
+    completed = processor.process_run(case["path"], translator, context_rounds=case["context_rounds"],
+                                      callback=on_progress, max_workers=case["workers"], use_memory=False)
+    translate_s = time.perf_counter() - start
+
+    export_s = None
+    output_path = os.path.join(work, "translated." + case["format"])
+    if completed and not failed:
+        start = time.perf_counter()
+        processor.finalize_translation(case["path"], output_path, case["format"])
+        export_s = time.perf_counter() - start
+
+    groups = sum(len(f["chunks"]) for f in processor.load_cache(processor.get_cache_filename(case["path"]))["files"])
+    queue.put({
+        "blocks": len(cache_data["all_blocks"]),
+        "groups": groups,
+        "failed_groups": len(failed),
+        "completed": bool(completed) and not failed,
+        "exported": os.path.exists(output_path),
+        "init_s": round(init_s, 3),
+        "translate_s": round(translate_s, 3),
+        "export_s": round(export_s, 3) if export_s is not None else None,
+        "groups_per_s": round(groups / translate_s, 2) if translate_s > 0 else None,
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        # 各阶段耗时与计数（见 src/core/metrics.py）
+        "metrics": metrics.report(),
+    })
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="端到端吞吐基准")
+    parser.add_argument("--formats", nargs="+", default=["epub", "docx"], choices=["epub", "docx"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[2000], help="每个用例的段落数")
+    parser.add_argument("--anchors", nargs="+", type=int, default=[2], help="每段的内联格式标记数")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--context-rounds", type=int, default=1)
+    parser.add_argument("--max-retries", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务首字延迟（秒）")
+    parser.add_argument("--tps", type=float, default=0.0, help="模拟服务每秒输出 token 数，0 为不限")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="模拟服务请求失败概率")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_e2e_results.json", help="结果 JSON 路径")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = MockLLMServer(latency=args.latency, tps=args.tps, fail_rate=args.fail_rate, seed=args.seed,
+                           chunk_chars=64).start()
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    work_root = tempfile.mkdtemp(prefix="bench_e2e_")
+    try:
+        for fmt in args.formats:
+            for size in args.sizes:
+                for anchors in args.anchors:
+                    work = os.path.join(work_root, f"{fmt}_{size}_{anchors}")
+                    os.makedirs(work)
+                    path = os.path.join(work, f"book.{fmt}")
+                    (make_docx if fmt == "docx" else make_epub)(path, size, anchors)
+                    case = {"format": fmt, "paragraphs": size, "anchors": anchors, "path": path, "work_dir": work,
+                            "chunk_size": args.chunk_size, "workers": args.workers,
+                            "context_rounds": args.context_rounds, "max_retries": args.max_retries}
+                    requests_before = server.requests
+                    queue = ctx.Queue()
+                    proc = ctx.Process(target=run_case, args=(case, server.url, queue))
+                    proc.start()
+                    try:
+                        metrics = queue.get()
+                    finally:
+                        proc.join()
+                    result = {k: case[k] for k in ("format", "paragraphs", "anchors")}
+                    result["file_mb"] = round(os.path.getsize(path) / 2**20, 2)
+                    result.update(metrics)
+                    result["requests"] = server.requests - requests_before
+                    results.append(result)
+                    print(f"{fmt:<5} 段落 {size:>6} 锚点 {anchors:>2}: {metrics['groups']} 组, "
+                          f"初始化 {metrics['init_s']:.2f}s, 翻译 {metrics['translate_s']:.2f}s "
+                          f"({metrics['groups_per_s']} 组/秒), 导出 {metrics['export_s']}s, "
+                          f"峰值内存 {metrics['peak_rss_mb']} MB", flush=True)
+    finally:
+        server.stop()
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    report = {
+        "version": RESULT_VERSION,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": {"latency": args.latency, "tps": args.tps, "fail_rate": args.fail_rate,
+                   "status_counts": {str(k): v for k, v in server.status_counts.items()}},
+        "settings": {"chunk_size": args.chunk_size, "workers": args.workers,
+                     "context_rounds": args.context_rounds, "max_retries": args.max_retries},
+        "cases": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 0 if all(r["completed"] and r["exported"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
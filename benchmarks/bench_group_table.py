@@ -0,0 +1,93 @@
+"""
+分组表基准：构造数万分组的缓存数据，比较逐行创建 QTableWidgetItem 与惰性表格模型
+从加载到首屏绘制完成的耗时，以及单行状态更新的耗时。
+
+用法: QT_QPA_PLATFORM=offscreen python benchmarks/bench_group_table.py [分组数]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtWidgets import QApplication, QTableWidget, QTableWidgetItem, QTableView, QHeaderView
+
+from src.ui.table_models import GroupTableModel, group_status_text
+
+
+def make_cache(groups, blocks_per_group=8):
+    all_blocks = []
+    chunks = []
+    for g in range(groups):
+        start = len(all_blocks)
+        texts = [f"Paragraph {g}-{b} " + "lorem ipsum " * 20 for b in range(blocks_per_group)]
+        all_blocks.extend({"text": t, "anchors": 0} for t in texts)
+        chunks.append({"orig": "\n".join(texts), "trans": "译文" if g % 3 else "",
+                       "block_indices": list(range(start, start + blocks_per_group))})
+    return {"all_blocks": all_blocks, "files": [{"rel_path": "text.xhtml", "chunks": chunks}],
+            "file_ranges": [{"rel_path": "text.xhtml", "block_range": [0, len(all_blocks)]}]}
+
+
+def legacy_fill(table, cache_data):
+    """惰性模型之前的填充方式"""
+    table.setRowCount(0)
+    row = 0
+    for f_data in cache_data["files"]:
+        for c_data in f_data["chunks"]:
+            table.insertRow(row)
+            table.setItem(row, 0, QTableWidgetItem(str(row + 1)))
+            table.setItem(row, 1, QTableWidgetItem(group_status_text(c_data)))
+            table.setItem(row, 2, QTableWidgetItem(c_data["orig"][:50].replace("\n", " ") + "..."))
+            row += 1
+
+
+def setup_header(table):
+    table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+    table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
+    table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+
+
+if __name__ == "__main__":
+    groups = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    app = QApplication(sys.argv)
+    cache_data = make_cache(groups)
+    print(f"分组 {groups}")
+
+    widget = QTableWidget()
+    widget.setColumnCount(3)
+    setup_header(widget)
+    widget.resize(600, 800)
+    widget.show()
+    start = time.perf_counter()
+    legacy_fill(widget, cache_data)
+    widget.selectRow(0)
+    app.processEvents()
+    t_legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    widget.item(groups // 2, 1).setText("翻译中...")
+    app.processEvents()
+    t_legacy_update = time.perf_counter() - start
+    widget.close()
+
+    view = QTableView()
+    model = GroupTableModel()
+    view.setModel(model)
+    setup_header(view)
+    view.horizontalHeader().setResizeContentsPrecision(0)
+    view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    view.resize(600, 800)
+    view.show()
+    start = time.perf_counter()
+    model.set_cache_data(cache_data)
+    view.selectRow(0)
+    app.processEvents()
+    t_model = time.perf_counter() - start
+    start = time.perf_counter()
+    model.set_status(groups // 2, "翻译中...")
+    app.processEvents()
+    t_model_update = time.perf_counter() - start
+    view.close()
+
+    print(f"{'':<12} {'加载(s)':>10} {'单行更新(ms)':>14}")
+    print(f"{'QTableWidget':<12} {t_legacy:>10.3f} {t_legacy_update * 1000:>14.2f}")
+    print(f"{'惰性模型':<12} {t_model:>10.3f} {t_model_update * 1000:>14.2f}")
@@ -0,0 +1,74 @@
+"""
+打包基准：构造含大量已压缩图片的 EPUB，只修改少量 XHTML，
+比较“原样复制压缩数据”（归档模式）与“全部解压重压”（解压模式）的打包耗时，
+并校验两种输出解压后的内容完全一致。
+
+用法: python benchmarks/bench_repack.py [图片总 MB 数]
+"""
+import os
+import sys
+import time
+import shutil
+import zipfile
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.epub_anchor_processor import EPubAnchorProcessor
+
+
+def make_epub(path, image_mb, chapters=20):
+    # 随机字节模拟 JPEG/PNG：无法再压缩，重压只会白白消耗 CPU
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        for i in range(chapters):
+            body = "".join(f"<p>Paragraph {j} of chapter {i}.</p>" for j in range(200))
+            z.writestr(f'OEBPS/Text/chap{i}.xhtml', f"<html><body>{body}</body></html>", compress_type=zipfile.ZIP_DEFLATED)
+        for i in range(image_mb):
+            z.writestr(f'OEBPS/Images/img{i}.jpg', os.urandom(1 << 20), compress_type=zipfile.ZIP_DEFLATED)
+
+
+def repack(processor, modified, output_path):
+    for rel_path in modified:
+        processor.write_part(rel_path, processor.read_part(rel_path).replace("Paragraph", "段落"))
+    start = time.perf_counter()
+    processor.repack_epub(output_path)
+    return time.perf_counter() - start
+
+
+def read_all(path):
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        return z.namelist(), {n: z.read(n) for n in z.namelist()}
+
+
+if __name__ == "__main__":
+    image_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    work = tempfile.mkdtemp(prefix="bench_repack_")
+    try:
+        src = os.path.join(work, "book.epub")
+        make_epub(src, image_mb)
+        modified = ['OEBPS/Text/chap0.xhtml', 'OEBPS/Text/chap1.xhtml']
+
+        archive = EPubAnchorProcessor()
+        archive.open_epub(src)
+        t_archive = repack(archive, modified, os.path.join(work, "archive.epub"))
+        archive.cleanup()
+
+        extract = EPubAnchorProcessor()
+        extract.extract_epub(src)
+        t_extract = repack(extract, modified, os.path.join(work, "extract.epub"))
+        extract.cleanup()
+
+        names_a, data_a = read_all(os.path.join(work, "archive.epub"))
+        names_e, data_e = read_all(os.path.join(work, "extract.epub"))
+        same = names_a[0] == 'mimetype' and data_a == data_e
+
+        print(f"图片 {image_mb} MB，修改 {len(modified)} 个 XHTML")
+        print(f"{'模式':<12} {'耗时(s)':>10}")
+        print(f"{'原样复制':<12} {t_archive:>10.3f}")
+        print(f"{'全部重压':<12} {t_extract:>10.3f}")
+        print(f"加速比 {t_extract / max(t_archive, 1e-9):.1f}x，输出内容一致: {same}")
+        sys.exit(0 if same else 1)
+    finally:
+        shutil.rmtree(work)
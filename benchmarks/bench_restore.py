@@ -0,0 +1,55 @@
+"""
+锚点还原基准：块长度逐级翻倍，观察 restore_html / restore_xml 的耗时增长。
+线性实现下“每千字符耗时”应基本保持不变。
+
+用法: python benchmarks/bench_restore.py [最大段数]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from src.core.epub_anchor_processor import EPubAnchorProcessor
+from src.core.docx_anchor_processor import DocxAnchorProcessor
+
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def make_html(segments):
+    parts = []
+    for i in range(segments):
+        parts.append(f'Sentence {i} has <b>bold <i>nested {i}</i></b> and <a href="#n{i}">a link</a>.<br/>')
+    return f"<html><body><p>{''.join(parts)}</p></body></html>"
+
+
+def make_xml(segments):
+    runs = []
+    for i in range(segments):
+        runs.append(f'<w:r><w:t xml:space="preserve">Sentence {i} has </w:t></w:r>'
+                    f'<w:r><w:rPr><w:b/></w:rPr><w:t>bold {i}</w:t></w:r><w:r><w:br/></w:r>')
+    return f"<w:document {W_NS}><w:body><w:p>{''.join(runs)}</w:p></w:body></w:document>"
+
+
+def bench(label, processor, make_doc, parser, restore, max_segments):
+    print(f"\n{label}")
+    print(f"{'段数':>8} {'字符数':>10} {'耗时(ms)':>10} {'每千字符(ms)':>14}")
+    segments = 50
+    while segments <= max_segments:
+        soup = BeautifulSoup(make_doc(segments), parser)
+        block = processor.create_blocks_from_soup(soup)[0]
+        text = block['text']
+        start = time.perf_counter()
+        restore(block, text, soup)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{segments:>8} {len(text):>10} {elapsed:>10.1f} {elapsed / len(text) * 1000:>14.3f}")
+        segments *= 2
+
+
+if __name__ == "__main__":
+    max_segments = int(sys.argv[1]) if len(sys.argv) > 1 else 3200
+    epub = EPubAnchorProcessor()
+    docx = DocxAnchorProcessor()
+    bench("EPUB restore_html", epub, make_html, 'html.parser', epub.restore_html, max_segments)
+    bench("DOCX restore_xml", docx, make_xml, 'xml', docx.restore_xml, max_segments)
@@ -0,0 +1,65 @@
+"""
+修订版增量翻译基准：先完整翻译一本合成 EPUB，再改动其中一定比例的段落（改写 + 插入），
+比较修订版重新翻译的请求数、输入 token 与耗时相对首次翻译的比例，并校验导出成功。
+
+用法: python benchmarks/bench_revision.py [段落数] [改动比例]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_llm_server import MockLLMServer
+from bench_e2e import make_epub_from_texts, sentence
+from src.core.processor import Processor
+from src.core.translator import Translator
+from src.config import DEFAULT_PROMPT
+
+
+def run(processor, path, server):
+    requests, tokens = server.requests, server.prompt_tokens
+    start = time.perf_counter()
+    cache_data = processor.process_epub_anchor_init(path, 2000)
+    translator = Translator("bench", server.url, "bench-model", 0.3, DEFAULT_PROMPT)
+    processor.process_run(path, translator, max_workers=4, use_memory=False)
+    elapsed = time.perf_counter() - start
+    blocks = sum(len(c["block_indices"]) for c in cache_data["files"][0]["chunks"])
+    return server.requests - requests, server.prompt_tokens - tokens, elapsed, blocks
+
+
+if __name__ == "__main__":
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    rng = random.Random(0)
+    work = tempfile.mkdtemp(prefix="bench_revision_")
+    try:
+        path = os.path.join(work, "book.epub")
+        texts = [f"{sentence(i)} <b>bold</b> end." for i in range(paragraphs)]
+        make_epub_from_texts(path, texts)
+        processor = Processor(os.path.join(work, "cache"))
+        with MockLLMServer(latency=0.02, chunk_chars=256) as server:
+            first = run(processor, path, server)
+
+            # 一半改写、一半插入
+            changed = rng.sample(range(paragraphs), int(paragraphs * ratio / 2))
+            for i in changed:
+                texts[i] = f"Revised {i}: " + texts[i]
+            for i in sorted(rng.sample(range(paragraphs), int(paragraphs * ratio / 2)), reverse=True):
+                texts.insert(i, f"Inserted before {i}: {sentence(i + paragraphs)}")
+            make_epub_from_texts(path, texts)
+            second = run(processor, path, server)
+
+        processor.finalize_translation(path, os.path.join(work, "out.epub"))
+        print(f"段落 {paragraphs}，改动比例 {ratio:.0%}")
+        print(f"{'':<8} {'送翻块数':>8} {'请求数':>8} {'输入tokens':>12} {'耗时(s)':>8}")
+        for name, (req, tok, sec, blocks) in (("首次", first), ("修订版", second)):
+            print(f"{name:<8} {blocks:>8} {req:>8} {tok:>12} {sec:>8.2f}")
+        print(f"修订版/首次: 请求 {second[0] / first[0]:.1%}，输入 token {second[1] / first[1]:.1%}，"
+              f"耗时 {second[2] / first[2]:.1%}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
@@ -0,0 +1,59 @@
+"""
+响应校验基准：构造不同块数的分组响应，比较旧的逐块正则查找与单遍游标校验的耗时，
+并统计两者解析结果是否正确（旧实现在超过分隔符池长度的分组中会错配）。
+
+用法: python benchmarks/bench_validate.py [每块字符数]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.epub_anchor_processor import EPubAnchorProcessor
+
+
+def legacy_validate(proc, response_text, original_group):
+    """单遍实现之前的校验逻辑"""
+    pattern = re.escape(proc.GS) + r'([\s\S]*)' + re.escape(proc.GE)
+    group_match = re.search(pattern, response_text)
+    if not group_match:
+        return None, False
+    content = group_match.group(1).strip()
+    translated_texts = []
+    for i in range(len(original_group)):
+        ds, de = proc.get_block_delimiters(i)
+        match = re.search(re.escape(ds) + r'(.*?)' + re.escape(de), content, re.DOTALL)
+        if not match:
+            return None, False
+        translated_texts.append(match.group(1).strip())
+    return translated_texts, True
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    block_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    proc = EPubAnchorProcessor()
+    print(f"每块 {block_chars} 字符")
+    print(f"{'块数':>6} {'旧实现(ms)':>12} {'单遍(ms)':>10} {'旧实现正确':>10} {'单遍正确':>8}")
+    all_ok = True
+    for count in (10, 40, 200, 1000, 5000):
+        blocks = [{"text": f"{i}:" + "译" * block_chars} for i in range(count)]
+        response = proc.format_for_ai(blocks)
+        expected = [b["text"] for b in blocks]
+        t_legacy, (legacy_texts, _) = timed(lambda: legacy_validate(proc, response, blocks), 1 if count > 1000 else 5)
+        t_single, (texts, _) = timed(lambda: proc.validate_and_parse_response(response, blocks))
+        all_ok = all_ok and texts == expected
+        print(f"{count:>6} {t_legacy * 1000:>12.2f} {t_single * 1000:>10.2f} "
+              f"{str(legacy_texts == expected):>10} {str(texts == expected):>8}")
+    sys.exit(0 if all_ok else 1)
@@ -0,0 +1,203 @@
+"""
+本地 OpenAI 兼容的模拟服务（/v1/chat/completions，流式），用于测试与基准。
+译文为最后一条 user 消息的原样回显，因此总能通过结构校验。
+
+可模拟：首字延迟、输出速度、按概率/前 N 次请求返回错误（可带 Retry-After）、
+拒绝 thinking 参数、流式中途断开、输出长度截断。
+请求带 stream_options.include_usage 时在末尾返回 usage，并按消息粒度模拟前缀缓存：
+与之前任一请求相同的最长消息前缀计为 prompt_tokens_details.cached_tokens。
+
+用法: python benchmarks/mock_llm_server.py --port 8000 --latency 0.2 --tps 300 --fail-rate 0.1
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tps=0.0, fail_rate=0.0, fail_first=0,
+                 fail_status=429, retry_after=None, reject_thinking=False, drop_rate=0.0, chunk_chars=8, seed=None,
+                 max_output_chars=0):
+        self.latency = latency            # 首个分片之前的等待秒数
+        self.tps = tps                    # 每秒输出 token 数（按 4 字符 1 token 估算），0 为不限
+        self.fail_rate = fail_rate
+        self.fail_first = fail_first      # 前 N 次请求固定失败
+        self.fail_status = fail_status
+        self.retry_after = retry_after    # 失败响应中的 Retry-After 秒数
+        self.reject_thinking = reject_thinking
+        self.drop_rate = drop_rate        # 输出一半后断开连接的概率
+        self.chunk_chars = chunk_chars
+        self.max_output_chars = max_output_chars  # 超出时截断输出并以 finish_reason "length" 结束，0 为不限
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.status_counts = {}
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._prefixes = set()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _record(self, status):
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def _decide_failure(self, body):
+        """返回应当返回的错误状态码，None 表示正常响应"""
+        with self._lock:
+            self.requests += 1
+            n = self.requests
+            roll = self.random.random()
+        if self.reject_thinking and "thinking" in body:
+            return 400
+        if n <= self.fail_first or roll < self.fail_rate:
+            return self.fail_status
+        return None
+
+    def _usage(self, messages, completion):
+        """按 4 字符 1 token 估算，返回 usage 并记录本次请求的各级消息前缀"""
+        sizes = [len(m.get("content") or "") // 4 + 4 for m in messages]
+        keys = [hash(json.dumps(messages[:k + 1], ensure_ascii=False, sort_keys=True)) for k in range(len(messages))]
+        with self._lock:
+            hit = 0
+            while hit < len(keys) and keys[hit] in self._prefixes:
+                hit += 1
+            self._prefixes.update(keys)
+            prompt, cached = sum(sizes), sum(sizes[:hit])
+            self.prompt_tokens += prompt
+            self.cached_tokens += cached
+        return {"prompt_tokens": prompt, "completion_tokens": len(completion) // 4,
+                "total_tokens": prompt + len(completion) // 4,
+                "prompt_tokens_details": {"cached_tokens": cached}}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status = server._decide_failure(body)
+                if status is not None:
+                    server._record(status)
+                    headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else {}
+                    # 拒绝 thinking 参数时的说法与真实端点一致，客户端据此改用其他请求写法
+                    message = "Unsupported parameter: thinking" if status == 400 else f"mock error {status}"
+                    self._send_json(status, {"error": {"message": message, "type": "mock_error",
+                                                       "code": status}}, headers)
+                    return
+                with server._lock:
+                    server._concurrent += 1
+                    server.max_concurrent = max(server.max_concurrent, server._concurrent)
+                try:
+                    self._stream(body)
+                finally:
+                    with server._lock:
+                        server._concurrent -= 1
+
+            def _stream(self, body):
+                user_messages = [m for m in body.get("messages", []) if m.get("role") == "user"]
+                text = user_messages[-1]["content"] if user_messages else ""
+                finish_reason = "stop"
+                if server.max_output_chars and len(text) > server.max_output_chars:
+                    text = text[:server.max_output_chars]
+                    finish_reason = "length"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                if server.latency:
+                    time.sleep(server.latency)
+                drop_at = len(text) // 2 if server.random.random() < server.drop_rate else None
+                step = server.chunk_chars
+                for start in range(0, len(text), step):
+                    if drop_at is not None and start >= drop_at:
+                        server._record("dropped")
+                        self.close_connection = True
+                        return
+                    piece = text[start:start + step]
+                    chunk = {"id": "mock", "object": "chat.completion.chunk", "created": 0,
+                             "model": body.get("model", "mock"),
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if server.tps:
+                        time.sleep(len(piece) / 4 / server.tps)
+                final = {"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": body.get("model", "mock"),
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}
+                self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage = {"id": "mock", "object": "chat.completion.chunk", "created": 0,
+                             "model": body.get("model", "mock"), "choices": [],
+                             "usage": server._usage(body.get("messages", []), text)}
+                    self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                server._record(200)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="首字延迟（秒）")
+    parser.add_argument("--tps", type=float, default=0.0, help="每秒输出 token 数，0 为不限")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="请求失败概率")
+    parser.add_argument("--fail-status", type=int, default=429, help="失败时返回的状态码")
+    parser.add_argument("--retry-after", type=float, help="失败响应的 Retry-After 秒数")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="流式中途断开的概率")
+    parser.add_argument("--reject-thinking", action="store_true", help="带 thinking 参数的请求返回 400")
+    parser.add_argument("--max-output-chars", type=int, default=0, help="输出字符上限，超出时截断（finish_reason=length）")
+    args = parser.parse_args()
+    server = MockLLMServer(port=args.port, latency=args.latency, tps=args.tps, fail_rate=args.fail_rate,
+                           fail_status=args.fail_status, retry_after=args.retry_after,
+                           reject_thinking=args.reject_thinking, drop_rate=args.drop_rate,
+                           max_output_chars=args.max_output_chars)
+    print(f"Mock LLM server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"requests: {server.requests}, status: {server.status_counts}, "
+          f"prompt tokens: {server.prompt_tokens} (cached {server.cached_tokens})")
@@ -0,0 +1,319 @@
+"""
+命令行批量翻译入口（无界面）：初始化 -> 翻译 -> 导出。
+
+    python cli.py book1.epub book2.docx
+    python cli.py ./books --books 3 --max-requests 8 --output-dir ./out
+
+API 设置默认取自 config.json 中最近一次使用的配置（与界面共用），命令行参数优先。
+已有的 _cache.json 会被自动加载并从断点继续。
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+from src.core.translator import Translator
+from src.core.endpoint_capabilities import EndpointCapabilities
+from src.core.request_scheduler import build_scheduler
+from src.core.config_manager import ConfigManager
+from src.core.grouping import build_grouper, TokenGrouper
+from src.core.group_stats import GroupStats
+from src.core.metrics import metrics
+from src.config import (DEFAULT_ENDPOINT, DEFAULT_MODEL, DEFAULT_TEMPERATURE,
+                        DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_PROMPT,
+                        DEFAULT_CONTEXT_TOKENS, DEFAULT_MAX_OUTPUT_TOKENS,
+                        DEFAULT_MAX_RETRIES, DEFAULT_RPM, DEFAULT_TPM, DEFAULT_HISTORY_TOKENS)
+
+SUPPORTED_EXTS = (".epub", ".docx")
+
+_print_lock = threading.Lock()
+
+
+def log(book, msg):
+    with _print_lock:
+        print(f"[{book}] {msg}", flush=True)
+
+
+def collect_inputs(paths):
+    """展开目录（不递归）并按扩展名过滤，保持给定顺序、去重"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full) and name.lower().endswith(SUPPORTED_EXTS):
+                    files.append(full)
+        elif path.lower().endswith(SUPPORTED_EXTS) and os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"WARNING: 跳过不支持或不存在的文件: {path}")
+    unique = []
+    seen = set()
+    for f in files:
+        key = os.path.abspath(f)
+        if key not in seen:
+            seen.add(key)
+            unique.append(f)
+    return unique
+
+
+def build_settings(args):
+    """config.json 中最近一次的设置 + 命令行覆盖"""
+    config = ConfigManager(args.config)
+    last = config.get_last_settings()
+    return {
+        'api_key': args.api_key or os.environ.get("OPENAI_API_KEY") or last.get('api_key', ''),
+        'api_url': args.api_url or last.get('api_url') or DEFAULT_ENDPOINT,
+        'model': args.model or last.get('model') or DEFAULT_MODEL,
+        'temp': args.temperature if args.temperature is not None else last.get('temp', DEFAULT_TEMPERATURE),
+        'prompt': last.get('prompt') or DEFAULT_PROMPT,
+        'chunk_size': args.chunk_size or last.get('chunk_size', DEFAULT_CHUNK_SIZE),
+        'context_rounds': args.context_rounds if args.context_rounds is not None else last.get('context_rounds', 1),
+        'history_tokens': args.history_tokens if args.history_tokens is not None else last.get('history_tokens', DEFAULT_HISTORY_TOKENS),
+        'max_workers': args.workers or last.get('max_workers', DEFAULT_MAX_WORKERS),
+        'token_grouping': args.token_grouping or last.get('token_grouping', False),
+        'context_tokens': args.context_tokens or last.get('context_tokens', DEFAULT_CONTEXT_TOKENS),
+        'max_output_tokens': args.max_output_tokens or last.get('max_output_tokens', DEFAULT_MAX_OUTPUT_TOKENS),
+        'rpm': args.rpm if args.rpm is not None else last.get('rpm', DEFAULT_RPM),
+        'tpm': args.tpm if args.tpm is not None else last.get('tpm', DEFAULT_TPM),
+        'max_retries': args.max_retries if args.max_retries is not None else last.get('max_retries', DEFAULT_MAX_RETRIES),
+        'cache_dir': args.cache_dir or config.get_value('cache_dir') or "transcache",
+        'output_dir': args.output_dir or config.get_value('output_dir') or "transoutput",
+    }
+
+
+class BookJob:
+    """单本书的完整流程与吞吐统计，每本书使用独立的 Processor"""
+
+    def __init__(self, path, settings, request_limiter, capabilities=None, scheduler=None, use_memory=True, export=True,
+                 group_stats=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.settings = settings
+        self.request_limiter = request_limiter
+        self.capabilities = capabilities
+        self.scheduler = scheduler
+        self.use_memory = use_memory
+        self.export = export
+        self.processor = Processor(settings['cache_dir'], group_stats=group_stats)
+        self.groups_done = 0
+        self.groups_failed = 0
+        self.chars_done = 0
+        self.elapsed = 0.0
+        self.usage = {}
+        self.completed = False
+        self.output_path = None
+        self.error = None
+        self.stop_requested = False
+
+    def on_progress(self, idx, total, orig, trans, is_finished):
+        if not is_finished:
+            return
+        if not trans:
+            self.groups_failed += 1
+            log(self.name, f"分组 {idx + 1}/{total} 请求失败，下次运行时重试")
+            return
+        self.groups_done += 1
+        self.chars_done += len(orig)
+        log(self.name, f"分组 {idx + 1}/{total} 完成")
+
+    def run(self):
+        settings = self.settings
+        try:
+            ext = os.path.splitext(self.path)[1].lower()
+            memory = None
+            if self.use_memory:
+                memory = self.processor.open_memory(settings['model'], settings['prompt'], settings['temp'])
+            try:
+                init = self.processor.process_docx_anchor_init if ext == ".docx" else self.processor.process_epub_anchor_init
+                stats = self.processor.group_stats
+                if stats.scale(settings['model']) < 1:
+                    log(self.name, f"模型历史校验失败率 {stats.failure_rate(settings['model']):.0%}，"
+                                   f"新分组大小缩小为 {stats.scale(settings['model']):.0%}")
+                grouper = build_grouper(settings, stats)
+                if isinstance(grouper, TokenGrouper):
+                    log(self.name, grouper.counter.describe())
+                cache_data = init(self.path, settings['chunk_size'], callback=lambda m: log(self.name, m),
+                                  memory=memory, grouper=grouper)
+            finally:
+                if memory:
+                    memory.close()
+            total = sum(len(f["chunks"]) for f in cache_data["files"])
+            resume = cache_data['current_flat_idx']
+            if resume >= total:
+                log(self.name, f"共 {total} 个分组，已全部翻译")
+            else:
+                log(self.name, f"共 {total} 个分组，从第 {resume + 1} 组继续")
+
+            translator = Translator(settings['api_key'], settings['api_url'], settings['model'],
+                                    settings['temp'], settings['prompt'], request_limiter=self.request_limiter,
+                                    capabilities=self.capabilities, scheduler=self.scheduler)
+            if self.stop_requested:
+                return
+            start = time.perf_counter()
+            self.completed = self.processor.process_run(
+                self.path, translator,
+                context_rounds=settings['context_rounds'],
+                history_tokens=settings['history_tokens'],
+                callback=self.on_progress,
+                max_workers=settings['max_workers'],
+                use_memory=self.use_memory,
+                # 调度器在所有书之间共享，由 main 在开始前重置一次
+                reset_scheduler=False,
+            )
+            self.elapsed = time.perf_counter() - start
+            cache_data = self.processor.load_cache(self.processor.get_cache_filename(self.path)) or {}
+            self.usage = cache_data.get("usage_stats", {})
+            if not self.completed:
+                log(self.name, "翻译已停止，进度已保存")
+                return
+            if self.groups_failed:
+                # 仍有失败分组时不导出，避免输出残缺译文
+                self.completed = False
+                log(self.name, f"{self.groups_failed} 个分组请求失败，重新运行即可重试")
+                return
+
+            if self.export:
+                os.makedirs(settings['output_dir'], exist_ok=True)
+                base_name, file_ext = os.path.splitext(self.name)
+                self.output_path = os.path.join(settings['output_dir'], f"translated_{base_name}{file_ext}")
+                msg = self.processor.finalize_translation(self.path, self.output_path, file_ext.lstrip('.'),
+                                                          callback=lambda m: log(self.name, m))
+                log(self.name, msg)
+        except Exception as e:
+            self.error = e
+            self.completed = False
+            log(self.name, f"错误: {e}")
+
+    def stop(self):
+        self.stop_requested = True
+        if self.processor.status == "running":
+            self.processor.stop()
+
+
+def format_rate(groups, chars, seconds):
+    if seconds <= 0:
+        return f"{groups} 组, {chars} 字符"
+    return f"{groups} 组, {chars} 字符, {seconds:.1f}s, {groups / seconds * 60:.1f} 组/分钟, {chars / seconds:.0f} 字符/秒"
+
+
+def format_usage(usage):
+    """累计 token 用量；服务端返回了前缀缓存命中数时附上命中率"""
+    if not usage.get("input"):
+        return ""
+    return (f", 输入 {usage['input']} tokens (缓存命中 {usage.get('cached', 0) / usage['input']:.0%}),"
+            f" 输出 {usage.get('output', 0)} tokens")
+
+
+def print_summary(jobs, wall):
+    print("\n==== 吞吐统计 ====")
+    for job in jobs:
+        state = "完成" if job.completed else ("失败" if job.error else "未完成")
+        failed = f", 失败 {job.groups_failed} 组" if job.groups_failed else ""
+        print(f"{job.name}: [{state}] {format_rate(job.groups_done, job.chars_done, job.elapsed)}"
+              f"{format_usage(job.usage)}{failed}")
+    groups = sum(j.groups_done for j in jobs)
+    chars = sum(j.chars_done for j in jobs)
+    usage = {key: sum(j.usage.get(key, 0) for j in jobs) for key in ("input", "cached", "output")}
+    print(f"合计: {format_rate(groups, chars, wall)}{format_usage(usage)}")
+
+
+def write_metrics(args, jobs, wall):
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json, {
+            "wall_seconds": round(wall, 3),
+            "books": [{"name": job.name, "completed": job.completed, "groups": job.groups_done,
+                       "failed_groups": job.groups_failed, "chars": job.chars_done,
+                       "seconds": round(job.elapsed, 3), "usage": job.usage} for job in jobs],
+        })
+        print(f"运行报告已写入 {args.metrics_json}")
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+        print(f"Prometheus 指标已写入 {args.metrics_prom}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="EPUB/DOCX 批量翻译（命令行）")
+    parser.add_argument("inputs", nargs="+", help="EPUB/DOCX 文件或包含它们的目录")
+    parser.add_argument("--config", default="config.json", help="配置文件路径（默认与界面共用 config.json）")
+    parser.add_argument("--cache-dir", help="缓存目录")
+    parser.add_argument("--output-dir", help="输出目录")
+    parser.add_argument("--api-key", help="API Key（也可用环境变量 OPENAI_API_KEY）")
+    parser.add_argument("--api-url", help="API 地址")
+    parser.add_argument("--model", help="模型名称")
+    parser.add_argument("--temperature", type=float, help="温度")
+    parser.add_argument("--chunk-size", type=int, help="分组字符数上限（仅对新建缓存生效）")
+    parser.add_argument("--token-grouping", action="store_true", help="按 token 预算分组（仅对新建缓存生效）；安装 tiktoken 且编码表可用时精确计数，否则为估算")
+    parser.add_argument("--context-tokens", type=int, help="按 token 分组时的模型上下文窗口")
+    parser.add_argument("--max-output-tokens", type=int, help="按 token 分组时的单次输出上限")
+    parser.add_argument("--context-rounds", type=int, help="上下文轮数")
+    parser.add_argument("--history-tokens", type=int, help="上下文历史的 token 预算，0 为不限（超出时截取历史分组末尾的块）")
+    parser.add_argument("--workers", type=int, help="每本书的并发分组数")
+    parser.add_argument("--books", type=int, default=2, help="同时处理的书籍数 (默认 2)")
+    parser.add_argument("--max-requests", type=int, default=4, help="全局同时进行的 API 请求上限 (默认 4)")
+    parser.add_argument("--rpm", type=int, help="每分钟请求数上限，0 为不限")
+    parser.add_argument("--tpm", type=int, help="每分钟 token 数上限（估算），0 为不限")
+    parser.add_argument("--max-retries", type=int, help="暂时性故障的最大重试次数")
+    parser.add_argument("--no-memory", action="store_true", help="不使用翻译记忆")
+    parser.add_argument("--no-export", action="store_true", help="只翻译，不导出")
+    parser.add_argument("--metrics-json", help="写出各阶段耗时与计数的 JSON 运行报告")
+    parser.add_argument("--metrics-prom", help="写出 Prometheus textfile（供 node exporter 的 textfile collector 读取）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("错误: 没有可处理的 EPUB/DOCX 文件")
+        return 2
+    settings = build_settings(args)
+    if not settings['api_key']:
+        print("错误: 未配置 API Key（--api-key、OPENAI_API_KEY 或 config.json）")
+        return 2
+
+    if args.metrics_json or args.metrics_prom:
+        metrics.enable()
+    request_limiter = threading.BoundedSemaphore(max(1, args.max_requests))
+    # 所有书共用一份端点能力记录，同一端点只探测一次
+    os.makedirs(settings['cache_dir'], exist_ok=True)
+    capabilities = EndpointCapabilities(settings['cache_dir'])
+    # 限速与熔断在所有书之间共享；取消状态只在全部开始前重置一次，停止后才开始的书不会把它清除
+    scheduler = build_scheduler(settings)
+    scheduler.reset()
+    # 分组校验失败率在所有书之间共享
+    group_stats = GroupStats(settings['cache_dir'])
+    jobs = [BookJob(path, settings, request_limiter, capabilities, scheduler,
+                    use_memory=not args.no_memory, export=not args.no_export, group_stats=group_stats)
+            for path in files]
+
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max(1, args.books))
+    futures = [executor.submit(job.run) for job in jobs]
+    try:
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        print("\n正在停止，等待进行中的分组保存...")
+        for future in futures:
+            future.cancel()
+        for job in jobs:
+            job.stop()
+    executor.shutdown(wait=True)
+    wall = time.perf_counter() - start
+    print_summary(jobs, wall)
+    write_metrics(args, jobs, wall)
+    return 0 if all(job.completed for job in jobs) else 1
+
+
+if __name__ == "__main__":
+    # 导出时使用进程池，打包后的可执行文件需要此调用
+    multiprocessing.freeze_support()
+    sys.exit(main())
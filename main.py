@@ -1,5 +1,6 @@
 import sys
 import os
+import multiprocessing
 
 # Add src to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -14,4 +15,6 @@ def main():
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    # 导出时使用进程池，打包后的可执行文件需要此调用
+    multiprocessing.freeze_support()
     main()
@@ -3,6 +3,14 @@ DEFAULT_ENDPOINT = "https://api.openai.com/v1"
 DEFAULT_MODEL = "gpt-3.5-turbo"
 DEFAULT_TEMPERATURE = 0.7
 DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_WORKERS = 1 # 并发分组请求数
+DEFAULT_CONTEXT_TOKENS = 32000 # 按 Token 分组时的模型上下文窗口
+DEFAULT_MAX_OUTPUT_TOKENS = 4096 # 按 Token 分组时的单次输出上限
+STREAM_UI_FPS = 20 # 流式译文在界面上的刷新帧率
+DEFAULT_MAX_RETRIES = 5 # 暂时性故障（限流、超时、5xx）的最大重试次数
+DEFAULT_RPM = 0 # 每分钟请求数上限，0 为不限
+DEFAULT_TPM = 0 # 每分钟 token 数上限，0 为不限
+DEFAULT_HISTORY_TOKENS = 0 # 上下文历史的 token 预算，0 为包含完整的前序分组
 DEFAULT_PROMPT = """你是一位资深的学术翻译专家。请将以下文本翻译为中文，并严格遵守以下标记规则与任务要求：
 
 ### 任务要求
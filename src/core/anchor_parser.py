@@ -0,0 +1,211 @@
+import re
+from bs4 import BeautifulSoup
+from src.core.metrics import metrics
+
+class AnchorTokenizer:
+    """
+    锚点文本的单遍解析器，供 EPubAnchorProcessor.restore_html 与
+    DocxAnchorProcessor.restore_xml 共用。
+
+    解析结果为节点树：
+      - str                              普通文本（相邻文本已合并）
+      - ("container", n, children, raw)  ⟦内容⟧⦗n⦘ 容器，raw 为未解析的内部文本
+      - ("solo", n)                      独立锚点 ⦗n⦘
+    只有编号在 valid_ids 中的锚点才会被识别，其余标记按普通文本保留。
+    """
+
+    def __init__(self, TS="⟦", TE="⟧", AS="⦗", AE="⦘"):
+        self.TS = TS
+        self.TE = TE
+        self.anchor_re = re.compile(re.escape(AS) + r'(\d+)' + re.escape(AE))
+        # 只有 ⟦ 与 ⦗ 可能开启一个节点，其余字符整段跳过
+        self.special_re = re.compile('[' + re.escape(TS) + re.escape(AS) + ']')
+        self.bracket_re = re.compile('[' + re.escape(TS) + re.escape(TE) + ']')
+
+    def match_brackets(self, text):
+        """一次扫描求出每个 ⟦ 对应的 ⟧ 位置，未闭合的 ⟦ 不在结果中"""
+        pairs = {}
+        stack = []
+        for m in self.bracket_re.finditer(text):
+            if m.group() == self.TS:
+                stack.append(m.start())
+            elif stack:
+                pairs[stack.pop()] = m.start()
+        return pairs
+
+    def parse(self, text, valid_ids, nested=True):
+        """
+        解析带锚点的译文。nested 为 False 时不再解析容器内部（DOCX 的 run 只含纯文本）。
+        整体复杂度与文本长度成线性关系。
+        """
+        pairs = self.match_brackets(text)
+        anchor_re = self.anchor_re
+        special_re = self.special_re
+
+        def parse_range(start, end):
+            nodes = []
+            text_start = start
+            pos = start
+            while True:
+                m = special_re.search(text, pos, end)
+                if not m:
+                    break
+                i = m.start()
+                if text[i] == self.TS:
+                    j = pairs.get(i)
+                    if j is not None:
+                        # 锚点必须紧跟 ⟧ 且位于当前层级范围内
+                        am = anchor_re.match(text, j + 1, end)
+                        if am and int(am.group(1)) in valid_ids:
+                            if text_start < i:
+                                nodes.append(text[text_start:i])
+                            children = parse_range(i + 1, j) if nested else None
+                            nodes.append(("container", int(am.group(1)), children, text[i + 1:j]))
+                            pos = text_start = am.end()
+                            continue
+                else:
+                    am = anchor_re.match(text, i, end)
+                    if am and int(am.group(1)) in valid_ids:
+                        if text_start < i:
+                            nodes.append(text[text_start:i])
+                        nodes.append(("solo", int(am.group(1))))
+                        pos = text_start = am.end()
+                        continue
+                # 无效标记按普通文本处理，继续向后扫描
+                pos = i + 1
+            if text_start < end:
+                nodes.append(text[text_start:end])
+            return nodes
+
+        return parse_range(0, len(text))
+
+    def format_map(self, formats):
+        """将格式列表按锚点编号建立索引"""
+        result = {}
+        for f in formats:
+            m = self.anchor_re.search(f['id'])
+            if m:
+                result[int(m.group(1))] = f
+        return result
+
+
+class GroupResponseParser:
+    """
+    AI 响应的结构校验器，供 EPubAnchorProcessor 与 DocxAnchorProcessor 共用。
+
+    响应格式为 ⟬ 块0 块1 ... ⟭，第 i 块由 BLOCK_DELIMS[i % len] 前后包裹。
+    分隔符正则在构造时编译，parse 只扫描一遍分隔符并按顺序用游标逐块匹配，
+    整体与响应长度成线性关系；分隔符循环使用时（超过 len(delims) 块）也不会错配到后面的块。
+    给出 anchor_re 时还检查每块译文是否保留了原文的全部锚点 1..n（n 取块的 anchors，
+    没有时取 len(formats)），丢失锚点的块按失败处理，避免还原时静默丢掉链接、脚注等格式。
+    """
+
+    def __init__(self, GS, GE, delims, anchor_re=None):
+        self.GS = GS
+        self.GE = GE
+        self.delims = delims
+        self.delim_re = re.compile('[' + re.escape(delims) + ']')
+        self.anchor_re = anchor_re
+
+    def delimiter(self, index):
+        return self.delims[index % len(self.delims)]
+
+    @staticmethod
+    def anchor_counts(blocks):
+        """各块的锚点数：缓存中的块记录 anchors，刚提取的块带 formats"""
+        return [b["anchors"] if "anchors" in b else len(b.get("formats", ())) for b in blocks]
+
+    def missing_anchors(self, text, count):
+        """返回译文中缺少的锚点编号（升序）"""
+        if not count or self.anchor_re is None:
+            return []
+        found = {int(n) for n in self.anchor_re.findall(text)}
+        return [n for n in range(1, count + 1) if n not in found]
+
+    def parse(self, response_text, block_count, anchor_counts=None):
+        """
+        返回 (译文列表, 错误)。成功时错误为 None；失败时译文为 None，
+        错误为 {"block": 出错的块序号（组级错误为 None）, "reason": 原因}。
+        全部块匹配之后的多余内容忽略。anchor_counts 为各块的锚点数，给出时检查锚点是否丢失。
+        """
+        with metrics.span("validate", blocks=block_count, chars=len(response_text)):
+            texts, failure = self._parse(response_text, block_count)
+            if failure is None and anchor_counts is not None:
+                for i, (text, count) in enumerate(zip(texts, anchor_counts)):
+                    missing = self.missing_anchors(text, count)
+                    if missing:
+                        ids = "、".join(str(n) for n in missing)
+                        texts, failure = None, {"block": i, "reason": f"第 {i + 1} 块丢失锚点 {ids}"}
+                        break
+        if failure is not None:
+            metrics.count("validation_failures")
+        return texts, failure
+
+    def _parse(self, response_text, block_count):
+        start = response_text.find(self.GS)
+        end = response_text.rfind(self.GE)
+        if start < 0 or end <= start:
+            return None, {"block": None, "reason": "缺少分组标记 ⟬...⟭"}
+        pos = start + len(self.GS)
+
+        texts = []
+        tokens = self.delim_re.finditer(response_text, pos, end)
+        for i in range(block_count):
+            expected = self.delimiter(i)
+            opening = next(tokens, None)
+            if opening is None:
+                return None, {"block": i, "reason": f"缺少第 {i + 1} 块，响应只有 {i} 块"}
+            if opening.group() != expected:
+                return None, {"block": i, "reason": f"第 {i + 1} 块应以 {expected} 开始，实际为 {opening.group()}"}
+            closing = next(tokens, None)
+            if closing is None:
+                return None, {"block": i, "reason": f"第 {i + 1} 块缺少结束分隔符 {expected}"}
+            if closing.group() != expected:
+                return None, {"block": i, "reason": f"第 {i + 1} 块应以 {expected} 结束，实际为 {closing.group()}"}
+            texts.append(response_text[opening.end():closing.start()].strip())
+        return texts, None
+
+    def salvage(self, response_text, block_count, anchor_counts=None):
+        """
+        尽量从结构损坏的响应中取回能解析的块，返回长度为 block_count 的列表，无法解析的块为 None。
+        按顺序寻找首尾相同的相邻分隔符对，归入游标之后第一个使用该分隔符的块；
+        落单的分隔符（缺失开始或结束）跳过，其所在的块视为失败。缺少分组标记时扫描整个响应。
+        给出 anchor_counts 时丢失锚点的块同样为 None。
+        """
+        start = response_text.find(self.GS)
+        end = response_text.rfind(self.GE)
+        pos = start + len(self.GS) if start >= 0 else 0
+        if end < pos:
+            end = len(response_text)
+
+        texts = [None] * block_count
+        tokens = list(self.delim_re.finditer(response_text, pos, end))
+        index = {c: k for k, c in enumerate(self.delims)}
+        i = k = 0
+        while i < block_count and k + 1 < len(tokens):
+            opening, closing = tokens[k], tokens[k + 1]
+            if opening.group() != closing.group():
+                k += 1
+                continue
+            j = i + (index[opening.group()] - i) % len(self.delims)
+            if j >= block_count:
+                break
+            texts[j] = response_text[opening.end():closing.start()].strip()
+            i = j + 1
+            k += 2
+        if anchor_counts is not None:
+            texts = [None if t is None or self.missing_anchors(t, count) else t
+                     for t, count in zip(texts, anchor_counts)]
+        return texts
+
+
+def parse_xml_fragment(raw_xml, soup):
+    """
+    在 XML 文档的上下文中解析一段序列化片段（如 DOCX 的 w:r、XHTML 的 svg/math）。
+    片段本身不带前缀的命名空间声明，需要包裹一层携带文档根节点 xmlns 属性的元素，
+    否则 lxml 会丢弃 w: 等前缀。
+    """
+    root = soup.find()
+    ns_decl = " ".join(f'{k}="{v}"' for k, v in root.attrs.items() if k.startswith('xmlns')) if root else ""
+    wrapper = BeautifulSoup(f"<anchor-fragment {ns_decl}>{raw_xml}</anchor-fragment>", 'xml').find('anchor-fragment')
+    return wrapper.find(True, recursive=False) if wrapper else None
@@ -0,0 +1,53 @@
+import os
+import json
+
+class CacheJournal:
+    """
+    缓存文件的追加式日志 (write-ahead journal)。
+    每完成一个分组只追加一行 JSON（该分组的可变字段与少量全局状态），
+    由 Processor 定期压缩回完整的缓存文件，避免每组都重写整个缓存。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, entry):
+        """追加一条日志记录并落盘"""
+        line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+        with open(self.path, 'a+b') as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # 崩溃留下了写了一半的最后一行：另起一行，不让新记录接在它后面一起失效
+                    line = b"\n" + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self, data, generation=None):
+        """
+        将日志按顺序重放到完整缓存数据上，返回重放的记录数。
+        崩溃时可能留下写了一半的最后一行，解析失败的行直接忽略。
+        给出 generation 时跳过基于其他代缓存的记录（"g" 不同）：这些记录已包含在更新的完整缓存中，
+        其分组编号也可能已经改变。没有 "g" 的旧记录照常重放。
+        """
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if generation is not None and entry.get("g", generation) != generation:
+                    continue
+                if "f" in entry and "c" in entry:
+                    data["files"][entry["f"]]["chunks"][entry["c"]].update(entry.get("chunk", {}))
+                data.update(entry.get("state", {}))
+                count += 1
+        return count
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
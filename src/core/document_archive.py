@@ -0,0 +1,203 @@
+import os
+import sys
+import copy
+import shutil
+import struct
+import zipfile
+import tempfile
+
+# 原样复制成员依赖的 zipfile 内部实现（模块级常量与写入中的 ZipFile 属性），
+# 任何一项在新版本的 Python 中不存在时退回常规的解压 + writestr。
+# 属性存在但语义改变无法靠 hasattr 发现，因此只在逐一验证过的 Python 版本上启用，
+# 支持新版本时需先在该版本上跑通 test_document_archive.py 再加入此列表
+_RAW_COPY_PYTHON_VERSIONS = ((3, 9), (3, 10), (3, 11), (3, 12), (3, 13))
+_ZIPFILE_INTERNALS = ("structFileHeader", "sizeFileHeader", "stringFileHeader", "_FH_SIGNATURE",
+                      "_FH_FILENAME_LENGTH", "_FH_EXTRA_FIELD_LENGTH", "_strip_extra")
+_ZIPFILE_WRITER_INTERNALS = ("_lock", "_writecheck", "_didModify", "start_dir", "fp", "filelist", "NameToInfo")
+
+
+class DocumentArchive:
+    """
+    EPUB / DOCX（均为 zip 包）的内容访问层，支持两种模式：
+      - 归档模式：直接从 zip 中按需读取 XHTML/XML 内容部件，修改后的部件只保存在内存中，
+        图片、字体等其余成员始终留在原 zip 内，打包时再写出；
+      - 解压模式：完整解压到临时目录（兼容旧缓存中记录的 working_dir）。
+    部件路径在归档模式下为 zip 成员名（正斜杠），解压模式下为相对临时目录的路径。
+    """
+
+    def __init__(self):
+        self.source_path = None
+        self.root_dir = None
+        self.modified_parts = {}
+        self._zip = None
+
+    def open(self, path):
+        """归档模式：打开 zip，不解压任何文件"""
+        self.close()
+        self.source_path = path
+        self._zip = zipfile.ZipFile(path, 'r')
+
+    def extract(self, path, prefix):
+        """解压模式：完整解压到新的临时目录并返回该目录"""
+        self.close()
+        self.source_path = path
+        self.root_dir = tempfile.mkdtemp(prefix=prefix)
+        with zipfile.ZipFile(path, 'r') as zip_ref:
+            zip_ref.extractall(self.root_dir)
+        return self.root_dir
+
+    def use_directory(self, root_dir):
+        """解压模式：复用已有的解压目录"""
+        self.close()
+        self.root_dir = root_dir
+
+    def list_parts(self):
+        """按归档顺序（解压模式下按目录遍历顺序）返回所有文件部件路径"""
+        if self.root_dir:
+            parts = []
+            for root, dirs, files in os.walk(self.root_dir):
+                for file in files:
+                    parts.append(os.path.relpath(os.path.join(root, file), self.root_dir))
+            return parts
+        if self._zip:
+            return [info.filename for info in self._zip.infolist() if not info.is_dir()]
+        return []
+
+    def has_part(self, rel_path):
+        if self.root_dir:
+            return os.path.exists(os.path.join(self.root_dir, rel_path))
+        return self._member_name(rel_path) in self._zip.NameToInfo
+
+    def read_part(self, rel_path):
+        """读取部件文本（修改过的部件返回修改后的内容）"""
+        if self.root_dir:
+            with open(os.path.join(self.root_dir, rel_path), 'r', encoding='utf-8') as f:
+                return f.read()
+        name = self._member_name(rel_path)
+        if name in self.modified_parts:
+            return self.modified_parts[name]
+        return self._zip.read(name).decode('utf-8')
+
+    def read_bytes(self, rel_path):
+        if self.root_dir:
+            with open(os.path.join(self.root_dir, rel_path), 'rb') as f:
+                return f.read()
+        return self._zip.read(self._member_name(rel_path))
+
+    def write_part(self, rel_path, text):
+        """写回部件：解压模式写入文件，归档模式仅记录在内存中"""
+        if self.root_dir:
+            with open(os.path.join(self.root_dir, rel_path), 'w', encoding='utf-8') as f:
+                f.write(text)
+        else:
+            self.modified_parts[self._member_name(rel_path)] = text
+
+    def repack(self, output_path, stored_first=None):
+        """
+        写出新的 zip。stored_first 为必须位于首位且不压缩的成员（EPUB 的 mimetype）。
+        成员名一律使用正斜杠，这是 EPUB/ZIP 标准所要求的。
+        """
+        if self.root_dir:
+            self._repack_directory(output_path, stored_first)
+        elif self._zip:
+            self._repack_archive(output_path, stored_first)
+        else:
+            raise ValueError("没有可打包的内容")
+
+    def _repack_directory(self, output_path, stored_first):
+        with zipfile.ZipFile(output_path, 'w') as zipf:
+            if stored_first and os.path.exists(os.path.join(self.root_dir, stored_first)):
+                zipf.write(os.path.join(self.root_dir, stored_first), stored_first, compress_type=zipfile.ZIP_STORED)
+            for rel_path in self.list_parts():
+                zip_path = rel_path.replace(os.sep, '/')
+                if zip_path == stored_first:
+                    continue
+                zipf.write(os.path.join(self.root_dir, rel_path), zip_path, compress_type=zipfile.ZIP_DEFLATED)
+
+    def _repack_archive(self, output_path, stored_first):
+        """
+        未修改的成员直接复制原 zip 中的压缩数据（图片、字体不再解压重压），
+        只有修改过的内容部件需要重新压缩，导出耗时只与改动的文本量相关。
+        """
+        infos = [info for info in self._zip.infolist() if not info.is_dir()]
+        if stored_first:
+            infos.sort(key=lambda info: info.filename != stored_first)
+        with zipfile.ZipFile(output_path, 'w') as zipf, open(self.source_path, 'rb') as src:
+            raw_copy = self._raw_copy_supported(zipf)
+            for info in infos:
+                if raw_copy and self._can_copy_raw(info, stored_first):
+                    self._copy_raw(zipf, src, info)
+                    continue
+                if info.filename in self.modified_parts:
+                    data = self.modified_parts[info.filename].encode('utf-8')
+                else:
+                    data = self._zip.read(info)
+                new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                new_info.external_attr = info.external_attr
+                new_info.compress_type = zipfile.ZIP_STORED if info.filename == stored_first else zipfile.ZIP_DEFLATED
+                zipf.writestr(new_info, data)
+
+    @staticmethod
+    def _raw_copy_supported(zipf):
+        return (sys.version_info[:2] in _RAW_COPY_PYTHON_VERSIONS
+                and all(hasattr(zipfile, name) for name in _ZIPFILE_INTERNALS)
+                and all(hasattr(zipf, name) for name in _ZIPFILE_WRITER_INTERNALS))
+
+    def _can_copy_raw(self, info, stored_first):
+        if info.filename in self.modified_parts:
+            return False
+        # mimetype 在原包中若被压缩过，需要改写为不压缩
+        return info.filename != stored_first or info.compress_type == zipfile.ZIP_STORED
+
+    def _copy_raw(self, zipf, src, info):
+        """按原样复制一个成员的压缩数据，本地文件头按 zipfile 的规则重新生成"""
+        src.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader, src.read(zipfile.sizeFileHeader))
+        if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"本地文件头损坏: {info.filename}")
+        src.seek(header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+
+        new_info = copy.copy(info)
+        # 加密成员（无法解压重写）保留数据描述符：ZipCrypto 的校验字节在该标志下取自修改时间而非 CRC
+        descriptor = info.flag_bits & 0x08 and info.flag_bits & 0x01
+        if not descriptor:
+            # 大小与 CRC 已知，直接写入本地文件头，不再使用数据描述符
+            new_info.flag_bits &= ~0x08
+        # ZIP64 扩展字段由 FileHeader 按需重新生成
+        new_info.extra = zipfile._strip_extra(info.extra, (1,))
+        with zipf._lock:
+            new_info.header_offset = zipf.fp.tell()
+            zipf._writecheck(new_info)
+            zipf._didModify = True
+            zipf.fp.write(new_info.FileHeader())
+            remaining = info.compress_size
+            while remaining > 0:
+                chunk = src.read(min(remaining, 1 << 20))
+                if not chunk:
+                    raise zipfile.BadZipFile(f"成员数据不完整: {info.filename}")
+                zipf.fp.write(chunk)
+                remaining -= len(chunk)
+            if descriptor:
+                zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+                zipf.fp.write(struct.pack('<LLQQ' if zip64 else '<LLLL', 0x08074b50, info.CRC,
+                                          info.compress_size, info.file_size))
+            zipf.filelist.append(new_info)
+            zipf.NameToInfo[new_info.filename] = new_info
+            zipf.start_dir = zipf.fp.tell()
+
+    def _member_name(self, rel_path):
+        # 旧缓存中的路径可能使用系统分隔符
+        return rel_path.replace(os.sep, '/')
+
+    def close(self):
+        if self._zip:
+            self._zip.close()
+            self._zip = None
+        self.root_dir = None
+        self.modified_parts = {}
+
+    def cleanup(self):
+        """关闭归档并删除临时解压目录"""
+        if self.root_dir and os.path.exists(self.root_dir):
+            shutil.rmtree(self.root_dir)
+        self.close()
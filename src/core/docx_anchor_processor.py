@@ -1,9 +1,7 @@
 import os
-import re
-import zipfile
-import shutil
-import tempfile
 from bs4 import BeautifulSoup
+from src.core.anchor_parser import AnchorTokenizer, GroupResponseParser, parse_xml_fragment
+from src.core.document_archive import DocumentArchive
 
 class DocxAnchorProcessor:
     """
@@ -13,7 +11,7 @@ class DocxAnchorProcessor:
     
     def __init__(self, max_group_chars=2000):
         self.max_group_chars = max_group_chars
-        self.temp_dir = None
+        self.archive = DocumentArchive()
         
         # 稀有 Unicode 符号标记 (与 EPUB 保持一致)
         self.GS = "⟬" # Group Start
@@ -27,36 +25,55 @@ class DocxAnchorProcessor:
         
         # 块级分隔符池
         self.BLOCK_DELIMS = "⧖⧗⧘⧙⧚⧛⧜⧝⧞⧟⨀⨁⨂⨃⨄⨅⨆⨇⨈⨉⨊⨋⨌⨍⨎⨏⨐⨑⨒⨓⨔⨕⨖⨗⨘⨙⨚⨛⨜⨝⨞⨟"
+        self.tokenizer = AnchorTokenizer(self.TS, self.TE, self.AS, self.AE)
+        self.response_parser = GroupResponseParser(self.GS, self.GE, self.BLOCK_DELIMS, self.tokenizer.anchor_re)
 
     def get_block_delimiters(self, index):
         char = self.BLOCK_DELIMS[index % len(self.BLOCK_DELIMS)]
         return char, char
 
+    @property
+    def temp_dir(self):
+        """解压模式下的临时目录，归档模式下为 None"""
+        return self.archive.root_dir
+
+    @temp_dir.setter
+    def temp_dir(self, path):
+        self.archive.use_directory(path)
+
+    def open_docx(self, docx_path, callback=None):
+        """归档模式：直接从 zip 读取内容文件，不解压到磁盘"""
+        if callback: callback("正在读取 DOCX 文件...")
+        self.archive.open(docx_path)
+
     def extract_docx(self, docx_path, callback=None):
-        """将 DOCX 完整解压到临时目录"""
+        """解压模式：将 DOCX 完整解压到临时目录"""
         if callback: callback("正在解压 DOCX 文件...")
-        self.temp_dir = tempfile.mkdtemp(prefix="docx_trans_")
-        with zipfile.ZipFile(docx_path, 'r') as zip_ref:
-            zip_ref.extractall(self.temp_dir)
-        return self.temp_dir
+        return self.archive.extract(docx_path, prefix="docx_trans_")
 
     def get_xml_files(self):
-        """返回 DOCX 中主要的 XML 内容文件"""
+        """返回 DOCX 中主要的 XML 内容部件路径（相对包根目录）"""
+        parts = self.archive.list_parts()
+        by_name = {p.replace(os.sep, '/'): p for p in parts}
         content_files = []
         # 主文档
-        main_doc = os.path.join(self.temp_dir, 'word', 'document.xml')
-        if os.path.exists(main_doc):
-            content_files.append(main_doc)
+        if 'word/document.xml' in by_name:
+            content_files.append(by_name['word/document.xml'])
         
         # 页眉页脚、脚注、尾注
-        word_dir = os.path.join(self.temp_dir, 'word')
-        if os.path.exists(word_dir):
-            for f in os.listdir(word_dir):
-                if f.startswith(('header', 'footer', 'footnotes', 'endnotes', 'comments')) and f.endswith('.xml'):
-                    content_files.append(os.path.join(word_dir, f))
+        for name in sorted(by_name):
+            folder, f = name.rpartition('/')[::2]
+            if folder == 'word' and f.startswith(('header', 'footer', 'footnotes', 'endnotes', 'comments')) and f.endswith('.xml'):
+                content_files.append(by_name[name])
         
         return content_files
 
+    def read_part(self, rel_path):
+        return self.archive.read_part(rel_path)
+
+    def write_part(self, rel_path, markup):
+        self.archive.write_part(rel_path, markup)
+
     def extract_block_with_local_ids(self, element):
         """
         核心逻辑：提取 DOCX 段落内容，将格式运行 <w:r> 转化为带编号的锚点。
@@ -158,94 +175,48 @@ class DocxAnchorProcessor:
 
     def validate_and_parse_response(self, response_text, original_group):
         """同 EPUB"""
-        pattern = re.escape(self.GS) + r'([\s\S]*)' + re.escape(self.GE)
-        group_match = re.search(pattern, response_text)
-        if not group_match:
-            return None, False
-        
-        content = group_match.group(1).strip()
-        translated_texts = []
-        
-        for i in range(len(original_group)):
-            ds, de = self.get_block_delimiters(i)
-            block_pattern = re.escape(ds) + r'(.*?)' + re.escape(de)
-            match = re.search(block_pattern, content, re.DOTALL)
-            if match:
-                translated_texts.append(match.group(1).strip())
-            else:
-                return None, False
-        
-        if len(translated_texts) != len(original_group):
-            return None, False
-                
-        return translated_texts, True
+        texts, _ = self.response_parser.parse(response_text, len(original_group))
+        return texts, texts is not None
+
+    def validate_response(self, response_text, original_group):
+        """同 EPUB"""
+        return self.response_parser.parse(response_text, len(original_group), self.response_parser.anchor_counts(original_group))
+
+    def salvage_response(self, response_text, original_group):
+        """同 EPUB"""
+        return self.response_parser.salvage(response_text, len(original_group), self.response_parser.anchor_counts(original_group))
 
     def restore_xml(self, original_block, translated_text, soup):
         """将翻译后的锚点文本还原为 DOCX XML"""
-        format_map = {int(re.search(r'(\d+)', f['id']).group(1)): f for f in original_block['formats']}
-        
-        def parse_to_nodes(text):
-            nodes = []
-            i = 0
-            while i < len(text):
-                if text[i] == self.TS:
-                    start_idx = i
-                    level = 1
-                    j = i + 1
-                    while j < len(text) and level > 0:
-                        if text[j] == self.TS: level += 1
-                        elif text[j] == self.TE: level -= 1
-                        j += 1
-                    
-                    if level == 0:
-                        inner_text = text[start_idx+1:j-1]
-                        anchor_tail = text[j:]
-                        match = re.match(re.escape(self.AS) + r'(\d+)' + re.escape(self.AE), anchor_tail)
-                        if match:
-                            anchor_num = int(match.group(1))
-                            if anchor_num in format_map:
-                                fmt = format_map[anchor_num]
-                                # 还原 w:r
-                                # 我们采取“克隆并更新文本”的策略
-                                r_node = BeautifulSoup(fmt['raw_xml'], 'xml').find('r')
-                                if r_node:
-                                    t_node = r_node.find('t')
-                                    if t_node:
-                                        t_node.string = inner_text
-                                    nodes.append(r_node)
-                                    i = j + match.end()
-                                    continue
-                
-                match_solo = re.match(re.escape(self.AS) + r'(\d+)' + re.escape(self.AE), text[i:])
-                if match_solo:
-                    anchor_num = int(match_solo.group(1))
-                    if anchor_num in format_map:
-                        fmt = format_map[anchor_num]
-                        # 还原单体节点 (如 w:br 或带 drawing 的 w:r)
-                        node = BeautifulSoup(fmt['raw_xml'], 'xml').contents[0]
-                        import copy
-                        nodes.append(copy.copy(node))
-                        i += match_solo.end()
-                        continue
-                
-                # 普通文本，需要包裹在 w:r/w:t 中
-                # 为了保持简单，我们遇到连续文本时会创建一个新的 w:r
-                curr_text = ""
-                while i < len(text) and text[i] not in (self.TS, self.AS):
-                    curr_text += text[i]
-                    i += 1
-                if curr_text:
-                    new_r = soup.new_tag('w:r')
-                    new_t = soup.new_tag('w:t')
-                    new_t['xml:space'] = 'preserve'
-                    new_t.string = curr_text
-                    new_r.append(new_t)
-                    nodes.append(new_r)
-                continue
-                
-            return nodes
+        format_map = self.tokenizer.format_map(original_block['formats'])
+
+        def new_text_run(text):
+            # 普通文本包裹在新的 w:r/w:t 中
+            new_r = soup.new_tag('w:r')
+            new_t = soup.new_tag('w:t')
+            new_t['xml:space'] = 'preserve'
+            new_t.string = text
+            new_r.append(new_t)
+            return new_r
 
-        new_nodes = parse_to_nodes(translated_text)
+        nodes = []
+        for token in self.tokenizer.parse(translated_text, format_map, nested=False):
+            if isinstance(token, str):
+                nodes.append(new_text_run(token))
+                continue
+            fmt = format_map[token[1]]
+            node = parse_xml_fragment(fmt['raw_xml'], soup)
+            if token[0] == "container":
+                # 还原 w:r：采取“克隆并更新文本”的策略
+                if node is None:
+                    nodes.append(new_text_run(token[3]))
+                    continue
+                t_node = node.find('t')
+                if t_node:
+                    t_node.string = token[3]
+            if node is not None:
+                # 单体节点 (如 w:br 或带 drawing 的 w:r) 原样还原
+                nodes.append(node)
         
         # 保留 w:pPr (段落属性)
         pPr = original_block['element'].find(['pPr', 'w:pPr'], recursive=False)
@@ -253,22 +224,24 @@ class DocxAnchorProcessor:
         if pPr:
             original_block['element'].append(pPr)
             
-        for node in new_nodes:
+        for node in nodes:
             original_block['element'].append(node)
 
+    def restore_document(self, markup, translations, backend=None):
+        """同 EPUB，使用 xml 解析器"""
+        soup = BeautifulSoup(markup, 'xml')
+        soup_blocks = self.create_blocks_from_soup(soup)
+        if len(soup_blocks) != len(translations):
+            return None, len(soup_blocks)
+        for block, text in zip(soup_blocks, translations):
+            if text is not None:
+                self.restore_xml(block, text, soup)
+        return str(soup), len(soup_blocks)
+
     def repack_docx(self, output_path):
-        """重新打包目录为 DOCX"""
-        if not self.temp_dir or not os.path.exists(self.temp_dir):
-            raise ValueError("没有可打包的临时目录")
-            
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(self.temp_dir):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, self.temp_dir)
-                    zipf.write(full_path, rel_path)
+        """重新打包为 DOCX"""
+        self.archive.repack(output_path)
                     
     def cleanup(self):
-        """清理临时目录"""
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        """关闭归档并清理临时目录"""
+        self.archive.cleanup()
@@ -0,0 +1,56 @@
+import os
+import json
+import threading
+
+class EndpointCapabilities:
+    """
+    记录每个 (base_url, model) 所接受的请求形式（如关闭思考模式的参数写法），
+    持久化到缓存目录下的 endpoint_capabilities.json，供之后的分组与后续运行复用。
+    cache_dir 为 None 时只在内存中记录。
+    """
+
+    FILE_NAME = "endpoint_capabilities.json"
+
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, self.FILE_NAME) if cache_dir else None
+        self._lock = threading.Lock()
+        self._probe_locks = {}
+        self.data = self._load()
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"WARNING: Failed to load endpoint capabilities: {e}")
+        return {}
+
+    def get(self, base_url, model):
+        with self._lock:
+            return self.data.get(str(base_url), {}).get(model)
+
+    def set(self, base_url, model, variant):
+        with self._lock:
+            models = self.data.setdefault(str(base_url), {})
+            if models.get(model) == variant:
+                return
+            models[model] = variant
+            self._save()
+
+    def probe_lock(self, base_url, model):
+        """同一端点同一时间只允许一个线程探测，其余线程等待探测结果"""
+        key = (str(base_url), model)
+        with self._lock:
+            return self._probe_locks.setdefault(key, threading.Lock())
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"WARNING: Failed to save endpoint capabilities: {e}")
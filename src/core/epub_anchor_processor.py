@@ -1,9 +1,12 @@
 import os
 import re
-import zipfile
-import shutil
-import tempfile
-from bs4 import BeautifulSoup
+import copy
+import posixpath
+from urllib.parse import unquote
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+from lxml import etree
+from src.core.anchor_parser import AnchorTokenizer, GroupResponseParser
+from src.core.document_archive import DocumentArchive
 
 class EPubAnchorProcessor:
     """
@@ -11,9 +14,27 @@ class EPubAnchorProcessor:
     采用“提取 - 原地修改 - 重新打包”的极简策略，确保极致的结构保留。
     """
     
-    def __init__(self, max_group_chars=2000):
+    # 可选的解析后端："lxml" 为默认的快速模式，"html.parser" 为纯 Python 的兼容模式
+    PARSER_BACKENDS = ("lxml", "html.parser")
+    # 极大扩展可翻译标签；div/section/article 等容器只有其直接包含文本时才处理
+    TRANSLATABLE_TAGS = frozenset([
+        'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 
+        'li', 'td', 'th', 'caption', 'figcaption', 
+        'blockquote', 'dt', 'dd', 'cite', 'footer', 'aside',
+        'div', 'section', 'article'
+    ])
+
+    CONTAINER_PATH = "META-INF/container.xml"
+    XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+    XHTML_MEDIA_TYPES = frozenset(['application/xhtml+xml', 'text/html'])
+    _NON_TEXT_RE = re.compile(rb'<!--.*?-->|<head\b.*?</head\s*>|<script\b.*?</script\s*>|<style\b.*?</style\s*>'
+                              rb'|<!\[CDATA\[|\]\]>|<[^>]*>|&(?:nbsp|#160|#[xX][aA]0);', re.S | re.I)
+    _VISIBLE_TEXT_RE = re.compile(rb'\S')
+
+    def __init__(self, max_group_chars=2000, parser_backend="lxml"):
         self.max_group_chars = max_group_chars
-        self.temp_dir = None
+        self.parser_backend = parser_backend
+        self.archive = DocumentArchive()
         self.format_counter = 0
         
         # 稀有 Unicode 符号标记
@@ -24,34 +45,243 @@ class EPubAnchorProcessor:
         
         # 块级分隔符池 (绝对稀有字符)
         self.BLOCK_DELIMS = "⧖⧗⧘⧙⧚⧛⧜⧝⧞⧟⨀⨁⨂⨃⨄⨅⨆⨇⨈⨉⨊⨋⨌⨍⨎⨏⨐⨑⨒⨓⨔⨕⨖⨗⨘⨙⨚⨛⨜⨝⨞⨟"
+        self.tokenizer = AnchorTokenizer("⟦", "⟧", self.AS, self.AE)
+        self.response_parser = GroupResponseParser(self.GS, self.GE, self.BLOCK_DELIMS, self.tokenizer.anchor_re)
+        # 不解析外部实体、不访问网络
+        self._xml_check_parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
 
     def get_block_delimiters(self, index):
         char = self.BLOCK_DELIMS[index % len(self.BLOCK_DELIMS)]
         return char, char
 
+    @property
+    def temp_dir(self):
+        """解压模式下的临时目录，归档模式下为 None"""
+        return self.archive.root_dir
+
+    @temp_dir.setter
+    def temp_dir(self, path):
+        self.archive.use_directory(path)
+
+    def open_epub(self, epub_path, callback=None):
+        """归档模式：直接从 zip 读取内容文件，不解压到磁盘"""
+        if callback: callback("正在读取 EPUB 文件...")
+        self.archive.open(epub_path)
+
     def extract_epub(self, epub_path, callback=None):
-        """将 EPUB 完整解压到临时目录"""
+        """解压模式：将 EPUB 完整解压到临时目录"""
         if callback: callback("正在解压 EPUB 文件...")
-        self.temp_dir = tempfile.mkdtemp(prefix="epub_trans_")
-        with zipfile.ZipFile(epub_path, 'r') as zip_ref:
-            zip_ref.extractall(self.temp_dir)
-        return self.temp_dir
+        return self.archive.extract(epub_path, prefix="epub_trans_")
 
     def get_xhtml_files(self):
-        """遍历并返回需要翻译的 XHTML/HTML 文件路径，简单跳过结构性技术文件"""
+        """
+        返回需要翻译的 XHTML 部件路径（相对包根目录），按阅读顺序：
+        先是 OPF spine 中的内容文档，再是 manifest 中未列入 spine 的 XHTML（如脚注页）；
+        EPUB 3 导航文档 (properties="nav") 与 NCX 不翻译。
+        container.xml 或 OPF 缺失、无法解析，或 manifest 中没有一个存在的 XHTML 时退回按文件名扫描。
+        """
+        try:
+            spine_files = self._spine_xhtml_files()
+        except (KeyError, OSError, ValueError, etree.XMLSyntaxError) as e:
+            print(f"WARNING: Failed to read OPF spine, falling back to file scan: {e}")
+            spine_files = None
+        if spine_files == []:
+            # href 全部失效或只列出非 XHTML 项，按 OPF 会提取不到任何块
+            print("WARNING: OPF lists no existing XHTML documents, falling back to file scan")
+            spine_files = None
+        if spine_files is None:
+            return self._scan_xhtml_files()
+        return spine_files
+
+    def _spine_xhtml_files(self):
+        """按 container.xml -> OPF 的 spine 与 manifest 解析内容文档，找不到 OPF 时返回 None"""
+        if not self.archive.has_part(self._part_path(self.CONTAINER_PATH)):
+            return None
+        container = etree.fromstring(self.archive.read_bytes(self._part_path(self.CONTAINER_PATH)), self._xml_check_parser)
+        rootfile = container.find('.//{*}rootfile')
+        opf_path = rootfile.get('full-path') if rootfile is not None else None
+        if not opf_path or not self.archive.has_part(self._part_path(opf_path)):
+            return None
+        opf = etree.fromstring(self.archive.read_bytes(self._part_path(opf_path)), self._xml_check_parser)
+        base = posixpath.dirname(opf_path)
+
+        manifest = {}
+        documents = []
+        for item in opf.iterfind('{*}manifest/{*}item'):
+            href = item.get('href')
+            if not href:
+                continue
+            path = posixpath.normpath(posixpath.join(base, unquote(href.split('#')[0])))
+            is_xhtml = (item.get('media-type') in self.XHTML_MEDIA_TYPES
+                        or path.lower().endswith(('.xhtml', '.html', '.htm')))
+            is_nav = 'nav' in (item.get('properties') or '').split()
+            manifest[item.get('id')] = path
+            if is_xhtml and not is_nav:
+                documents.append(path)
+        allowed = set(documents)
+
+        ordered = []
+        for itemref in opf.iterfind('{*}spine/{*}itemref'):
+            path = manifest.get(itemref.get('idref'))
+            if path in allowed:
+                ordered.append(path)
+        # 未列入 spine 的内容文档（EPUB 2 中常见的脚注、附录页）排在最后
+        ordered.extend(documents)
+
+        result = []
+        seen = set()
+        for path in ordered:
+            if path in seen:
+                continue
+            seen.add(path)
+            if self.archive.has_part(self._part_path(path)):
+                result.append(self._part_path(path))
+        return result
+
+    def _part_path(self, posix_path):
+        """OPF 中的路径（正斜杠）转为部件路径：解压模式下使用系统分隔符"""
+        return posix_path.replace('/', os.sep) if self.archive.root_dir else posix_path
+
+    @classmethod
+    def has_text(cls, data):
+        """
+        字节级快速检查：去掉 head、注释、脚本、样式、标签与不换行空格实体后是否还有非空白字符。
+        只含图片的封面、插图页返回 False，不必解析。判断偏保守，拿不准时返回 True。
+        """
+        return cls._VISIBLE_TEXT_RE.search(cls._NON_TEXT_RE.sub(b'', data)) is not None
+
+    def _scan_xhtml_files(self):
+        """没有可用的 OPF 时按文件名扫描，简单跳过结构性技术文件"""
         xhtml_files = []
         # 简单过滤：仅通过文件名跳过明确的结构性文件
         skip_patterns = ['titlepage', 'title_page', 'cover', 'nav', 'toc', 'container.xml']
         
-        for root, dirs, files in os.walk(self.temp_dir):
-            for file in files:
-                lower_name = file.lower()
-                if lower_name.endswith(('.xhtml', '.html', '.htm')):
-                    if any(p in lower_name for p in skip_patterns):
-                        continue
-                    xhtml_files.append(os.path.join(root, file))
+        for rel_path in self.archive.list_parts():
+            lower_name = os.path.basename(rel_path).lower()
+            if lower_name.endswith(('.xhtml', '.html', '.htm')):
+                if any(p in lower_name for p in skip_patterns):
+                    continue
+                xhtml_files.append(rel_path)
         return xhtml_files
 
+    def read_part(self, rel_path):
+        return self.archive.read_part(rel_path)
+
+    def write_part(self, rel_path, markup):
+        self.archive.write_part(rel_path, markup)
+
+    def parse_markup(self, markup, backend=None):
+        """
+        解析 XHTML 文件内容，两种后端得到相同的文档树与序列化结果。
+        lxml 后端用 lxml.etree 只解析一次，再按 html.parser 的约定构造 soup：
+        标签名与属性名小写、带前缀的名字保留为 "svg:svg"、非空元素标签写出闭合标签。
+        不是格式良好 XML（如含未声明的 &nbsp;）或含 lxml 无法原样还原的内容时，
+        以及 html.parser 后端，使用纯 Python 的 html.parser。
+        """
+        backend = backend or self.parser_backend
+        if backend == "lxml":
+            soup = self._parse_xml_as_html(markup)
+            if soup is not None:
+                return soup
+        return BeautifulSoup(markup, 'html.parser')
+
+    def _parse_xml_as_html(self, markup):
+        """lxml 后端：解析失败或遇到无法与 html.parser 结果保持一致的内容时返回 None"""
+        text = markup.decode('utf-8') if isinstance(markup, bytes) else markup
+        # XML 解析会规范化换行并去掉 CDATA 标记，这类文件交给 html.parser 以保持原样
+        if '\r' in text or '<![CDATA[' in text:
+            return None
+        start = self._root_start(text)
+        if start is None:
+            return None
+        try:
+            root = etree.fromstring(text.encode('utf-8'), self._xml_check_parser)
+        except (etree.XMLSyntaxError, ValueError):
+            return None
+        # 根元素之后只能有注释、处理指令与空白，最后一个结束标签即根元素的结束标签
+        end = text.rfind('</')
+        if end < start:
+            return None
+        end = text.find('>', end) + 1
+
+        soup = BeautifulSoup('', 'html.parser')
+        # 根元素前后的声明、注释与空白很短，直接用 html.parser 解析以保持原样
+        for node in list(BeautifulSoup(text[:start], 'html.parser').contents):
+            soup.append(node.extract())
+        try:
+            soup.append(self._html_tag(soup, root, None))
+        except ValueError:
+            return None
+        for node in list(BeautifulSoup(text[end:], 'html.parser').contents):
+            soup.append(node.extract())
+        return soup
+
+    @staticmethod
+    def _root_start(text):
+        """根元素开始标签的位置：跳过 XML 声明、处理指令、注释与 DOCTYPE（含内部子集）"""
+        pos = 0
+        while True:
+            pos = text.find('<', pos)
+            if pos < 0:
+                return None
+            if text.startswith('<?', pos):
+                pos = text.find('?>', pos) + 2
+            elif text.startswith('<!--', pos):
+                pos = text.find('-->', pos) + 3
+            elif text.startswith('<!', pos):
+                close = text.find('>', pos)
+                subset = text.find('[', pos)
+                if 0 <= subset < close:
+                    close = text.find('>', text.find(']', subset))
+                pos = close + 1
+            else:
+                return pos
+            if pos <= 0:
+                return None
+
+    def _html_tag(self, soup, element, parent_nsmap):
+        """把 lxml 元素（含子树）转为 html.parser 约定的 bs4 Tag；遇到无法原样还原的节点抛出 ValueError"""
+        new_tag = soup.new_tag(self._qualified_name(element.tag, element.prefix), attrs=self._html_attrs(element, parent_nsmap))
+        # script/style 在 html.parser 中是原样保留的文本，实体解码后无法还原
+        raw_text = new_tag.name in ('script', 'style')
+        if element.text:
+            if raw_text and any(c in element.text for c in '&<>'):
+                raise ValueError(new_tag.name)
+            new_tag.append(soup.new_string(element.text))
+        nsmap = element.nsmap
+        for child in element:
+            if isinstance(child, etree._Comment):
+                new_tag.append(soup.new_string(child.text or "", Comment))
+            elif isinstance(child, etree._Element) and not isinstance(child, (etree._ProcessingInstruction, etree._Entity)):
+                new_tag.append(self._html_tag(soup, child, nsmap))
+            else:
+                raise ValueError(type(child).__name__)
+            if child.tail:
+                new_tag.append(soup.new_string(child.tail))
+        return new_tag
+
+    @staticmethod
+    def _qualified_name(tag, prefix):
+        local = tag.rpartition('}')[2]
+        return (f"{prefix}:{local}" if prefix else local).lower()
+
+    def _html_attrs(self, element, parent_nsmap):
+        """新声明的命名空间写回 xmlns 属性（排在前面），属性名恢复前缀并小写"""
+        attrs = {}
+        nsmap = element.nsmap
+        for prefix, uri in nsmap.items():
+            if parent_nsmap is None or parent_nsmap.get(prefix) != uri:
+                attrs[f"xmlns:{prefix}" if prefix else "xmlns"] = uri
+        if element.attrib:
+            prefixes = {uri: prefix for prefix, uri in nsmap.items() if prefix}
+            prefixes[self.XML_NAMESPACE] = 'xml'
+            for name, value in element.attrib.items():
+                if name.startswith('{'):
+                    uri, _, local = name[1:].partition('}')
+                    name = f"{prefixes[uri]}:{local}"
+                attrs[name.lower()] = value
+        return attrs
+
     def extract_block_with_local_ids(self, element):
         """
         核心逻辑：提取块内容，将所有 HTML 标签转化为带编号的锚点。
@@ -115,29 +345,27 @@ class EPubAnchorProcessor:
         return full_text, format_tags
 
     def create_blocks_from_soup(self, soup):
-        """从 BeautifulSoup 对象中识别翻译块"""
+        """
+        从 BeautifulSoup 对象中识别翻译块。
+        按文档顺序遍历一次，每个节点的直接子节点只检查一次，整体与节点数成线性关系。
+        """
         blocks = []
-        # 极大扩展可翻译标签
-        translatable_tags = [
-            'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 
-            'li', 'td', 'th', 'caption', 'figcaption', 
-            'blockquote', 'dt', 'dd', 'cite', 'footer', 'aside',
-            'div', 'section', 'article' # 只有其直接包含文本时才处理
-        ]
-        
-        # 寻找所有可能的元素
-        all_elements = soup.find_all(translatable_tags)
+        translatable_tags = self.TRANSLATABLE_TAGS
         
-        for element in all_elements:
+        for element in soup.descendants:
+            if not isinstance(element, Tag) or element.name not in translatable_tags:
+                continue
             # 策略：如果一个元素包含其他也在 translatable_tags 里的子元素，
             # 只有当它本身有“直接”的非空白文本时，才处理它。
-            has_translatable_child = any(child.name in translatable_tags for child in element.find_all(translatable_tags, recursive=False))
-            
-            if has_translatable_child:
-                # 检查是否有直接文本
-                direct_text = "".join([t for t in element.find_all(string=True, recursive=False) if t.strip()])
-                if not direct_text:
-                    continue
+            has_translatable_child = False
+            has_direct_text = False
+            for child in element.children:
+                if isinstance(child, NavigableString):
+                    has_direct_text = has_direct_text or bool(child.strip())
+                elif child.name in translatable_tags:
+                    has_translatable_child = True
+            if has_translatable_child and not has_direct_text:
+                continue
             
             # 不再跳过 text_content 为空的块 (如 <p>&nbsp;</p>)，以保持对齐
             text, formats = self.extract_block_with_local_ids(element)
@@ -159,141 +387,74 @@ class EPubAnchorProcessor:
         return "\n".join(lines)
     def validate_and_parse_response(self, response_text, original_group):
         """
-        校验 AI 响应的结构并解析。根据序列分隔符提取。
+        校验 AI 响应的结构并解析。按分隔符顺序单遍匹配，返回 (译文列表, 是否通过)。
         """
-        pattern = re.escape(self.GS) + r'([\s\S]*)' + re.escape(self.GE)
-        group_match = re.search(pattern, response_text)
-        if not group_match:
-            return None, False
-        
-        content = group_match.group(1).strip()
-        translated_texts = []
-        
-        # 按顺序寻找分隔符
-        for i in range(len(original_group)):
-            ds, de = self.get_block_delimiters(i)
-            # 构造正则匹配此块。注意分隔符本身是稀有的，直接匹配即可
-            block_pattern = re.escape(ds) + r'(.*?)' + re.escape(de)
-            match = re.search(block_pattern, content, re.DOTALL)
-            if match:
-                translated_texts.append(match.group(1).strip())
-            else:
-                return None, False
-        
-        if len(translated_texts) != len(original_group):
-            return None, False
-                
-        return translated_texts, True
+        texts, _ = self.response_parser.parse(response_text, len(original_group))
+        return texts, texts is not None
+
+    def validate_response(self, response_text, original_group):
+        """
+        同 validate_and_parse_response，另检查各块是否保留了原文的全部锚点，
+        失败时返回具体出错的块与原因：(译文列表, 错误)
+        """
+        return self.response_parser.parse(response_text, len(original_group), self.response_parser.anchor_counts(original_group))
 
+    def salvage_response(self, response_text, original_group):
+        """从结构校验失败的响应中取回能解析的块，无法解析或丢失锚点的块为 None"""
+        return self.response_parser.salvage(response_text, len(original_group), self.response_parser.anchor_counts(original_group))
 
     def restore_html(self, original_block, translated_text, soup):
         """将翻译后的带锚点文本还原为 HTML 元素"""
-        format_map = {int(re.search(r'(\d+)', f['id']).group(1)): f for f in original_block['formats']}
-        TS, TE = "⟦", "⟧"
+        format_map = self.tokenizer.format_map(original_block['formats'])
         
-        def parse_to_nodes(text):
+        def build_nodes(tokens):
             nodes = []
-            i = 0
-            while i < len(text):
-                if text[i] == TS:
-                    # 找到对应的 TE 和后的锚点
-                    start_idx = i
-                    level = 1
-                    j = i + 1
-                    while j < len(text) and level > 0:
-                        if text[j] == TS: level += 1
-                        elif text[j] == TE: level -= 1
-                        j += 1
-                    
-                    if level == 0:
-                        inner_text = text[start_idx+1:j-1]
-                        # 检查后面是否有 ⦗n⦘
-                        anchor_tail = text[j:]
-                        match = re.match(re.escape(self.AS) + r'(\d+)' + re.escape(self.AE), anchor_tail)
-                        if match:
-                            anchor_num = int(match.group(1))
-                            if anchor_num in format_map:
-                                fmt = format_map[anchor_num]
-                                new_tag = soup.new_tag(fmt['tag'])
-                                for k, v in fmt['attrs'].items():
-                                    new_tag[k] = v
-                                for child in parse_to_nodes(inner_text):
-                                    new_tag.append(child)
-                                nodes.append(new_tag)
-                                i = j + match.end()
-                                continue
-                
-                match_solo = re.match(re.escape(self.AS) + r'(\d+)' + re.escape(self.AE), text[i:])
-                if match_solo:
-                    anchor_num = int(match_solo.group(1))
-                    if anchor_num in format_map:
-                        fmt = format_map[anchor_num]
-                        if fmt.get('type') == 'monolithic':
-                            new_node = BeautifulSoup(fmt['raw_html'], 'html.parser').contents[0]
-                            import copy
-                            nodes.append(copy.copy(new_node))
-                        else:
-                            # 独立容器（如空标签或 br）
-                            new_tag = soup.new_tag(fmt['tag'])
-                            for k, v in fmt['attrs'].items():
-                                new_tag[k] = v
-                            nodes.append(new_tag)
-                        i += match_solo.end()
-                        continue
-                
-                nodes.append(soup.new_string(text[i]))
-                i += 1
+            for token in tokens:
+                if isinstance(token, str):
+                    nodes.append(soup.new_string(token))
+                    continue
+                fmt = format_map[token[1]]
+                if token[0] == "container":
+                    new_tag = soup.new_tag(fmt['tag'])
+                    for k, v in fmt['attrs'].items():
+                        new_tag[k] = v
+                    for child in build_nodes(token[2]):
+                        new_tag.append(child)
+                    nodes.append(new_tag)
+                elif fmt.get('type') == 'monolithic':
+                    nodes.append(copy.copy(BeautifulSoup(fmt['raw_html'], 'html.parser').contents[0]))
+                else:
+                    # 独立容器（如空标签或 br）
+                    new_tag = soup.new_tag(fmt['tag'])
+                    for k, v in fmt['attrs'].items():
+                        new_tag[k] = v
+                    nodes.append(new_tag)
             return nodes
 
-        # 优化：合并连续的字符串节点
-        def finalize_nodes(nodes):
-            if not nodes: return []
-            result = []
-            curr_str = ""
-            for n in nodes:
-                if isinstance(n, str) or (hasattr(n, 'name') and n.name is None):
-                    curr_str += str(n)
-                else:
-                    if curr_str:
-                        result.append(soup.new_string(curr_str))
-                        curr_str = ""
-                    result.append(n)
-            if curr_str:
-                result.append(soup.new_string(curr_str))
-            return result
-
-        new_nodes = finalize_nodes(parse_to_nodes(translated_text))
+        new_nodes = build_nodes(self.tokenizer.parse(translated_text, format_map))
         original_block['element'].clear()
         for node in new_nodes:
             original_block['element'].append(node)
 
+    def restore_document(self, markup, translations, backend=None):
+        """
+        还原单个 XHTML 文件。translations 与文件内的块一一对应，None 表示保留原文。
+        backend 必须与提取时一致，否则块的识别结果可能不同。
+        返回 (还原后的文本, 文件中识别到的块数)；块数不一致时不做修改，文本返回 None。
+        """
+        soup = self.parse_markup(markup, backend)
+        soup_blocks = self.create_blocks_from_soup(soup)
+        if len(soup_blocks) != len(translations):
+            return None, len(soup_blocks)
+        for block, text in zip(soup_blocks, translations):
+            if text is not None:
+                self.restore_html(block, text, soup)
+        return str(soup), len(soup_blocks)
+
     def repack_epub(self, output_path):
-        """原封不动打包临时目录，并优化兼容性（mimetype不压缩，强制正斜杠）"""
-        if not self.temp_dir or not os.path.exists(self.temp_dir):
-            raise ValueError("没有可打包的临时目录")
-            
-        with zipfile.ZipFile(output_path, 'w') as zipf:
-            # 1. 必须先写入 mimetype 且不压缩 (EPUB 标准)
-            mimetype_path = os.path.join(self.temp_dir, 'mimetype')
-            if os.path.exists(mimetype_path):
-                # 显式指定 arcname 为 "mimetype"，确保没有路径前缀
-                zipf.write(mimetype_path, 'mimetype', compress_type=zipfile.ZIP_STORED)
-            
-            # 2. 写入其余文件
-            for root, dirs, files in os.walk(self.temp_dir):
-                for file in files:
-                    if file == 'mimetype' and root == self.temp_dir:
-                        continue
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, self.temp_dir)
-                    
-                    # 关键修复：强制使用正斜杠 (/)，即使在 Windows 上
-                    # 这是 EPUB/ZIP 标准所要求的，否则在某些阅读器上会找不到文件（如封面）
-                    zip_path = rel_path.replace(os.sep, '/')
-                    
-                    zipf.write(full_path, zip_path, compress_type=zipfile.ZIP_DEFLATED)
+        """重新打包，并优化兼容性（mimetype 置首且不压缩，强制正斜杠）"""
+        self.archive.repack(output_path, stored_first='mimetype')
                     
     def cleanup(self):
-        """清理临时目录"""
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        """关闭归档并清理临时目录"""
+        self.archive.cleanup()
@@ -0,0 +1,70 @@
+import os
+import json
+import threading
+
+class GroupStats:
+    """
+    记录每个模型的分组校验失败率（指数滑动平均），持久化到缓存目录下的 group_stats.json。
+    失败率超过 TARGET_FAILURE_RATE 时按 scale() 缩小之后初始化的分组大小，
+    使较弱的模型不必手动“清除缓存”重新分块。cache_dir 为 None 时只在内存中记录。
+    """
+
+    FILE_NAME = "group_stats.json"
+    # 滑动平均的权重，约等于只看最近 1 / ALPHA 个分组
+    ALPHA = 0.05
+    # 样本数不足时不调整
+    MIN_SAMPLES = 20
+    TARGET_FAILURE_RATE = 0.05
+    MIN_SCALE = 0.25
+
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, self.FILE_NAME) if cache_dir else None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.data = self._load()
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"WARNING: Failed to load group stats: {e}")
+        return {}
+
+    def record(self, model, ok):
+        """记录一次分组请求的校验结果（截断视为失败）"""
+        with self._lock:
+            entry = self.data.setdefault(model, {"samples": 0, "failure_rate": 0.0})
+            entry["samples"] += 1
+            # 样本较少时用算术平均，避免前几个分组的结果权重过大
+            alpha = max(self.ALPHA, 1.0 / entry["samples"])
+            entry["failure_rate"] += alpha * ((0.0 if ok else 1.0) - entry["failure_rate"])
+            self._dirty = True
+
+    def failure_rate(self, model):
+        with self._lock:
+            entry = self.data.get(model)
+            if not entry or entry["samples"] < self.MIN_SAMPLES:
+                return None
+            return entry["failure_rate"]
+
+    def scale(self, model):
+        """分组大小的缩放系数 (MIN_SCALE, 1]：失败率越高分组越小，从不超过用户设置"""
+        rate = self.failure_rate(model)
+        if rate is None or rate <= self.TARGET_FAILURE_RATE:
+            return 1.0
+        return max(self.MIN_SCALE, (self.TARGET_FAILURE_RATE / rate) ** 0.5)
+
+    def save(self):
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                print(f"WARNING: Failed to save group stats: {e}")
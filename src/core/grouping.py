@@ -0,0 +1,160 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+class TokenCounter:
+    """
+    Token 计数器。安装了 tiktoken 且编码表可用时精确计数（按模型选择编码，未知模型用 cl100k_base），
+    否则使用离线估算：CJK 字符约 1 token，ASCII 文本约 4 字符 1 token，
+    ⦗n⦘ 锚点约 3 token，其余稀有符号（块分隔符、⟦ ⟧ 等）约 2 token。
+    """
+
+    ANCHOR_TOKENS = 3
+    SYMBOL_TOKENS = 2
+
+    _anchor_re = re.compile(r'⦗\d+⦘')
+    _cjk_re = re.compile(r'[　-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]')
+    _ascii_re = re.compile(r'[\x00-\x7f]')
+
+    def __init__(self, model=None):
+        self.encoding = None
+        self.name = "estimate"
+        if tiktoken is None:
+            return
+        try:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+            self.name = f"tiktoken:{self.encoding.name}"
+        except Exception as e:
+            # 编码表需要首次下载，离线环境下回退到估算
+            print(f"WARNING: tiktoken unavailable ({e}), falling back to estimated token counts.")
+            self.encoding = None
+
+    @property
+    def exact(self):
+        """是否按模型编码精确计数（否则为估算值）"""
+        return self.encoding is not None
+
+    def describe(self):
+        """供界面/命令行日志说明当前使用的计数方式"""
+        if self.exact:
+            return f"Token 计数：{self.name}（精确）"
+        return "Token 计数：离线估算（未安装 tiktoken 或编码表不可用），分组预算为近似值"
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return self.estimate(text)
+
+    @classmethod
+    def estimate(cls, text):
+        anchors = cls._anchor_re.findall(text)
+        rest = cls._anchor_re.sub('', text)
+        cjk = len(cls._cjk_re.findall(rest))
+        ascii_chars = len(cls._ascii_re.findall(rest))
+        symbols = len(rest) - cjk - ascii_chars
+        ascii_tokens = (ascii_chars + 3) // 4
+        return len(anchors) * cls.ANCHOR_TOKENS + cjk + ascii_tokens + symbols * cls.SYMBOL_TOKENS
+
+
+class CharGrouper:
+    """按字符数贪心分组（原有行为）"""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+
+    def measure(self, block):
+        return block['size']
+
+    def budget(self):
+        return self.max_chars
+
+    def group(self, indices, all_blocks):
+        """按顺序贪心装箱；超出上限的单个块独占一组"""
+        limit = self.budget()
+        groups = []
+        current_group = []
+        current_size = 0
+        for i in indices:
+            size = self.measure(all_blocks[i])
+            if current_size + size > limit and current_group:
+                groups.append(current_group)
+                current_group = []
+                current_size = 0
+            current_group.append(i)
+            current_size += size
+        if current_group:
+            groups.append(current_group)
+        return groups
+
+    def describe(self):
+        """写入缓存的分组参数"""
+        return {"mode": "chars", "max_chars": self.max_chars}
+
+
+class TokenGrouper(CharGrouper):
+    """
+    按 token 预算分组。每次请求的消耗为：
+        提示词 + context_rounds 轮历史（每轮约 原文 + 译文）+ 本组原文 + 本组译文
+    其中译文按 output_ratio 倍原文估算。分组目标为以下两者较小值的 fill 比例：
+      - 上下文窗口约束: (context_tokens - prompt_tokens) / ((1 + output_ratio) * (1 + context_rounds))
+      - 输出长度约束:   max_output_tokens / output_ratio
+    """
+
+    # 每个块两侧的分隔符与换行
+    BLOCK_OVERHEAD = 3
+
+    def __init__(self, counter, context_tokens, max_output_tokens, prompt="", context_rounds=1,
+                 output_ratio=1.3, fill=0.9):
+        self.counter = counter
+        self.context_tokens = context_tokens
+        self.max_output_tokens = max_output_tokens
+        self.prompt_tokens = counter.count(prompt) if prompt else 0
+        self.context_rounds = context_rounds
+        self.output_ratio = output_ratio
+        self.fill = fill
+
+    def measure(self, block):
+        return self.counter.count(block['text']) + self.BLOCK_OVERHEAD
+
+    def budget(self):
+        by_context = (self.context_tokens - self.prompt_tokens) / ((1 + self.output_ratio) * (1 + self.context_rounds))
+        by_output = self.max_output_tokens / self.output_ratio
+        return max(1, int(min(by_context, by_output) * self.fill))
+
+    def describe(self):
+        return {
+            "mode": "tokens",
+            "target_tokens": self.budget(),
+            "tokenizer": self.counter.name,
+            "context_tokens": self.context_tokens,
+            "max_output_tokens": self.max_output_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "context_rounds": self.context_rounds,
+            "output_ratio": self.output_ratio,
+            "fill": self.fill,
+        }
+
+
+def build_grouper(settings, stats=None):
+    """
+    根据界面/命令行的设置字典构建分组器。
+    传入 GroupStats 时按该模型的历史校验失败率缩小分组（见 GroupStats.scale）。
+    """
+    scale = stats.scale(settings['model']) if stats else 1.0
+    if not settings.get('token_grouping'):
+        return CharGrouper(max(1, int(settings['chunk_size'] * scale)))
+    return TokenGrouper(
+        TokenCounter(settings['model']),
+        settings['context_tokens'],
+        settings['max_output_tokens'],
+        prompt=settings['prompt'],
+        context_rounds=settings['context_rounds'],
+        fill=0.9 * scale,
+    )
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+
+
+class _NullSpan:
+    """关闭统计时 span() 返回的共享空对象，不计时、不加锁"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, name, value=1):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, metrics, stage, counters):
+        self.metrics = metrics
+        self.stage = stage
+        self.counters = counters
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, time.perf_counter() - self.start, **self.counters)
+        return False
+
+    def add(self, name, value=1):
+        """在阶段内补充计数（如解析完成后才知道的块数）"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+class Metrics:
+    """
+    进程内的阶段计时与计数，默认关闭。
+      - span(stage, **计数)：with 块计时，一次调用记为该阶段的一次执行
+      - record(stage, 秒数, **计数)：记录在别处（如进程池）测得的耗时
+      - count(name, 数量)：与阶段无关的事件计数（如重试）
+    关闭时 span() 只做一次布尔判断并返回共享的空对象，record / count 直接返回。
+    结果可导出为 JSON 运行报告，或 node exporter textfile collector 可读取的 Prometheus 文本。
+    """
+
+    PROM_PREFIX = "epub_translator"
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._events = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._events = {}
+
+    def span(self, stage, **counters):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, counters)
+
+    def record(self, stage, seconds, **counters):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "counters": {}}
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            totals = entry["counters"]
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._events[name] = self._events.get(name, 0) + value
+
+    def report(self):
+        """{"stages": {阶段: {calls, seconds, max_seconds, counters}}, "events": {事件: 次数}}"""
+        with self._lock:
+            stages = {stage: {"calls": e["calls"], "seconds": round(e["seconds"], 6),
+                              "max_seconds": round(e["max_seconds"], 6), "counters": dict(e["counters"])}
+                      for stage, e in self._stages.items()}
+            return {"stages": stages, "events": dict(self._events)}
+
+    def write_json(self, path, extra=None):
+        """写出 JSON 运行报告，extra 中的字段（如书名、总耗时）合并到顶层"""
+        data = dict(extra or {})
+        data.update(self.report())
+        self._atomic_write(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+    def prometheus_text(self, labels=None):
+        """Prometheus 文本格式；labels 为附加到每条样本上的固定标签（如 {"book": ...}）"""
+        report = self.report()
+        prefix = self.PROM_PREFIX
+        base = "".join(f',{k}="{self._escape(v)}"' for k, v in (labels or {}).items())
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for label_str, value in samples:
+                lines.append(f"{prefix}_{name}{{{label_str}{base}}} {value}")
+
+        stages = sorted(report["stages"].items())
+        metric("stage_seconds_total", "counter", "Total wall time spent in each stage.",
+               [(f'stage="{s}"', f"{e['seconds']:.6f}") for s, e in stages])
+        metric("stage_calls_total", "counter", "Number of times each stage ran.",
+               [(f'stage="{s}"', e["calls"]) for s, e in stages])
+        metric("stage_max_seconds", "gauge", "Longest single run of each stage.",
+               [(f'stage="{s}"', f"{e['max_seconds']:.6f}") for s, e in stages])
+        metric("stage_items_total", "counter", "Items processed by each stage (bytes, blocks, tokens...).",
+               [(f'stage="{s}",item="{k}"', v) for s, e in stages for k, v in sorted(e["counters"].items())])
+        metric("events_total", "counter", "Counted events such as request retries.",
+               [(f'event="{k}"', v) for k, v in sorted(report["events"].items())])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, labels=None):
+        # textfile collector 可能随时读取，必须整体替换
+        self._atomic_write(path, self.prometheus_text(labels))
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @staticmethod
+    def _atomic_write(path, text):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+# 进程内共享的统计实例
+metrics = Metrics()
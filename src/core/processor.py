@@ -1,31 +1,258 @@
 import os
 import json
+import bisect
+import difflib
+import hashlib
 import shutil
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from src.core.epub_anchor_processor import EPubAnchorProcessor
 from src.core.docx_anchor_processor import DocxAnchorProcessor
+from src.core.cache_journal import CacheJournal
+from src.core.translation_memory import TranslationMemory
+from src.core.grouping import CharGrouper, TokenCounter
+from src.core.request_scheduler import TranslationError
+from src.core.translator import OutputTruncated
+from src.core.group_stats import GroupStats
+from src.core.metrics import metrics
 from bs4 import BeautifulSoup
 
+def _restore_file_task(source_type, backend, rel_path, markup, translations):
+    """进程池任务：在子进程中还原单个文件（模块级函数以便 pickle）"""
+    start = time.perf_counter()
+    if source_type == "docx_anchor":
+        anchor_processor = DocxAnchorProcessor()
+    else:
+        anchor_processor = EPubAnchorProcessor()
+    new_markup, found = anchor_processor.restore_document(markup, translations, backend)
+    return rel_path, new_markup, found, time.perf_counter() - start
+
 class Processor:
-    def __init__(self, cache_dir):
+    # 日志累计多少条分组记录后压缩回完整缓存
+    JOURNAL_COMPACT_EVERY = 200
+    # 随每条日志记录的全局状态字段
+    JOURNAL_STATE_KEYS = ("current_flat_idx", "usage_stats", "memory_stats")
+    # 源文件访问方式："archive" 直接从 zip 读取内容部件，"extract" 完整解压到临时目录
+    STORAGE_MODES = ("archive", "extract")
+    # 缓存格式版本：2 起 all_blocks 只保存文本与锚点数，不再保存完整的 formats；
+    # 3 起以 file_ranges（每个文件的块索引范围）代替逐块的 block_to_file
+    CACHE_VERSION = 3
+    # 结构校验失败时，只重新请求失败块的最大轮数
+    SALVAGE_ROUNDS = 2
+    # 校验失败的分组在译文前加的标记，导出时移除
+    VALIDATION_ERROR_PREFIX = "【结构校验失败，请手动检查】\n"
+
+    def __init__(self, cache_dir, parser_backend="lxml", storage="archive", group_stats=None):
         self.cache_dir = cache_dir
+        self.storage = storage
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir)
+        # 各模型的分组校验失败率，多个 Processor 可共用同一实例
+        self.group_stats = group_stats or GroupStats(cache_dir)
         self.status = "idle" # idle, running, stopped
-        self.epub_anchor_processor = EPubAnchorProcessor()
+        self._active_translator = None
+        # 保护 cached_data 的写入与序列化（并发分组、界面手动修改），可在持有时写日志或压缩
+        self._cache_lock = threading.RLock()
+        # 运行中的 (缓存文件名, 内存中的缓存数据)，手动修改同时写入这份副本
+        self._active_cache = None
+        self._journal_counts = {}
+        # 各缓存文件当前的 journal_generation，日志记录据此标明所依据的完整缓存
+        self._journal_generations = {}
+        # 最近一次导出中每个文件的还原耗时 [(相对路径, 秒, 块数)]
+        self.last_restore_timings = []
+        self.epub_anchor_processor = EPubAnchorProcessor(parser_backend=parser_backend)
         self.docx_anchor_processor = DocxAnchorProcessor()
 
     def save_cache(self, filename, data):
+        """
+        完整写出缓存（同时作为日志压缩），先写临时文件再原子替换。
+        每次写出递增 journal_generation：替换之后、清空日志之前崩溃时，
+        残留日志记录的是上一代缓存的分组编号（可能已被拆分改变），重放时按代跳过。
+        """
         path = os.path.join(self.cache_dir, filename)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        tmp_path = path + ".tmp"
+        data["journal_generation"] = data.get("journal_generation", 0) + 1
+        with metrics.span("save_cache") as span:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                span.add("bytes", f.tell())
+            os.replace(tmp_path, path)
+        # 完整缓存已包含日志中的全部修改
+        self.get_journal(filename).clear()
+        self._journal_counts[filename] = 0
+        self._journal_generations[filename] = data["journal_generation"]
 
     def load_cache(self, filename):
+        """
+        读取缓存并重放日志。上次运行留下的拆分（chunk["split"]）在此写成独立分组，
+        界面与 target_indices 拿到的分组编号始终是拆分之后的；该缓存正在运行时不改动编号。
+        """
         path = os.path.join(self.cache_dir, filename)
         if os.path.exists(path):
             with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
+            generation = data.get("journal_generation", 0)
+            self._journal_generations[filename] = generation
+            # 重放上次中断前追加的分组结果
+            self._journal_counts[filename] = self.get_journal(filename).replay(data, generation)
+            # 旧格式缓存迁移后立即写回，之后的加载不再解析 formats
+            changed = self.migrate_cache(data)
+            with self._cache_lock:
+                if not (self._active_cache and self._active_cache[0] == filename):
+                    changed = self._apply_splits(data) or changed
+                if changed:
+                    self.save_cache(filename, data)
+            return data
+        return None
+
+    @staticmethod
+    def compact_block(block):
+        """
+        缓存中保存的块元数据：只保留文本与锚点数。
+        formats（含 DOCX 每个 w:r 的 raw_xml、EPUB math/svg 的 raw_html）在导出时
+        由 restore_document 从原文件重新提取，锚点编号固定为 1..anchors；
+        校验译文时据此拒绝丢失锚点的块（见 GroupResponseParser）。
+        """
+        return {"text": block['text'], "anchors": len(block['formats'])}
+
+    def migrate_cache(self, data):
+        """将旧格式缓存（all_blocks 带 formats、逐块的 block_to_file）就地转换为当前格式，返回是否有改动"""
+        if data.get("cache_version", 1) >= self.CACHE_VERSION:
+            return False
+        data["all_blocks"] = [self.compact_block(b) if "formats" in b else b for b in data.get("all_blocks", [])]
+        if "block_to_file" in data:
+            # 同一文件的块在提取时是连续编号的，按索引顺序合并为范围
+            files_info = []
+            for b_idx, rel_path in sorted((int(k), v) for k, v in data.pop("block_to_file").items()):
+                if files_info and files_info[-1]["rel_path"] == rel_path and files_info[-1]["block_range"][1] == b_idx:
+                    files_info[-1]["block_range"][1] = b_idx + 1
+                else:
+                    files_info.append({"rel_path": rel_path, "block_range": [b_idx, b_idx + 1]})
+            data["file_ranges"] = files_info
+        data["cache_version"] = self.CACHE_VERSION
+        return True
+
+    @staticmethod
+    def file_ranges(files_info):
+        """缓存中保存的文件块范围：[{"rel_path", "block_range": [start, end)}]，按 start 升序"""
+        return [{"rel_path": f["rel_path"], "block_range": list(f["block_range"])} for f in files_info]
+
+    @staticmethod
+    def file_index(cache_data):
+        """file_of_block 的查找表 (各文件的起始块索引, file_ranges)，同一份缓存数据只需构建一次"""
+        ranges = cache_data.get("file_ranges", [])
+        return [f["block_range"][0] for f in ranges], ranges
+
+    @staticmethod
+    def file_of_block(cache_data, b_idx, index=None):
+        """
+        二分查找块所属的文件，找不到时返回 None。
+        反复查询时传入 file_index(cache_data) 的结果，否则每次调用都要重建起始索引列表。
+        """
+        starts, ranges = index or Processor.file_index(cache_data)
+        pos = bisect.bisect_right(starts, b_idx) - 1
+        if pos >= 0 and b_idx < ranges[pos]["block_range"][1]:
+            return ranges[pos]["rel_path"]
         return None
 
+    def get_journal(self, filename):
+        return CacheJournal(os.path.join(self.cache_dir, f"{filename}.journal"))
+
+    def save_chunk(self, filename, data, f_idx=None, c_idx=None):
+        """
+        增量持久化：只向日志追加发生变化的分组（不含不变的原文与块索引）
+        以及断点等全局状态，累计 JOURNAL_COMPACT_EVERY 条后压缩为完整缓存。
+        """
+        entry = {"g": data.get("journal_generation", 0),
+                 "state": {k: data[k] for k in self.JOURNAL_STATE_KEYS if k in data}}
+        if f_idx is not None:
+            chunk = data["files"][f_idx]["chunks"][c_idx]
+            entry["f"] = f_idx
+            entry["c"] = c_idx
+            entry["chunk"] = {k: v for k, v in chunk.items() if k not in ("orig", "block_indices")}
+        with self._cache_lock:
+            self.get_journal(filename).append(entry)
+            count = self._journal_counts.get(filename, 0) + 1
+            self._journal_counts[filename] = count
+            if count >= self.JOURNAL_COMPACT_EVERY:
+                self.save_cache(filename, data)
+
+    def save_manual_edit(self, filename, f_idx, c_idx, trans):
+        """
+        保存界面上对单个分组译文的手动修改：只向日志追加该分组的译文，不写全局状态，
+        翻译运行中也不会用界面上的旧副本覆盖工作线程已写入的分组。
+        该缓存正在运行时同时改写运行中的内存副本，之后的日志压缩不会丢失这次修改。
+        """
+        with self._cache_lock:
+            if self._active_cache and self._active_cache[0] == filename:
+                self._active_cache[1]["files"][f_idx]["chunks"][c_idx]["trans"] = trans
+            generation = self._journal_generations.get(filename, 0)
+            self.get_journal(filename).append({"g": generation, "f": f_idx, "c": c_idx, "chunk": {"trans": trans}})
+            self._journal_counts[filename] = self._journal_counts.get(filename, 0) + 1
+
+    def delete_cache(self, filename):
+        """删除缓存文件及其日志，返回是否存在缓存"""
+        path = os.path.join(self.cache_dir, filename)
+        existed = os.path.exists(path)
+        if existed:
+            os.remove(path)
+        self.get_journal(filename).clear()
+        self._journal_counts.pop(filename, None)
+        return existed
+
+    @staticmethod
+    def source_fingerprint(input_path):
+        """源文件指纹：大小、修改时间与内容 SHA-256"""
+        stat = os.stat(input_path)
+        digest = hashlib.sha256()
+        with open(input_path, 'rb') as f:
+            for data in iter(lambda: f.read(1 << 20), b""):
+                digest.update(data)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest.hexdigest()}
+
+    def _source_changed(self, cache_file, cached_data, input_path):
+        """
+        源文件内容是否与建立缓存时不同。大小与修改时间都未变时不读取文件；
+        内容相同而修改时间变化（如重新复制）或旧缓存没有指纹时，记录当前指纹并视为未修改。
+        """
+        if not os.path.exists(input_path):
+            return False
+        known = cached_data.get("source")
+        stat = os.stat(input_path)
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            return False
+        current = self.source_fingerprint(input_path)
+        if known and known["sha256"] != current["sha256"]:
+            return True
+        cached_data["source"] = current
+        self.save_cache(cache_file, cached_data)
+        return False
+
+    def _carry_over(self, anchor_processor, previous, all_blocks):
+        """
+        修订版沿用旧译文，返回 {新块索引: 译文}。
+        用 difflib 比对修订前后的块文本序列，未改动的连续块按位置沿用；
+        新增或改动的块若与旧版某块文本完全相同（段落移动、重复段落）也沿用。
+        锚点编号包含在块文本中，文本相同即锚点结构相同，译文可直接套用新文件的格式。
+        """
+        old_translations = self._translated_blocks(anchor_processor, previous, skip_failed=True)
+        old_texts = [b["text"] for b in previous["all_blocks"]]
+        new_texts = [b["text"] for b in all_blocks]
+        carried = {}
+        matcher = difflib.SequenceMatcher(None, old_texts, new_texts, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                continue
+            for k in range(i2 - i1):
+                if i1 + k in old_translations:
+                    carried[j1 + k] = old_translations[i1 + k]
+        by_text = {old_texts[i]: text for i, text in old_translations.items()}
+        for j, text in enumerate(new_texts):
+            if j not in carried and text in by_text:
+                carried[j] = by_text[text]
+        return carried
+
     def get_cache_filename(self, input_filename):
         base = os.path.basename(input_filename)
         return f"{base}_cache.json"
@@ -34,21 +261,31 @@ class Processor:
         base = os.path.basename(input_filename)
         return os.path.join(self.cache_dir, f"{base}_extracted")
 
-    def process_epub_anchor_init(self, input_path, max_chars, only_load=False, callback=None):
+    def process_epub_anchor_init(self, input_path, max_chars, only_load=False, callback=None, memory=None, grouper=None):
         """
         基于锚点标记的 EPUB 初始化。
+        grouper 为 None 时按 max_chars 字符数分组，传入 TokenGrouper 则按 token 预算分组。
         """
         cache_file = self.get_cache_filename(input_path)
         cached_data = self.load_cache(cache_file)
         
+        previous = None
         if cached_data and cached_data.get("source_type") == "epub_anchor":
-            return cached_data
+            if only_load or not self._source_changed(cache_file, cached_data, input_path):
+                return cached_data
+            # 源文件已修改（修订版）：重新提取，未改动块的译文沿用旧缓存
+            previous = cached_data
 
         if only_load:
             return None
 
-        # 1. 解压 EPUB
-        temp_dir = self.epub_anchor_processor.extract_epub(input_path, callback=callback)
+        # 1. 打开 EPUB（归档模式下不解压，working_dir 为 None）
+        temp_dir = None
+        with metrics.span("extract_epub", bytes=os.path.getsize(input_path)):
+            if self.storage == "extract":
+                temp_dir = self.epub_anchor_processor.extract_epub(input_path, callback=callback)
+            else:
+                self.epub_anchor_processor.open_epub(input_path, callback=callback)
         
         # 2. 遍历 XHTML 文件并提取块
         if callback: callback("正在遍历 XHTML 文件并提取文本块...")
@@ -56,12 +293,23 @@ class Processor:
         all_blocks = []
         files_info = []
         
-        for xhtml_file in xhtml_files:
-            rel_path = os.path.relpath(xhtml_file, temp_dir)
-            with open(xhtml_file, 'r', encoding='utf-8') as f:
-                soup = BeautifulSoup(f, 'html.parser')
+        skipped = 0
+        for rel_path in xhtml_files:
+            data = self.epub_anchor_processor.archive.read_bytes(rel_path)
+            # 只有图片的封面、插图页不解析
+            if not self.epub_anchor_processor.has_text(data):
+                skipped += 1
+                continue
+            with metrics.span("parse", bytes=len(data)):
+                soup = self.epub_anchor_processor.parse_markup(data.decode('utf-8'))
             
-            file_blocks = self.epub_anchor_processor.create_blocks_from_soup(soup)
+            with metrics.span("create_blocks") as span:
+                file_blocks = self.epub_anchor_processor.create_blocks_from_soup(soup)
+                span.add("blocks", len(file_blocks))
+            # 逐章处理：只保留文本与格式信息，释放本章的解析树后再读下一章
+            file_blocks = [{"text": b["text"], "formats": b["formats"], "size": b["size"]} for b in file_blocks]
+            soup.decompose()
+            del soup
             if not file_blocks:
                 continue
                 
@@ -76,20 +324,16 @@ class Processor:
                 "finished": False
             })
 
-        # 3. 分组
+        if callback and skipped: callback(f"跳过 {skipped} 个没有文字的页面（封面、插图页等）")
+
+        # 3. 分组（已命中翻译记忆或书内重复的块不再进入分组）
         if callback: callback("正在进行逻辑分组与分块...")
-        groups = []
-        current_group = []
-        current_size = 0
-        for i, block in enumerate(all_blocks):
-            if current_size + block['size'] > max_chars and current_group:
-                groups.append(current_group)
-                current_group = []
-                current_size = 0
-            current_group.append(i)
-            current_size += block['size']
-        if current_group:
-            groups.append(current_group)
+        grouper = grouper or CharGrouper(max_chars)
+        carried = None
+        if previous:
+            if callback: callback("检测到源文件已修改，正在比对修订前后的文本块...")
+            carried = self._carry_over(self.epub_anchor_processor, previous, all_blocks)
+        groups, prefilled, block_refs, memory_stats = self._plan_groups(all_blocks, max_chars, memory, callback, grouper, carried)
 
         # 4. 构造持久化结构
         # 为方便 process_run 统一处理，我们模拟 chunk 结构
@@ -106,10 +350,13 @@ class Processor:
             })
 
         cached_data = {
+            "cache_version": self.CACHE_VERSION,
             "source_type": "epub_anchor",
             "working_dir": temp_dir,
+            "storage": self.storage,
             "input_path": input_path,
             "input_ext": ".epub",
+            "parser_backend": self.epub_anchor_processor.parser_backend,
             "current_flat_idx": 0,
             "files": [
                 {
@@ -118,41 +365,47 @@ class Processor:
                     "finished": False
                 }
             ],
-            "all_blocks": [ # 需要保存 blocks 的元数据用于还原
-                {
-                    "text": b['text'],
-                    "formats": b['formats'],
-                    # 提示：BeautifulSoup 元素无法直接序列化，我们在还原时会基于 position 重新解析
-                } for b in all_blocks
-            ],
+            # 块格式在还原时基于原文件重新解析，这里只保存文本与锚点数
+            "all_blocks": [self.compact_block(b) for b in all_blocks],
+            "prefilled": prefilled,
+            "block_refs": block_refs,
+            "memory_stats": memory_stats,
+            "grouping": grouper.describe(),
+            "source": self.source_fingerprint(input_path),
             "finished": False
         }
         
-        # 记录每个 block 所属的文件路径，方便还原
-        block_to_file = {}
-        for f_info in files_info:
-            for b_idx in range(f_info['block_range'][0], f_info['block_range'][1]):
-                block_to_file[b_idx] = f_info['rel_path']
-        cached_data["block_to_file"] = block_to_file
-        
+        # 记录每个文件的块索引范围，方便还原
+        cached_data["file_ranges"] = self.file_ranges(files_info)
+        # 内容已全部读入，释放 zip 句柄（导出时重新打开原文件）
+        self.epub_anchor_processor.archive.close()
         self.save_cache(cache_file, cached_data)
         return cached_data
 
-    def process_docx_anchor_init(self, input_path, max_chars, only_load=False, callback=None):
+    def process_docx_anchor_init(self, input_path, max_chars, only_load=False, callback=None, memory=None, grouper=None):
         """
         基于锚点标记的 DOCX 初始化。
         """
         cache_file = self.get_cache_filename(input_path)
         cached_data = self.load_cache(cache_file)
         
+        previous = None
         if cached_data and cached_data.get("source_type") == "docx_anchor":
-            return cached_data
+            if only_load or not self._source_changed(cache_file, cached_data, input_path):
+                return cached_data
+            # 源文件已修改（修订版）：重新提取，未改动块的译文沿用旧缓存
+            previous = cached_data
 
         if only_load:
             return None
 
-        # 1. 解压 DOCX
-        temp_dir = self.docx_anchor_processor.extract_docx(input_path, callback=callback)
+        # 1. 打开 DOCX（归档模式下不解压，working_dir 为 None）
+        temp_dir = None
+        with metrics.span("extract_docx", bytes=os.path.getsize(input_path)):
+            if self.storage == "extract":
+                temp_dir = self.docx_anchor_processor.extract_docx(input_path, callback=callback)
+            else:
+                self.docx_anchor_processor.open_docx(input_path, callback=callback)
         
         # 2. 遍历 XML 文件并提取块
         if callback: callback("正在遍历 XML 文件并提取文本块...")
@@ -160,12 +413,14 @@ class Processor:
         all_blocks = []
         files_info = []
         
-        for xml_file in xml_files:
-            rel_path = os.path.relpath(xml_file, temp_dir)
-            with open(xml_file, 'r', encoding='utf-8') as f:
-                soup = BeautifulSoup(f, 'xml') # 使用 xml 解析器
+        for rel_path in xml_files:
+            markup = self.docx_anchor_processor.read_part(rel_path)
+            with metrics.span("parse", bytes=len(markup)):
+                soup = BeautifulSoup(markup, 'xml') # 使用 xml 解析器
             
-            file_blocks = self.docx_anchor_processor.create_blocks_from_soup(soup)
+            with metrics.span("create_blocks") as span:
+                file_blocks = self.docx_anchor_processor.create_blocks_from_soup(soup)
+                span.add("blocks", len(file_blocks))
             if not file_blocks:
                 continue
                 
@@ -179,20 +434,14 @@ class Processor:
                 "finished": False
             })
 
-        # 3. 分组
+        # 3. 分组（已命中翻译记忆或书内重复的块不再进入分组）
         if callback: callback("正在进行逻辑分组与分块...")
-        groups = []
-        current_group = []
-        current_size = 0
-        for i, block in enumerate(all_blocks):
-            if current_size + block['size'] > max_chars and current_group:
-                groups.append(current_group)
-                current_group = []
-                current_size = 0
-            current_group.append(i)
-            current_size += block['size']
-        if current_group:
-            groups.append(current_group)
+        grouper = grouper or CharGrouper(max_chars)
+        carried = None
+        if previous:
+            if callback: callback("检测到源文件已修改，正在比对修订前后的文本块...")
+            carried = self._carry_over(self.docx_anchor_processor, previous, all_blocks)
+        groups, prefilled, block_refs, memory_stats = self._plan_groups(all_blocks, max_chars, memory, callback, grouper, carried)
 
         # 4. 构造持久化结构
         chunks = []
@@ -207,8 +456,10 @@ class Processor:
             })
 
         cached_data = {
+            "cache_version": self.CACHE_VERSION,
             "source_type": "docx_anchor",
             "working_dir": temp_dir,
+            "storage": self.storage,
             "input_path": input_path,
             "input_ext": ".docx",
             "current_flat_idx": 0,
@@ -219,33 +470,151 @@ class Processor:
                     "finished": False
                 }
             ],
-            "all_blocks": [
-                {
-                    "text": b['text'],
-                    "formats": b['formats'],
-                } for b in all_blocks
-            ],
+            "all_blocks": [self.compact_block(b) for b in all_blocks],
+            "prefilled": prefilled,
+            "block_refs": block_refs,
+            "memory_stats": memory_stats,
+            "grouping": grouper.describe(),
+            "source": self.source_fingerprint(input_path),
             "finished": False
         }
         
-        block_to_file = {}
-        for f_info in files_info:
-            for b_idx in range(f_info['block_range'][0], f_info['block_range'][1]):
-                block_to_file[b_idx] = f_info['rel_path']
-        cached_data["block_to_file"] = block_to_file
-        
+        cached_data["file_ranges"] = self.file_ranges(files_info)
+        self.docx_anchor_processor.archive.close()
         self.save_cache(cache_file, cached_data)
         return cached_data
 
-    def process_run(self, input_path, translator, context_rounds=1, callback=None, target_indices=None):
+    def open_memory(self, model, prompt, temperature):
+        """打开缓存目录下共享的翻译记忆"""
+        return TranslationMemory(self.cache_dir, model, prompt, temperature)
+
+    @staticmethod
+    def dedupe_key(block):
+        """
+        书内去重的键：规范化文本加各锚点的标签与类型。
+        锚点文本相同但包裹的格式不同（如 <b> 与 <code>）的块分别翻译。
+        翻译记忆只以文本为键（见 TranslationMemory）：运行时缓存中的块只有文本与锚点数，
+        无法得到格式，且记忆在书籍之间共享，格式标签因排版而异；导出时始终按本块自己的 formats 还原。
+        """
+        return TranslationMemory.normalize(block['text']), tuple((f.get('tag'), f.get('type')) for f in block['formats'])
+
+    def _plan_groups(self, all_blocks, max_chars, memory=None, callback=None, grouper=None, carried=None):
+        """
+        由 grouper 贪心分组（默认按字符数，见 grouping.py）。分组前先查询翻译记忆：命中的块直接写入 prefilled；
+        书内文本与格式都相同的重复块（如页眉页脚、重复的表格单元，见 dedupe_key）只翻译第一次出现，
+        其余记录在 block_refs 中，导出时复用其译文。
+        carried 为修订前缓存中沿用的译文 {块索引: 译文}（见 _carry_over），同样写入 prefilled。
+        """
+        prefilled = {}
+        block_refs = {}
+        first_seen = {}
+        candidates = []
+        carried = carried or {}
+
+        hits = memory.get_many([b['text'] for b in all_blocks]) if memory else [None] * len(all_blocks)
+        for i, block in enumerate(all_blocks):
+            if i in carried:
+                prefilled[str(i)] = carried[i]
+                continue
+            if hits[i] is not None:
+                prefilled[str(i)] = hits[i]
+                continue
+            key = self.dedupe_key(block)
+            if key in first_seen:
+                block_refs[str(i)] = first_seen[key]
+                continue
+            first_seen[key] = i
+            candidates.append(i)
+
+        with metrics.span("grouping", blocks=len(candidates)) as span:
+            groups = (grouper or CharGrouper(max_chars)).group(candidates, all_blocks)
+            span.add("groups", len(groups))
+
+        memory_stats = {
+            "lookups": len(all_blocks) if memory else 0,
+            "hits": len(prefilled) - len(carried),
+            "duplicates": len(block_refs)
+        }
+        if carried:
+            memory_stats["carried"] = len(carried)
+        if callback:
+            if carried:
+                callback(f"修订版沿用原译文 {len(carried)}/{len(all_blocks)} 块，"
+                         f"需重新翻译 {sum(len(g) for g in groups)} 块。")
+            callback(f"翻译记忆命中 {memory_stats['hits']}/{len(all_blocks)} 块，书内重复块 {len(block_refs)} 个。")
+        return groups, prefilled, block_refs, memory_stats
+
+    def _translated_blocks(self, anchor_processor, cache_data, skip_failed=False):
+        """
+        缓存中各块的译文 {块索引: 译文}：逐组解析译文（结构损坏时逐块取回能解析的部分），
+        再合并翻译记忆命中与书内重复块。skip_failed 为 True 时不含仍以原文占位的块。
+        """
+        all_translated_blocks = {}
+        for file_data in cache_data["files"]:
+            for chunk in file_data["chunks"]:
+                g_indices = chunk.get("block_indices", [])
+                full_trans = chunk.get("trans", "")
+                if chunk.get("is_error"):
+                    # 移除错误标记前缀
+                    full_trans = full_trans.replace(self.VALIDATION_ERROR_PREFIX, "")
+
+                group_blocks = [cache_data["all_blocks"][idx] for idx in g_indices]
+                translated_texts, ok = anchor_processor.validate_and_parse_response(full_trans, group_blocks)
+                if not ok:
+                    # 结构仍损坏时逐块取回能解析的部分，其余块保留原文
+                    translated_texts = anchor_processor.salvage_response(full_trans, group_blocks)
+
+                skip = set(chunk.get("failed_blocks") or ()) if skip_failed else ()
+                for k, (idx, text) in enumerate(zip(g_indices, translated_texts)):
+                    if text is not None and k not in skip:
+                        all_translated_blocks[idx] = text
+        self._collect_prefilled(cache_data, all_translated_blocks)
+        return all_translated_blocks
+
+    def _collect_prefilled(self, cache_data, all_translated_blocks):
+        """合并翻译记忆命中的块，并为书内重复块复用首次出现的译文"""
+        for b_idx, text in cache_data.get("prefilled", {}).items():
+            all_translated_blocks[int(b_idx)] = text
+        for b_idx, src_idx in cache_data.get("block_refs", {}).items():
+            if src_idx in all_translated_blocks:
+                all_translated_blocks[int(b_idx)] = all_translated_blocks[src_idx]
+
+    def process_run(self, input_path, translator, context_rounds=1, callback=None, target_indices=None, max_workers=1, use_memory=True,
+                    history_tokens=0, reset_scheduler=True):
         """
         翻译运行循环。
+
+        callback(idx, total, orig, text, is_finished)：流式过程中 orig 为空、text 为本次增量，
+        text 为空字符串表示流式响应中断后重新请求，此前收到的增量应丢弃；
+        分组完成时 orig 为原文、text 为完整译文（校验失败时带错误前缀），
+        请求失败（chunk 标记 retryable / error，不写入译文）时 text 为空字符串。
+        未指定 target_indices 时，断点之前标记为 retryable 的分组会先重新翻译。
+        结构校验失败时保留能解析的块，只把失败的块作为小分组重新请求（见 _salvage_group）；
+        整组失败或输出被截断时按块边界对半拆分，拆分结果在下次加载缓存时写成独立分组（见 _apply_splits），
+        校验结果计入 group_stats，影响之后初始化时的分组大小。
+
+        max_workers > 1 时启用并发模式：多个分组同时请求 API，每个分组只等待
+        其 context_rounds 范围内仍在翻译中的前序分组（上下文依赖），
+        结果按分组索引写回，断点位置始终为连续完成的前缀。
+
+        use_memory 为 True 时按 translator 的模型/提示词/温度查询翻译记忆，
+        组内所有块均命中时不再调用 API，校验通过的译文写回记忆。
+
+        history_tokens > 0 时上下文历史限制在该 token 预算内（见 _build_history）。
+        每组请求的 token 用量（含前缀缓存命中数）记录在 chunk["usage"]，累计值在 usage_stats。
+
+        reset_scheduler 为 True 时开始前清除 translator.scheduler 的取消状态；
+        多本书共用一个调度器时应为 False，由调用方在全部开始前重置一次，
+        避免后开始的书清掉 Ctrl-C 等对全部书的停止请求。
         """
         cache_file = self.get_cache_filename(input_path)
         cached_data = self.load_cache(cache_file)
         
         if not cached_data:
             return False
+        with self._cache_lock:
+            # 上次运行留下的拆分已在 load_cache 中写成独立分组，target_indices 使用的是拆分后的编号
+            self._active_cache = (cache_file, cached_data)
 
         # Build flat list
         flat_list = []
@@ -258,78 +627,506 @@ class Processor:
             loop_range = sorted(target_indices)
         else:
             start_idx = cached_data["current_flat_idx"]
-            loop_range = range(start_idx, len(flat_list))
+            # 断点之前因暂时性故障失败的分组先重新翻译
+            retry = [i for i, (f_i, c_i) in enumerate(flat_list[:start_idx])
+                     if cached_data["files"][f_i]["chunks"][c_i].get("retryable")]
+            loop_range = retry + list(range(start_idx, len(flat_list)))
 
         self.status = "running"
-        
-        # Main Loop
+        self._active_translator = translator
+        scheduler = getattr(translator, "scheduler", None)
+        if scheduler and reset_scheduler:
+            scheduler.reset()
+        memory = self.open_memory(translator.model, translator.system_prompt, translator.temperature) if use_memory else None
+        try:
+            completed = self._run_loop(cache_file, cached_data, flat_list, loop_range, translator,
+                                       context_rounds, callback, target_indices, max_workers, memory, history_tokens)
+        finally:
+            if memory:
+                memory.close()
+            self.group_stats.save()
+        if completed and target_indices is None:
+            cached_data["finished"] = not any(c.get("retryable") for f in cached_data["files"] for c in f["chunks"])
+        with self._cache_lock:
+            # 本次运行中的拆分暂不改变分组编号：界面仍按运行前的编号保存手动修改，
+            # 下次 load_cache 时再写成独立分组
+            self.save_cache(cache_file, cached_data)
+            self._active_cache = None
+        if not completed:
+            return False
+
+        self.status = "idle"
+        return True
+
+    def stop(self):
+        """请求停止：当前分组放弃，正在退避/限速等待中的请求立即返回"""
+        self.status = "stopped"
+        scheduler = getattr(self._active_translator, "scheduler", None)
+        if scheduler:
+            scheduler.cancel()
+
+    def _run_loop(self, cache_file, cached_data, flat_list, loop_range, translator, context_rounds, callback, target_indices, max_workers, memory, history_tokens=0):
+        """顺序或并发执行翻译，返回是否全部完成（未被停止）"""
+        if max_workers > 1:
+            return self._run_concurrent(cache_file, cached_data, flat_list, list(loop_range),
+                                        translator, context_rounds, callback, target_indices, max_workers, memory, history_tokens)
+
+        # Main Loop（断点之前的重试分组不会让断点后退）
         for i in loop_range:
             if self.status != "running":
-                if target_indices is None:
-                    cached_data["current_flat_idx"] = i 
-                self.save_cache(cache_file, cached_data)
                 return False 
 
-            f_idx, c_idx = flat_list[i]
-            file_data = cached_data["files"][f_idx]
-            chunk = file_data["chunks"][c_idx]
+            if not self._translate_group(cached_data, flat_list, i, translator, context_rounds, callback, memory, history_tokens):
+                # 流式过程中被停止，本组未完成，下次从本组继续
+                return False
             
-            # Context builder
-            history = []
-            hist_start = max(0, i - context_rounds)
-            for hi in range(hist_start, i):
-                hf, hc = flat_list[hi]
-                h_chunk = cached_data["files"][hf]["chunks"][hc]
-                if h_chunk["trans"]:
-                    history.append((h_chunk["orig"], h_chunk["trans"]))
-
-            # Translate with streaming
-            full_translation = ""
-            for partial in translator.translate_chunk(chunk["orig"], history):
-                full_translation += partial
+            if target_indices is None:
+                cached_data["current_flat_idx"] = max(cached_data["current_flat_idx"], i + 1)
+            self.save_chunk(cache_file, cached_data, *flat_list[i])
+        return True
+
+    def _translate_group(self, cached_data, flat_list, i, translator, context_rounds, callback, memory=None, history_tokens=0):
+        """
+        翻译并校验单个分组，结果写回 chunk。
+        若流式过程中 status 被置为非 running，则放弃本组并返回 False。
+        """
+        f_idx, c_idx = flat_list[i]
+        file_data = cached_data["files"][f_idx]
+        chunk = file_data["chunks"][c_idx]
+        
+        g_indices = chunk.get("block_indices", [])
+        group_blocks = [cached_data["all_blocks"][idx] for idx in g_indices]
+        anchor_processor = self._anchor_processor_for(cached_data)
+        history = self._build_history(anchor_processor, cached_data, flat_list, i, context_rounds, history_tokens)
+        # 本组（含补救与拆分的所有请求）的 token 用量
+        usage = {}
+
+        # 组内所有块都命中翻译记忆时直接拼装译文，不调用 API
+        hits = memory.get_many([b["text"] for b in group_blocks]) if memory else None
+        memory_hit = bool(hits) and all(h is not None for h in hits)
+        if memory:
+            # 只有整组命中才省下一次请求；部分命中的块仍随分组发送，不计入命中数
+            with self._cache_lock:
+                stats = cached_data.setdefault("memory_stats", {"lookups": 0, "hits": 0, "duplicates": 0})
+                stats["lookups"] += len(group_blocks)
+                if memory_hit:
+                    stats["hits"] += len(group_blocks)
+        truncated = False
+        if memory_hit:
+            full_translation = anchor_processor.format_for_ai([{"text": h} for h in hits])
+        else:
+            # Translate with streaming：回调只传递本次增量（orig 为空）
+            def on_delta(partial):
                 if callback:
-                    callback(i, len(flat_list), chunk["orig"], full_translation, False)
-            
-            # 校（锚点模式）
-            g_indices = chunk.get("block_indices", [])
-            group_blocks = [{"text": cached_data["all_blocks"][idx]["text"], "formats": cached_data["all_blocks"][idx]["formats"]} for idx in g_indices]
+                    callback(i, len(flat_list), "", partial, False)
+            try:
+                result = self._request_group(translator, chunk["orig"], history, on_delta, usage)
+            except TranslationError as e:
+                if self.status != "running":
+                    return False
+                # 请求失败：不写入任何译文，只标记错误；暂时性故障的分组下次运行时自动重试
+                with self._cache_lock:
+                    chunk["retryable"] = e.retryable
+                    chunk["error"] = str(e)
+                if callback:
+                    callback(i, len(flat_list), chunk["orig"], "", True)
+                return True
+            if result is None:
+                return False
+            full_translation, truncated = result
+        
+        # 校（锚点模式）
+        translated_texts, failure = anchor_processor.validate_response(full_translation, group_blocks)
+        failed_blocks = None
+        splits = None
+        if not memory_hit:
+            self.group_stats.record(translator.model, failure is None)
+        if failure is not None and not memory_hit:
+            # 补救：整组失败时对半拆分重新请求，部分失败时只重新请求失败的块
+            segments = self._recover_group(anchor_processor, translator, full_translation, truncated, group_blocks, history, usage)
+            if segments is None:
+                return False
+            salvaged = [t for segment in segments for t in segment]
+            if any(t is not None for t in salvaged):
+                if len(segments) > 1:
+                    splits = [len(segment) for segment in segments]
+                # 仍失败的块暂以原文占位，译文保持合法的分组结构，便于手动补译与导出
+                failed_blocks = [k for k, t in enumerate(salvaged) if t is None]
+                translated_texts = [b["text"] if t is None else t for t, b in zip(salvaged, group_blocks)]
+                full_translation = anchor_processor.format_for_ai([{"text": t} for t in translated_texts])
+                if failed_blocks:
+                    failure = {"block": failed_blocks[0], "reason": self._failed_blocks_reason(failed_blocks, len(group_blocks))}
+                else:
+                    failure = None
+        ok = failure is None
+        if translated_texts and memory and not memory_hit:
+            skip = set(failed_blocks or ())
+            memory.put_many((b["text"], t) for k, (b, t) in enumerate(zip(group_blocks, translated_texts)) if k not in skip)
             
-            # 根据 source_type 选择校验器
-            if cached_data.get("source_type") == "docx_anchor":
-                _, ok = self.docx_anchor_processor.validate_and_parse_response(full_translation, group_blocks)
-            else:
-                _, ok = self.epub_anchor_processor.validate_and_parse_response(full_translation, group_blocks)
-                
-            if not ok:
-                full_translation = f"【结构校验失败，请手动检查】\n{full_translation}"
-                chunk["is_error"] = True
-            else:
-                chunk["is_error"] = False
+        if not ok:
+            full_translation = f"{self.VALIDATION_ERROR_PREFIX}{full_translation}"
 
+        with self._cache_lock:
+            chunk["is_error"] = not ok
             chunk["trans"] = full_translation
-            
-            if callback:
-                callback(i, len(flat_list), chunk["orig"], full_translation, True)
-            
-            if target_indices is None:
-                cached_data["current_flat_idx"] = i + 1
-            self.save_cache(cache_file, cached_data)
-
-        if target_indices is None:
-            cached_data["finished"] = True
-            self.save_cache(cache_file, cached_data)
+            # 日志重放只会覆盖字段，不能直接删除，已有的字段置空
+            if not ok:
+                # 记录具体出错的块与原因，便于手动检查
+                chunk["error"] = failure["reason"]
+            elif "error" in chunk:
+                chunk["error"] = ""
+            if failed_blocks is not None or "failed_blocks" in chunk:
+                # 组内仍为原文占位的块位置（相对 block_indices）
+                chunk["failed_blocks"] = failed_blocks or []
+            if splits:
+                # 拆分后的各段块数，下次加载缓存时写成独立的分组（见 _apply_splits）
+                chunk["split"] = splits
+            if "retryable" in chunk:
+                chunk["retryable"] = False
+            if usage:
+                chunk["usage"] = usage
+                totals = cached_data.setdefault("usage_stats", {})
+                for key, value in usage.items():
+                    totals[key] = totals.get(key, 0) + value
         
-        self.status = "idle"
+        if callback:
+            callback(i, len(flat_list), chunk["orig"], full_translation, True)
+        return True
+
+    def _build_history(self, anchor_processor, cached_data, flat_list, i, context_rounds, history_tokens=0):
+        """
+        上下文历史：前 context_rounds 个已翻译分组的 (原文, 译文)，按时间从旧到新排列，
+        同一分组每次生成的历史完全相同，便于服务端前缀缓存。校验失败的分组不作为示范。
+        history_tokens > 0 时从最近的分组往前累计，超出预算的分组只保留末尾能放下的块。
+        """
+        history = []
+        budget = history_tokens or None
+        for hi in range(i - 1, max(0, i - context_rounds) - 1, -1):
+            hf, hc = flat_list[hi]
+            h_chunk = cached_data["files"][hf]["chunks"][hc]
+            if not h_chunk["trans"] or h_chunk.get("is_error"):
+                continue
+            pair = (h_chunk["orig"], h_chunk["trans"])
+            if budget is not None:
+                cost = TokenCounter.estimate(pair[0]) + TokenCounter.estimate(pair[1])
+                if cost > budget:
+                    pair = self._trim_history_pair(anchor_processor, cached_data, h_chunk, budget)
+                    if pair:
+                        history.append(pair)
+                    break
+                budget -= cost
+            history.append(pair)
+        history.reverse()
+        return history
+
+    def _trim_history_pair(self, anchor_processor, cached_data, h_chunk, budget):
+        """取分组末尾在预算内的若干块，重新编号为一个完整的 (原文, 译文) 分组；一块也放不下时返回 None"""
+        blocks = [cached_data["all_blocks"][idx] for idx in h_chunk.get("block_indices", [])]
+        texts, failure = anchor_processor.validate_response(h_chunk["trans"], blocks)
+        if failure is not None:
+            return None
+        # 分组标记与每块两侧分隔符的开销
+        cost = 2 * TokenCounter.SYMBOL_TOKENS
+        start = len(blocks)
+        while start > 0:
+            block_cost = (TokenCounter.estimate(blocks[start - 1]["text"]) + TokenCounter.estimate(texts[start - 1])
+                          + 4 * TokenCounter.SYMBOL_TOKENS)
+            if cost + block_cost > budget:
+                break
+            cost += block_cost
+            start -= 1
+        if start == len(blocks):
+            return None
+        return (anchor_processor.format_for_ai(blocks[start:]),
+                anchor_processor.format_for_ai([{"text": t} for t in texts[start:]]))
+
+    def _anchor_processor_for(self, cached_data):
+        """根据 source_type 选择校验器"""
+        if cached_data.get("source_type") == "docx_anchor":
+            return self.docx_anchor_processor
+        return self.epub_anchor_processor
+
+    @staticmethod
+    def _failed_blocks_reason(failed_blocks, total):
+        return f"{len(failed_blocks)}/{total} 个块未能取回，已保留原文: " + ", ".join(str(k + 1) for k in failed_blocks)
+
+    def _request_group(self, translator, text, history, on_delta=None, usage=None):
+        """
+        流式请求一个分组，增量放入列表缓冲。返回 (完整响应, 是否被输出长度截断)，
+        流式过程中 status 被置为非 running 时返回 None；请求失败抛出 TranslationError。
+        usage 不为 None 时累加本次请求的 requests / input / cached / output token 数。
+        """
+        parts = []
+        truncated = False
+        request_usage = {}
+
+        def restart():
+            # 流式中断后重新请求：丢弃已收到的部分，空增量通知界面同样丢弃
+            parts.clear()
+            if on_delta:
+                on_delta("")
+
+        try:
+            for partial in translator.translate_chunk(text, history, usage=request_usage, on_restart=restart):
+                if self.status != "running":
+                    return None
+                parts.append(partial)
+                if on_delta:
+                    on_delta(partial)
+        except OutputTruncated:
+            truncated = True
+        finally:
+            if usage is not None:
+                request_usage["requests"] = 1
+                for key, value in request_usage.items():
+                    usage[key] = usage.get(key, 0) + value
+        if self.status != "running":
+            return None
+        return "".join(parts), truncated
+
+    def _recover_group(self, anchor_processor, translator, response, truncated, group_blocks, history, usage=None):
+        """
+        校验失败后的补救，返回按顺序覆盖 group_blocks 的若干段译文列表（仍失败的块为 None），
+        多于一段表示分组已被拆分；被停止时返回 None。
+          - 被截断或一个块也解析不出（多为分组过大）：按块边界对半拆分，各自请求，必要时继续拆分
+          - 部分块失败：保留能解析的块，失败的块组成小分组重新请求（见 _salvage_group）
+        """
+        salvaged = [None] * len(group_blocks) if truncated else anchor_processor.salvage_response(response, group_blocks)
+        if len(group_blocks) > 1 and all(t is None for t in salvaged):
+            return self._split_group(anchor_processor, translator, group_blocks, history, usage)
+        salvaged = self._salvage_group(anchor_processor, translator, salvaged, group_blocks, history, usage)
+        return None if salvaged is None else [salvaged]
+
+    def _split_group(self, anchor_processor, translator, group_blocks, history, usage=None):
+        """将分组对半拆分后分别请求，返回各段译文列表（同 _recover_group）"""
+        mid = len(group_blocks) // 2
+        segments = []
+        for half in (group_blocks[:mid], group_blocks[mid:]):
+            try:
+                result = self._request_group(translator, anchor_processor.format_for_ai(half), history, usage=usage)
+            except TranslationError:
+                if self.status != "running":
+                    return None
+                segments.append([None] * len(half))
+                continue
+            if result is None:
+                return None
+            response, truncated = result
+            texts, failure = anchor_processor.validate_response(response, half)
+            self.group_stats.record(translator.model, failure is None)
+            if failure is None:
+                segments.append(texts)
+                continue
+            recovered = self._recover_group(anchor_processor, translator, response, truncated, half, history, usage)
+            if recovered is None:
+                return None
+            segments.extend(recovered)
+        return segments
+
+    def _salvage_group(self, anchor_processor, translator, texts, group_blocks, history, usage=None):
+        """
+        texts 为从损坏响应中取回的块（无法解析的为 None），失败的块组成小分组重新请求，
+        最多 SALVAGE_ROUNDS 轮。返回补全后的 texts；重新请求时被停止则返回 None。
+        一个块也没有取回时不重新请求，交由上层按整组失败处理。
+        """
+        texts = list(texts)
+        for _ in range(self.SALVAGE_ROUNDS):
+            missing = [k for k, t in enumerate(texts) if t is None]
+            if not missing or len(missing) == len(texts):
+                break
+            sub_blocks = [group_blocks[k] for k in missing]
+            try:
+                result = self._request_group(translator, anchor_processor.format_for_ai(sub_blocks), history, usage=usage)
+            except TranslationError:
+                if self.status != "running":
+                    return None
+                break
+            if result is None:
+                return None
+            for k, text in zip(missing, anchor_processor.salvage_response(result[0], sub_blocks)):
+                texts[k] = text
+        return texts
+
+    def _apply_splits(self, cached_data):
+        """
+        将运行中被拆分的分组（chunk["split"]）写成独立的分组，不需要重新初始化。
+        断点按拆分前后分组的对应关系平移。返回是否有改动。
+        """
+        if not any(c.get("split") for f in cached_data["files"] for c in f["chunks"]):
+            return False
+        anchor_processor = self._anchor_processor_for(cached_data)
+        resume = cached_data["current_flat_idx"]
+        old_idx = new_idx = 0
+        new_resume = None
+        for file_data in cached_data["files"]:
+            new_chunks = []
+            for chunk in file_data["chunks"]:
+                if old_idx == resume:
+                    new_resume = new_idx
+                pieces = self._split_chunk(anchor_processor, cached_data, chunk) if chunk.get("split") else [chunk]
+                new_chunks.extend(pieces)
+                old_idx += 1
+                new_idx += len(pieces)
+            file_data["chunks"] = new_chunks
+        cached_data["current_flat_idx"] = new_idx if new_resume is None else new_resume
         return True
 
-    def finalize_translation(self, input_path, output_path, target_format=None):
+    def _split_chunk(self, anchor_processor, cached_data, chunk):
+        """
+        按 chunk["split"] 的各段块数把一个分组拆成多个分组。
+        拆分前整组请求的 usage（含补救请求）无法按段准确划分，保留在第一段上，合计不变。
+        """
+        sizes = chunk.pop("split")
+        group_blocks = [cached_data["all_blocks"][idx] for idx in chunk["block_indices"]]
+        texts, failure = anchor_processor.validate_response(chunk["trans"].replace(self.VALIDATION_ERROR_PREFIX, ""), group_blocks)
+        if failure is not None or sum(sizes) != len(group_blocks):
+            # 译文已被改动，保持原分组
+            return [chunk]
+        failed = chunk.get("failed_blocks", [])
+        pieces = []
+        start = 0
+        for size in sizes:
+            end = start + size
+            seg_failed = [k - start for k in failed if start <= k < end]
+            trans = anchor_processor.format_for_ai([{"text": t} for t in texts[start:end]])
+            piece = {
+                "orig": anchor_processor.format_for_ai(group_blocks[start:end]),
+                "trans": f"{self.VALIDATION_ERROR_PREFIX}{trans}" if seg_failed else trans,
+                "block_indices": chunk["block_indices"][start:end],
+                "is_error": bool(seg_failed)
+            }
+            if seg_failed:
+                piece["failed_blocks"] = seg_failed
+                piece["error"] = self._failed_blocks_reason(seg_failed, size)
+            if not pieces and chunk.get("usage"):
+                piece["usage"] = chunk["usage"]
+            pieces.append(piece)
+            start = end
+        return pieces
+
+    def _run_concurrent(self, cache_file, cached_data, flat_list, loop_range, translator, context_rounds, callback, target_indices, max_workers, memory=None, history_tokens=0):
+        """
+        并发调度：按分组顺序提交任务，某分组仅在其上下文窗口内的待翻译前序分组
+        全部完成后才提交。context_rounds 为 0 时各分组完全独立。
+        """
+        pending = list(loop_range)
+        scheduled = set(pending)
+        done = set()
+        running = {}
+        aborted = False
+
+        def deps_ready(i):
+            for hi in range(max(0, i - context_rounds), i):
+                if hi in scheduled and hi not in done:
+                    return False
+            return True
+
+        def advance_resume_point():
+            # 断点只推进到连续完成的前缀，保证中断后不会跳过未完成分组
+            idx = cached_data["current_flat_idx"]
+            while idx < len(flat_list) and (idx not in scheduled or idx in done):
+                idx += 1
+            cached_data["current_flat_idx"] = idx
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                if self.status == "running":
+                    # 依序提交；某分组被依赖阻塞时其后继分组必然也被阻塞
+                    while pending and len(running) < max_workers and deps_ready(pending[0]):
+                        i = pending.pop(0)
+                        future = executor.submit(self._translate_group, cached_data, flat_list, i,
+                                                 translator, context_rounds, callback, memory, history_tokens)
+                        running[future] = i
+                elif not running:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    if future.result():
+                        done.add(i)
+                    else:
+                        aborted = True
+                    with self._cache_lock:
+                        if target_indices is None:
+                            advance_resume_point()
+                        self.save_chunk(cache_file, cached_data, *flat_list[i])
+
+        return not (self.status != "running" or aborted or pending)
+
+    def finalize_translation(self, input_path, output_path, target_format=None, callback=None, max_workers=None):
         ext = os.path.splitext(input_path)[1].lower()
         if ext == ".docx":
-            return self.finalize_docx_anchor_translation(input_path, output_path)
+            return self.finalize_docx_anchor_translation(input_path, output_path, callback, max_workers)
+        else:
+            return self.finalize_epub_anchor_translation(input_path, output_path, callback, max_workers)
+
+    def _open_package(self, anchor_processor, cache_data, input_path):
+        """
+        打开导出所用的内容来源：优先直接读取原始文件（归档模式），
+        原文件已不存在时回退到旧缓存记录的解压目录。
+        """
+        if os.path.exists(input_path):
+            anchor_processor.archive.open(input_path)
+            return
+        temp_dir = cache_data.get("working_dir")
+        if not temp_dir or not os.path.exists(temp_dir):
+            raise RuntimeError(f"源文件不存在: {input_path}")
+        anchor_processor.archive.use_directory(temp_dir)
+
+    def _restore_files(self, source_type, anchor_processor, file_to_blocks, all_translated_blocks, callback=None, max_workers=None, backend=None):
+        """
+        按文件还原译文。各文件相互独立，解析、还原与序列化在进程池中并行执行，
+        结果在主进程写回 anchor_processor 的内容部件。返回每个文件的 (相对路径, 耗时秒数, 块数)。
+        """
+        tasks = []
+        for rel_path, b_indices in file_to_blocks.items():
+            translations = [all_translated_blocks.get(b_idx) for b_idx in b_indices]
+            if all(t is None for t in translations):
+                # 没有任何译文的文件保持原样
+                continue
+            tasks.append((rel_path, anchor_processor.read_part(rel_path), translations))
+        if not tasks:
+            return []
+
+        workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+        timings = []
+        restore_stage = "restore_xml" if source_type == "docx_anchor" else "restore_html"
+
+        def handle(result):
+            rel_path, new_markup, found, elapsed = result
+            expected = len(file_to_blocks[rel_path])
+            if new_markup is None:
+                # 安全检查：如果当前文件解析出的块数量与缓存记录的不一致，
+                # 说明提取逻辑发生了变化或文件被错误索引，必须跳过以防内容串位（错位到封面等）
+                print(f"WARNING: Block count mismatch in {rel_path}. Cache: {expected}, File: {found}. Skipping file to prevent corruption.")
+            else:
+                anchor_processor.write_part(rel_path, new_markup)
+            timings.append((rel_path, elapsed, expected))
+            # 还原在进程池中执行，耗时由子进程测得后在此记录
+            metrics.record(restore_stage, elapsed, blocks=expected, bytes=len(new_markup or ""))
+            if callback:
+                callback(f"正在还原文件 {len(timings)}/{len(tasks)}: {rel_path} ({elapsed * 1000:.0f} ms)")
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_restore_file_task, source_type, backend, *task) for task in tasks]
+                for future in as_completed(futures):
+                    handle(future.result())
         else:
-            return self.finalize_epub_anchor_translation(input_path, output_path)
+            for task in tasks:
+                handle(_restore_file_task(source_type, backend, *task))
+        return timings
+
+    def _format_restore_report(self, timings, wall_seconds):
+        """导出耗时摘要：文件数、总耗时与最慢的几个文件"""
+        if not timings:
+            return ""
+        slowest = sorted(timings, key=lambda t: t[1], reverse=True)[:3]
+        slow_desc = ", ".join(f"{os.path.basename(p)} {sec:.2f}s" for p, sec, _ in slowest)
+        return f"\n还原 {len(timings)} 个文件，用时 {wall_seconds:.2f}s（最慢: {slow_desc}）"
 
-    def finalize_epub_anchor_translation(self, input_path, output_path):
+    def finalize_epub_anchor_translation(self, input_path, output_path, callback=None, max_workers=None):
         """
         基于锚点的 EPUB 完成逻辑：还原 HTML 并原封不动解压。
         """
@@ -338,70 +1135,28 @@ class Processor:
         if not cache_data:
             raise RuntimeError("No cache found for finalization.")
             
-        temp_dir = cache_data.get("working_dir")
-        if not temp_dir or not os.path.exists(temp_dir):
-            # 如果临时目录丢失（例如被清理了），需要重新解压（虽然这种可能性较小）
-            temp_dir = self.epub_anchor_processor.extract_epub(input_path)
-        
-        self.epub_anchor_processor.temp_dir = temp_dir
+        self._open_package(self.epub_anchor_processor, cache_data, input_path)
         
         # 1. 整理所有翻译后的块
-        all_translated_blocks = {} # index -> text
-        for chunk in cache_data["files"][0]["chunks"]: # epub_anchor 只有一个文件 all_groups
-            g_indices = chunk.get("block_indices", [])
-            full_trans = chunk.get("trans", "")
-            if chunk.get("is_error"):
-                # 移除错误标记前缀
-                full_trans = full_trans.replace("【结构校验失败，请手动检查】\n", "")
-            
-            group_blocks = [{"text": cache_data["all_blocks"][idx]["text"], "formats": cache_data["all_blocks"][idx]["formats"]} for idx in g_indices]
-            translated_texts, ok = self.epub_anchor_processor.validate_and_parse_response(full_trans, group_blocks)
-            
-            if ok:
-                for idx, text in zip(g_indices, translated_texts):
-                    all_translated_blocks[idx] = text
-            else:
-                # 如果校验仍失败，尝试简单回退或按原样
-                pass
+        all_translated_blocks = self._translated_blocks(self.epub_anchor_processor, cache_data)
 
         # 2. 按文件处理还原
-        block_to_file = cache_data.get("block_to_file", {})
-        file_to_blocks = {}
-        for b_idx, rel_path in block_to_file.items():
-            b_idx_int = int(b_idx)
-            if rel_path not in file_to_blocks:
-                file_to_blocks[rel_path] = []
-            file_to_blocks[rel_path].append(b_idx_int)
-            
-        for rel_path, b_indices in file_to_blocks.items():
-            abs_path = os.path.join(temp_dir, rel_path)
-            with open(abs_path, 'r', encoding='utf-8') as f:
-                soup = BeautifulSoup(f, 'html.parser')
-            
-            # 重新定位 soup 中的 blocks
-            soup_blocks = self.epub_anchor_processor.create_blocks_from_soup(soup)
-            
-            # 安全检查：如果当前文件解析出的块数量与缓存记录的不一致，
-            # 说明提取逻辑发生了变化或文件被错误索引，必须跳过以防内容串位（错位到封面等）
-            if len(soup_blocks) != len(b_indices):
-                print(f"WARNING: Block count mismatch in {rel_path}. Cache: {len(b_indices)}, File: {len(soup_blocks)}. Skipping file to prevent corruption.")
-                continue
+        file_to_blocks = {f["rel_path"]: range(*f["block_range"]) for f in cache_data.get("file_ranges", [])}
 
-            # 匹配并还原
-            for i, b_idx in enumerate(b_indices):
-                if b_idx in all_translated_blocks:
-                    # print(f"DEBUG: Restoring block {b_idx} (local {i})")
-                    self.epub_anchor_processor.restore_html(soup_blocks[i], all_translated_blocks[b_idx], soup)
-            
-            # 保存修改后的 XHTML
-            with open(abs_path, 'w', encoding='utf-8') as f:
-                f.write(str(soup))
+        restore_start = time.perf_counter()
+        # 必须使用与提取时相同的解析后端（旧缓存为 html.parser）
+        backend = cache_data.get("parser_backend", "html.parser")
+        timings = self._restore_files("epub_anchor", self.epub_anchor_processor, file_to_blocks, all_translated_blocks, callback, max_workers, backend)
+        self.last_restore_timings = timings
+        report = self._format_restore_report(timings, time.perf_counter() - restore_start)
 
         # 3. 重新打包
-        self.epub_anchor_processor.repack_epub(output_path)
-        return f"Successfully exported to EPUB via Anchor Strategy: {output_path}"
+        with metrics.span("repack_epub"):
+            self.epub_anchor_processor.repack_epub(output_path)
+        self.epub_anchor_processor.archive.close()
+        return f"Successfully exported to EPUB via Anchor Strategy: {output_path}{report}"
 
-    def finalize_docx_anchor_translation(self, input_path, output_path):
+    def finalize_docx_anchor_translation(self, input_path, output_path, callback=None, max_workers=None):
         """
         基于锚点的 DOCX 完成逻辑。
         """
@@ -410,53 +1165,21 @@ class Processor:
         if not cache_data:
             raise RuntimeError("No cache found for finalization.")
             
-        temp_dir = cache_data.get("working_dir")
-        if not temp_dir or not os.path.exists(temp_dir):
-            temp_dir = self.docx_anchor_processor.extract_docx(input_path)
+        self._open_package(self.docx_anchor_processor, cache_data, input_path)
         
         # 1. 整理所有翻译后的块
-        all_translated_blocks = {}
-        for chunk in cache_data["files"][0]["chunks"]:
-            g_indices = chunk.get("block_indices", [])
-            full_trans = chunk.get("trans", "")
-            if chunk.get("is_error"):
-                full_trans = full_trans.replace("【结构校验失败，请手动检查】\n", "")
-            
-            group_blocks = [{"text": cache_data["all_blocks"][idx]["text"], "formats": cache_data["all_blocks"][idx]["formats"]} for idx in g_indices]
-            translated_texts, ok = self.docx_anchor_processor.validate_and_parse_response(full_trans, group_blocks)
-            
-            if ok:
-                for idx, text in zip(g_indices, translated_texts):
-                    all_translated_blocks[idx] = text
+        all_translated_blocks = self._translated_blocks(self.docx_anchor_processor, cache_data)
 
         # 2. 按文件处理还原
-        block_to_file = cache_data.get("block_to_file", {})
-        file_to_blocks = {}
-        for b_idx, rel_path in block_to_file.items():
-            b_idx_int = int(b_idx)
-            if rel_path not in file_to_blocks:
-                file_to_blocks[rel_path] = []
-            file_to_blocks[rel_path].append(b_idx_int)
-            
-        for rel_path, b_indices in file_to_blocks.items():
-            abs_path = os.path.join(temp_dir, rel_path)
-            with open(abs_path, 'r', encoding='utf-8') as f:
-                soup = BeautifulSoup(f, 'xml')
-            
-            soup_blocks = self.docx_anchor_processor.create_blocks_from_soup(soup)
-            
-            if len(soup_blocks) != len(b_indices):
-                print(f"WARNING: Block count mismatch in {rel_path}. Cache: {len(b_indices)}, File: {len(soup_blocks)}.")
-                continue
+        file_to_blocks = {f["rel_path"]: range(*f["block_range"]) for f in cache_data.get("file_ranges", [])}
 
-            for i, b_idx in enumerate(b_indices):
-                if b_idx in all_translated_blocks:
-                    self.docx_anchor_processor.restore_xml(soup_blocks[i], all_translated_blocks[b_idx], soup)
-            
-            # 保存修改后的 XML
-            with open(abs_path, 'w', encoding='utf-8') as f:
-                f.write(str(soup))
+        restore_start = time.perf_counter()
+        timings = self._restore_files("docx_anchor", self.docx_anchor_processor, file_to_blocks, all_translated_blocks, callback, max_workers)
+        self.last_restore_timings = timings
+        report = self._format_restore_report(timings, time.perf_counter() - restore_start)
 
         # 3. 重新打包
-        self.docx_anchor_processor.repack_docx(output_path)
-        return f"Successfully exported to DOCX via Anchor Strategy: {output_path}"
+        with metrics.span("repack_docx"):
+            self.docx_anchor_processor.repack_docx(output_path)
+        self.docx_anchor_processor.archive.close()
+        return f"Successfully exported to DOCX via Anchor Strategy: {output_path}{report}"
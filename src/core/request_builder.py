@@ -0,0 +1,44 @@
+from src.core.grouping import TokenCounter
+
+
+class RequestBuilder:
+    """
+    构造对话请求的 messages，保证可被服务端前缀缓存 (prompt prefix caching) 命中：
+      - 系统提示词只构造一次，每次请求按字节完全相同且始终位于最前
+      - 历史轮次按时间从旧到新排列，同一组历史生成的消息完全相同
+      - 只随分组变化的内容（本组原文）放在最后
+    """
+
+    def __init__(self, system_prompt):
+        self.system_message = {"role": "system", "content": system_prompt}
+
+    def build(self, current_text, history=None):
+        messages = [self.system_message]
+        # Standard multi-turn dialogue context
+        for h_orig, h_trans in history or ():
+            if h_orig and h_trans:
+                messages.append({"role": "user", "content": h_orig})
+                messages.append({"role": "assistant", "content": h_trans})
+        messages.append({"role": "user", "content": current_text})
+        return messages
+
+    @staticmethod
+    def estimate_tokens(messages):
+        """TPM 限速用的输入 token 估算"""
+        return TokenCounter.estimate("".join(m["content"] for m in messages))
+
+    @staticmethod
+    def read_usage(usage):
+        """
+        从响应的 usage 中读取 输入 / 其中命中前缀缓存 / 输出 token 数。
+        命中数兼容 OpenAI 的 prompt_tokens_details.cached_tokens 与 DeepSeek 的 prompt_cache_hit_tokens。
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+        if cached is None:
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        return {
+            "input": getattr(usage, "prompt_tokens", 0) or 0,
+            "cached": cached or 0,
+            "output": getattr(usage, "completion_tokens", 0) or 0,
+        }
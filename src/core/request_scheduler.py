@@ -0,0 +1,263 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+import openai
+
+from src.core.metrics import metrics
+
+
+class TranslationError(Exception):
+    """
+    一次翻译请求的最终失败。retryable 为 True 表示暂时性故障（限流、超时、服务端错误、
+    熔断），该分组应标记为可重试而不是写入任何伪造的译文。
+    """
+
+    def __init__(self, message, retryable=False, status_code=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status_code = status_code
+
+
+class RateLimiter:
+    """
+    每分钟请求数 (RPM) 与每分钟 token 数 (TPM) 限制，令牌桶实现，线程安全。
+    rpm / tpm 为 0 表示不限制。
+    """
+
+    def __init__(self, rpm=0, tpm=0, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self._lock = threading.Lock()
+        now = clock()
+        # 桶初始为满，允许开头的一次突发
+        self._buckets = {"requests": [float(rpm), now], "tokens": [float(tpm), now]}
+
+    def _refill(self, name, capacity, now):
+        bucket = self._buckets[name]
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * capacity / 60.0)
+        bucket[1] = now
+        return bucket
+
+    def reserve(self, tokens=0):
+        """预占一次请求的额度，返回需要等待的秒数（额度已扣除，可能为负数的余额由后续补充）"""
+        with self._lock:
+            now = self.clock()
+            wait_time = 0.0
+            for name, capacity, amount in (("requests", self.rpm, 1), ("tokens", self.tpm, tokens)):
+                if not capacity or not amount:
+                    continue
+                bucket = self._refill(name, capacity, now)
+                # 超过桶容量的单次请求按满桶计，避免永远等待
+                amount = min(amount, capacity)
+                bucket[0] -= amount
+                if bucket[0] < 0:
+                    wait_time = max(wait_time, -bucket[0] * 60.0 / capacity)
+            return wait_time
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续 failure_threshold 次暂时性失败后断开 reset_timeout 秒，
+    期间所有请求等待而不是继续冲击服务端；之后放行一次试探请求（半开），
+    成功则恢复，失败则再次断开。
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.clock() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def wait_time(self):
+        """返回发出请求前需要等待的秒数；半开状态下只有一个线程获准试探"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if remaining > 0:
+                return remaining
+            if self._probing:
+                # 其他线程正在试探，稍后再看结果
+                return min(1.0, self.reset_timeout)
+            self._probing = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release(self):
+        """请求得到与服务端健康无关的结果（如 400）：不改变熔断状态，只交还半开状态的试探名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._probing = False
+
+
+class RequestScheduler:
+    """
+    为 API 请求提供：指数退避 + 随机抖动重试、Retry-After 头处理、RPM/TPM 限速与熔断。
+    同一端点的多个 Translator（并发分组、多本书）应共用同一个实例，限速与熔断才是全局的。
+    """
+
+    RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0, rate_limiter=None, breaker=None,
+                 sleep=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker or CircuitBreaker()
+        self._cancel = threading.Event()
+        self._sleep = sleep
+        self.retries = 0
+
+    def cancel(self):
+        """中断所有正在等待（退避、限速、熔断）的请求"""
+        self._cancel.set()
+
+    def reset(self):
+        self._cancel.clear()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def wait(self, seconds):
+        if seconds <= 0:
+            return
+        if self._sleep:
+            self._sleep(seconds)
+        else:
+            self._cancel.wait(seconds)
+        if self._cancel.is_set():
+            raise TranslationError("请求已取消", retryable=True)
+
+    @classmethod
+    def classify(cls, error):
+        """返回 (是否可重试, HTTP 状态码)"""
+        if isinstance(error, TranslationError):
+            return error.retryable, error.status_code
+        if isinstance(error, (openai.APIConnectionError, ConnectionError, TimeoutError)):
+            # 包括 APITimeoutError
+            return True, None
+        if any(c.__name__ == "TransportError" for c in type(error).__mro__):
+            # 流式读取时 HTTP 库直接抛出的连接中断（httpx 及其分支版本）
+            return True, None
+        status = getattr(error, "status_code", None)
+        if status is not None:
+            return status in cls.RETRYABLE_STATUS or status >= 500, status
+        return False, None
+
+    @staticmethod
+    def retry_after(error):
+        """从错误响应中读取服务端建议的等待秒数（retry-after-ms / Retry-After 秒数或 HTTP 日期）"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after-ms")
+        if value:
+            try:
+                return float(value) / 1000.0
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def backoff(self, attempt):
+        """第 attempt 次重试的等待时间：指数增长，取上限后在 [一半, 全部] 之间随机抖动"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def acquire(self, tokens=0):
+        """发出一次请求前等待熔断恢复与限速额度"""
+        while True:
+            pause = self.breaker.wait_time()
+            if pause <= 0:
+                break
+            self.wait(pause)
+        if self.rate_limiter:
+            self.wait(self.rate_limiter.reserve(tokens))
+
+    def retry_delay(self, error, attempt, transient=False):
+        """
+        记录第 attempt 次尝试的失败，返回重试前应等待的秒数；
+        不可重试或重试次数已用尽时抛出 TranslationError。
+        transient 为 True 时没有状态码的错误（如流式读取中断）也按暂时性故障处理。
+        """
+        retryable, status = self.classify(error)
+        retryable = retryable or (transient and status is None)
+        if not retryable:
+            # 服务端有响应（如 400），不计入熔断，也不让熔断器恢复
+            self.breaker.release()
+            raise TranslationError(str(error), retryable=False, status_code=status) from error
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            raise TranslationError(f"重试 {attempt} 次后仍失败: {error}", retryable=True, status_code=status) from error
+        delay = self.retry_after(error)
+        if delay is None:
+            delay = self.backoff(attempt)
+        delay = min(delay, self.max_delay)
+        print(f"WARNING: Request failed ({status or type(error).__name__}), retrying in {delay:.1f}s: {error}")
+        self.retries += 1
+        metrics.count("retries")
+        return delay
+
+    def call(self, fn, tokens=0):
+        """执行 fn，暂时性失败时按策略重试；最终失败抛出 TranslationError"""
+        if self.cancelled:
+            raise TranslationError("请求已取消", retryable=True)
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self.wait(self.retry_delay(e, attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+
+def build_scheduler(settings):
+    """根据界面/命令行的设置字典构建请求调度器"""
+    rpm = settings.get('rpm', 0)
+    tpm = settings.get('tpm', 0)
+    return RequestScheduler(
+        max_retries=settings.get('max_retries', 5),
+        rate_limiter=RateLimiter(rpm, tpm) if (rpm or tpm) else None,
+    )
@@ -0,0 +1,68 @@
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+
+class TranslationMemory:
+    """
+    基于内容寻址的持久化翻译记忆 (SQLite)。
+    键为 规范化块文本 + 模型 + 提示词 + 温度 的哈希，值为该块带锚点的译文。
+    同一缓存目录下的所有书籍共享同一个记忆库。
+    与书内去重（Processor.dedupe_key）不同，键不含锚点的格式：运行时查询的块只有文本与锚点数，
+    译文中的锚点在导出时按各块自己的格式还原。
+    """
+
+    DB_NAME = "translation_memory.db"
+
+    def __init__(self, cache_dir, model, prompt, temperature):
+        self.path = os.path.join(cache_dir, self.DB_NAME)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS memory (key TEXT PRIMARY KEY, trans TEXT NOT NULL)")
+        self.conn.commit()
+
+        # 模型、提示词、温度任一变化都视为不同的翻译上下文
+        self.context = hashlib.sha256(
+            f"{model}\x00{float(temperature)}\x00{prompt}".encode('utf-8')
+        ).hexdigest()
+        self.lookups = 0
+        self.hits = 0
+
+    @staticmethod
+    def normalize(text):
+        """规范化块文本：合并连续空白并去除首尾空白"""
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def make_key(self, text):
+        return hashlib.sha256(f"{self.context}\x00{self.normalize(text)}".encode('utf-8')).hexdigest()
+
+    def get_many(self, texts):
+        """批量查询，返回与 texts 等长的译文列表，未命中为 None"""
+        keys = [self.make_key(t) for t in texts]
+        found = {}
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, trans in self.conn.execute(
+                        f"SELECT key, trans FROM memory WHERE key IN ({placeholders})", batch):
+                    found[key] = trans
+            self.lookups += len(keys)
+            self.hits += sum(1 for k in keys if k in found)
+        return [found.get(k) for k in keys]
+
+    def put_many(self, pairs):
+        """写入 (原文块文本, 译文) 对"""
+        rows = [(self.make_key(orig), trans) for orig, trans in pairs]
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO memory (key, trans) VALUES (?, ?)", rows)
+            self.conn.commit()
+
+    def stats(self):
+        return {"lookups": self.lookups, "hits": self.hits}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
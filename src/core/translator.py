@@ -1,69 +1,165 @@
 from openai import OpenAI
+import re
 import json
+import time
+import contextlib
+from src.core.endpoint_capabilities import EndpointCapabilities
+from src.core.request_scheduler import RequestScheduler, TranslationError
+from src.core.request_builder import RequestBuilder
+from src.core.metrics import metrics
+
+class OutputTruncated(Exception):
+    """流式响应因输出长度上限 (finish_reason == "length") 提前结束，在产出全部译文之后抛出"""
+
+
+# 未指定时在进程内共享，至少保证同一次运行只探测一次
+_default_capabilities = EndpointCapabilities()
 
 class Translator:
-    def __init__(self, api_key, base_url, model, temperature, system_prompt):
-        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=1800.0)
+    # 关闭思考模式的几种请求写法，按优先级依次探测
+    # 带 usage 的写法额外请求在流末尾返回 token 用量（含前缀缓存命中数），不支持时退回不带 usage 的写法
+    USAGE_OPTIONS = {"stream_options": {"include_usage": True}}
+    REQUEST_VARIANTS = (
+        ("thinking_object+usage", {"thinking": {"type": "disabled"}, **USAGE_OPTIONS}),
+        ("thinking_string+usage", {"thinking": "disabled", **USAGE_OPTIONS}),
+        ("plain+usage", USAGE_OPTIONS),
+        ("thinking_object", {"thinking": {"type": "disabled"}}), # Doubao-style nested object (Standard for newer models)
+        ("thinking_string", {"thinking": "disabled"}),
+        ("plain", None),                                          # 不带 thinking 参数
+    )
+
+    def __init__(self, api_key, base_url, model, temperature, system_prompt, request_limiter=None, capabilities=None, scheduler=None):
+        # 重试统一由 RequestScheduler 负责，关闭 SDK 自带的重试
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=1800.0, max_retries=0)
+        self.base_url = base_url
         self.model = model
         self.temperature = float(temperature)
         self.system_prompt = system_prompt
+        self.request_builder = RequestBuilder(system_prompt)
+        # 可选的共享信号量：多本书/多个 Translator 共用时限制全局同时进行的请求数
+        self.request_limiter = request_limiter
+        self.capabilities = capabilities or _default_capabilities
+        self.scheduler = scheduler or RequestScheduler()
 
-    def translate_chunk(self, current_text, history=None):
-        messages = [
-            {"role": "system", "content": self.system_prompt}
-        ]
-        
-        # Standard multi-turn dialogue context
-        if history:
-            for h_orig, h_trans in history:
-                if h_orig and h_trans:
-                    messages.append({"role": "user", "content": h_orig})
-                    messages.append({"role": "assistant", "content": h_trans})
-            
-        messages.append({"role": "user", "content": current_text})
-        
-        try:
+    def translate_chunk(self, current_text, history=None, usage=None, on_restart=None):
+        """
+        流式翻译，逐段产出译文。请求最终失败时抛出 TranslationError
+        （retryable 表示是否为暂时性故障），不再把错误信息当作译文返回；
+        输出被长度上限截断时在最后抛出 OutputTruncated。
+        传入 usage 字典时，端点返回用量后写入 input / cached / output token 数。
+        流式传输中断后会按调度器的退避策略重新请求，重新请求前调用 on_restart()，
+        调用方应丢弃此前收到的增量。
+        """
+        yield from self._stream_chunk(current_text, history, usage, on_restart)
+
+    # 400 响应中表示请求参数不被接受的说法；上下文超长、内容审核等其他 400 不会因换一种写法而成功
+    PARAMETER_REJECTION = re.compile(
+        r"unsupported|not supported|unrecognized|unknown (parameter|field|argument)|invalid.?param|"
+        r"extra (fields|inputs)|additional properties|unexpected (keyword|field|parameter)|"
+        r"not permitted|\bthinking\b|stream_options", re.IGNORECASE)
+
+    @classmethod
+    def _is_rejected_variant(cls, e):
+        """端点以 400 拒绝了请求中的某个参数，换用其他写法可能成功"""
+        return getattr(e, "status_code", None) == 400 and cls.PARAMETER_REJECTION.search(str(e)) is not None
+
+    def _request(self, messages, extra_body):
+        kwargs = {"model": self.model, "messages": messages, "temperature": self.temperature, "stream": True}
+        if extra_body is not None:
+            kwargs["extra_body"] = extra_body
+        return self.client.chat.completions.create(**kwargs)
+
+    def _create_stream(self, messages):
+        """
+        使用该端点已知可用的请求写法；未知或已失效（参数被 400 拒绝）时在探测锁内依次尝试各写法，
+        并记录第一个被接受的写法。其他错误（含上下文超长等 400）立即抛出。
+        """
+        variants = dict(self.REQUEST_VARIANTS)
+        known = self.capabilities.get(self.base_url, self.model)
+        if known in variants:
             try:
-                # 1. Try Doubao-style nested object (Standard for newer models)
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    stream=True,
-                    extra_body={
-                        "thinking": {"type": "disabled"}
-                    }
-                )
-            except Exception as e1:
-                # 2. Try string style as fallback
-                if "400" in str(e1) or "BadRequest" in str(e1) or "InvalidParameter" in str(e1):
-                    try:
-                        response = self.client.chat.completions.create(
-                            model=self.model,
-                            messages=messages,
-                            temperature=self.temperature,
-                            stream=True,
-                            extra_body={
-                                "thinking": "disabled"
-                            }
-                        )
-                    except Exception as e2:
-                        # 3. Final fallback: retry without thinking parameter
-                        if "400" in str(e2) or "BadRequest" in str(e2) or "InvalidParameter" in str(e2):
-                            response = self.client.chat.completions.create(
-                                model=self.model,
-                                messages=messages,
-                                temperature=self.temperature,
-                                stream=True
-                            )
-                        else:
-                            raise e2
-                else:
-                    raise e1
+                return self._request(messages, variants[known])
+            except Exception as e:
+                if not self._is_rejected_variant(e):
+                    raise
+        else:
+            known = None
+
+        with self.capabilities.probe_lock(self.base_url, self.model):
+            # 等待期间其他线程可能已完成探测
+            current = self.capabilities.get(self.base_url, self.model)
+            if current in variants and current != known:
+                return self._request(messages, variants[current])
+            last_error = None
+            for name, extra_body in self.REQUEST_VARIANTS:
+                if name == known:
+                    # 刚刚已被拒绝
+                    continue
+                try:
+                    response = self._request(messages, extra_body)
+                except Exception as e:
+                    if not self._is_rejected_variant(e):
+                        raise
+                    last_error = e
+                    continue
+                self.capabilities.set(self.base_url, self.model, name)
+                return response
+            raise last_error
+
+    def _stream_chunk(self, current_text, history=None, usage=None, on_restart=None):
+        messages = self.request_builder.build(current_text, history)
+        
+        # TPM 限速按 输入 + 同等长度输出 估算
+        tokens = RequestBuilder.estimate_tokens(messages) * 2
+        scheduler = self.scheduler
+        if scheduler.cancelled:
+            raise TranslationError("请求已取消", retryable=True)
+        # 首字时间包含限速、熔断等待与重试
+        start = time.perf_counter()
+        first_token = None
+        # 建立连接与读取整个流算作一次尝试：中途断开时整组重新请求
+        attempt = 0
+        while True:
+            scheduler.acquire(tokens)
+            finish_reason = None
+            chars = 0
+            request_usage = {}
+            stream_started = False
+            error = None
+            # 共享名额只在每次尝试的流式响应期间占用，退避与 Retry-After 等待时释放给其他分组
+            with self.request_limiter or contextlib.nullcontext():
+                try:
+                    response = self._create_stream(messages)
+                    stream_started = True
+                    for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if first_token is None:
+                                first_token = time.perf_counter()
+                                metrics.record("ttft", first_token - start)
+                            chars += len(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                        if chunk.choices and chunk.choices[0].finish_reason:
+                            finish_reason = chunk.choices[0].finish_reason
+                        if getattr(chunk, "usage", None):
+                            request_usage = RequestBuilder.read_usage(chunk.usage)
+                except Exception as e:
+                    error = e
+            if error is None:
+                scheduler.breaker.record_success()
+                break
+            if stream_started:
+                print(f"翻译出错: 流式响应中断: {error}")
+            # 请求已被接受后没有状态码的中断视为暂时性故障
+            scheduler.wait(scheduler.retry_delay(error, attempt, transient=stream_started))
+            attempt += 1
+            if chars and on_restart:
+                on_restart()
 
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-        except Exception as e:
-            print(f"翻译出错: {e}")
-            yield f"[翻译错误: {e}]"
+        if usage is not None:
+            usage.update(request_usage)
+        if first_token is not None:
+            metrics.record("stream", time.perf_counter() - first_token, chars=chars,
+                           **{f"{k}_tokens": v for k, v in request_usage.items()})
+        if finish_reason == "length":
+            # 已产出的译文全部有效，只是被输出长度上限截断
+            raise OutputTruncated("响应达到输出长度上限被截断")
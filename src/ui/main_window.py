@@ -2,23 +2,30 @@ from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QTextEdit, 
                              QComboBox, QFileDialog, QSplitter, QProgressBar,
                              QMessageBox, QGroupBox, QSpinBox, QDoubleSpinBox,
-                             QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QCheckBox)
-from PySide6.QtCore import Qt, QThread, Signal, QCoreApplication
-from PySide6.QtGui import QFont, QIcon
+                             QTableView, QHeaderView, QAbstractItemView, QCheckBox)
+from PySide6.QtCore import Qt, QThread, Signal, QCoreApplication, QTimer
+from PySide6.QtGui import QFont, QIcon, QTextCursor
 import os
 import sys
 import shutil
 
 from src.core.config_manager import ConfigManager
 from src.core.translator import Translator
+from src.core.endpoint_capabilities import EndpointCapabilities
+from src.core.request_scheduler import build_scheduler
 from src.core.processor import Processor
+from src.core.grouping import build_grouper, TokenGrouper
+from src.ui.table_models import GroupTableModel, BlockTableModel
+from src.config import (DEFAULT_MAX_WORKERS, DEFAULT_CONTEXT_TOKENS, DEFAULT_MAX_OUTPUT_TOKENS, STREAM_UI_FPS,
+                        DEFAULT_MAX_RETRIES, DEFAULT_RPM, DEFAULT_TPM, DEFAULT_HISTORY_TOKENS)
 
 class TranslationWorker(QThread):
     progress = Signal(int, int, str, str, bool) # current_idx, total, orig, trans, is_finished
     finished = Signal(bool)
     error = Signal(str)
 
-    def __init__(self, processor, translator, epub_path, max_chars, context_rounds=1, target_indices=None):
+    def __init__(self, processor, translator, epub_path, max_chars, context_rounds=1, target_indices=None, max_workers=1,
+                 history_tokens=0):
         super().__init__()
         self.processor = processor
         self.translator = translator
@@ -26,6 +33,8 @@ class TranslationWorker(QThread):
         self.max_chars = max_chars
         self.context_rounds = context_rounds
         self.target_indices = target_indices
+        self.max_workers = max_workers
+        self.history_tokens = history_tokens
 
     def run(self):
         try:
@@ -35,7 +44,9 @@ class TranslationWorker(QThread):
                 self.translator,
                 context_rounds=self.context_rounds,
                 callback=self.progress.emit,
-                target_indices=self.target_indices
+                target_indices=self.target_indices,
+                max_workers=self.max_workers,
+                history_tokens=self.history_tokens
             )
             self.finished.emit(result)
         except Exception as e:
@@ -128,12 +139,65 @@ class MainWindow(QMainWindow):
         row1.addWidget(QLabel("分块:"))
         row1.addWidget(self.chunk_size_spin, 1)
         self.context_rounds_spin = QSpinBox()
-        self.context_rounds_spin.setRange(1, 5)
+        self.context_rounds_spin.setRange(0, 5)
         self.context_rounds_spin.setValue(1)
         row1.addWidget(QLabel("上下文轮数:"))
         row1.addWidget(self.context_rounds_spin, 0)
+        self.history_tokens_spin = QSpinBox()
+        self.history_tokens_spin.setRange(0, 200000)
+        self.history_tokens_spin.setSingleStep(500)
+        self.history_tokens_spin.setValue(DEFAULT_HISTORY_TOKENS)
+        self.history_tokens_spin.setToolTip("上下文历史的 token 预算，超出时只保留前序分组末尾的块。0 为包含完整的前序分组。")
+        row1.addWidget(QLabel("历史预算:"))
+        row1.addWidget(self.history_tokens_spin, 0)
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 64)
+        self.workers_spin.setValue(DEFAULT_MAX_WORKERS)
+        self.workers_spin.setToolTip("同时发送的分组请求数。上下文轮数为 0 时各分组可完全并行。")
+        row1.addWidget(QLabel("并发数:"))
+        row1.addWidget(self.workers_spin, 0)
         config_layout.addLayout(row1)
 
+        row2 = QHBoxLayout()
+        self.token_group_check = QCheckBox("按 Token 分组")
+        self.token_group_check.setToolTip("按 token 预算分组（计入提示词、上下文轮数与预计译文长度），不再使用分块字符数。\n安装 tiktoken 且编码表可用时精确计数，否则为离线估算。")
+        self.token_group_check.toggled.connect(self.on_token_grouping_toggled)
+        row2.addWidget(self.token_group_check)
+        self.context_tokens_spin = QSpinBox()
+        self.context_tokens_spin.setRange(1000, 2000000)
+        self.context_tokens_spin.setSingleStep(1000)
+        self.context_tokens_spin.setValue(DEFAULT_CONTEXT_TOKENS)
+        row2.addWidget(QLabel("上下文窗口:"))
+        row2.addWidget(self.context_tokens_spin, 0)
+        self.output_tokens_spin = QSpinBox()
+        self.output_tokens_spin.setRange(256, 200000)
+        self.output_tokens_spin.setSingleStep(256)
+        self.output_tokens_spin.setValue(DEFAULT_MAX_OUTPUT_TOKENS)
+        row2.addWidget(QLabel("输出上限:"))
+        row2.addWidget(self.output_tokens_spin, 0)
+        row2.addStretch(1)
+        self.rpm_spin = QSpinBox()
+        self.rpm_spin.setRange(0, 100000)
+        self.rpm_spin.setValue(DEFAULT_RPM)
+        self.rpm_spin.setToolTip("每分钟请求数上限，0 为不限")
+        row2.addWidget(QLabel("RPM:"))
+        row2.addWidget(self.rpm_spin, 0)
+        self.tpm_spin = QSpinBox()
+        self.tpm_spin.setRange(0, 100000000)
+        self.tpm_spin.setSingleStep(10000)
+        self.tpm_spin.setValue(DEFAULT_TPM)
+        self.tpm_spin.setToolTip("每分钟 token 数上限（估算），0 为不限")
+        row2.addWidget(QLabel("TPM:"))
+        row2.addWidget(self.tpm_spin, 0)
+        self.retries_spin = QSpinBox()
+        self.retries_spin.setRange(0, 20)
+        self.retries_spin.setValue(DEFAULT_MAX_RETRIES)
+        self.retries_spin.setToolTip("限流、超时、服务端错误时的最大重试次数（指数退避）")
+        row2.addWidget(QLabel("重试:"))
+        row2.addWidget(self.retries_spin, 0)
+        config_layout.addLayout(row2)
+        self.on_token_grouping_toggled(False)
+
         prompt_layout = QHBoxLayout()
         from src.config import DEFAULT_PROMPT
         self.prompt_edit = QTextEdit(DEFAULT_PROMPT)
@@ -159,14 +223,17 @@ class MainWindow(QMainWindow):
         group_layout = QVBoxLayout(group_widget)
         group_layout.setContentsMargins(0,0,0,0)
         
-        self.group_table = QTableWidget()
-        self.group_table.setColumnCount(3)
-        self.group_table.setHorizontalHeaderLabels(["ID", "状态", "分组预览"])
+        self.group_model = GroupTableModel(self)
+        self.group_table = QTableView()
+        self.group_table.setModel(self.group_model)
         self.group_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
         self.group_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
         self.group_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        # 列宽只按可见行计算、行高固定，避免视图为计算尺寸逐行读取数据
+        self.group_table.horizontalHeader().setResizeContentsPrecision(0)
+        self.group_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.group_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.group_table.itemSelectionChanged.connect(self.on_group_selection_changed)
+        self.group_table.selectionModel().selectionChanged.connect(self.on_group_selection_changed)
         
         group_layout.addWidget(QLabel("1. 逻辑分组 (API 单元)"))
         group_layout.addWidget(self.group_table, 1)
@@ -177,10 +244,11 @@ class MainWindow(QMainWindow):
         block_layout = QVBoxLayout(block_widget)
         block_layout.setContentsMargins(0,0,0,0)
         
-        self.block_table = QTableWidget()
-        self.block_table.setColumnCount(2)
-        self.block_table.setHorizontalHeaderLabels(["ID", "内容预览"])
+        self.block_model = BlockTableModel(self)
+        self.block_table = QTableView()
+        self.block_table.setModel(self.block_model)
         self.block_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        self.block_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.block_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.block_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         
@@ -270,6 +338,17 @@ class MainWindow(QMainWindow):
         self.worker = None
         self.processor = None
         self.current_cache_data = None
+        # 编辑器中改过但尚未保存的分组 (文件索引, 分组索引)
+        self.edited_chunks = set()
+
+        # 流式译文缓冲：stream_pending 为待刷新的增量，stream_texts 为已刷新到界面的部分
+        self.stream_pending = {}
+        self.stream_texts = {}
+        self.stream_total = 0
+        self.stream_last_idx = 0
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setInterval(1000 // STREAM_UI_FPS)
+        self.stream_timer.timeout.connect(self.flush_stream)
 
     def update_status(self, text):
         """更新底部的状态标签并强制刷新 UI"""
@@ -323,6 +402,14 @@ class MainWindow(QMainWindow):
         self.prompt_edit.setPlainText(s.get('prompt') or DEFAULT_PROMPT)
         self.chunk_size_spin.setValue(s['chunk_size'])
         self.context_rounds_spin.setValue(s.get('context_rounds', 1))
+        self.history_tokens_spin.setValue(s.get('history_tokens', DEFAULT_HISTORY_TOKENS))
+        self.workers_spin.setValue(s.get('max_workers', DEFAULT_MAX_WORKERS))
+        self.token_group_check.setChecked(s.get('token_grouping', False))
+        self.context_tokens_spin.setValue(s.get('context_tokens', DEFAULT_CONTEXT_TOKENS))
+        self.output_tokens_spin.setValue(s.get('max_output_tokens', DEFAULT_MAX_OUTPUT_TOKENS))
+        self.rpm_spin.setValue(s.get('rpm', DEFAULT_RPM))
+        self.tpm_spin.setValue(s.get('tpm', DEFAULT_TPM))
+        self.retries_spin.setValue(s.get('max_retries', DEFAULT_MAX_RETRIES))
 
     def get_current_settings(self):
         return {
@@ -332,9 +419,22 @@ class MainWindow(QMainWindow):
             'temp': self.temp_spin.value(),
             'prompt': self.prompt_edit.toPlainText(),
             'chunk_size': self.chunk_size_spin.value(),
-            'context_rounds': self.context_rounds_spin.value()
+            'context_rounds': self.context_rounds_spin.value(),
+            'history_tokens': self.history_tokens_spin.value(),
+            'max_workers': self.workers_spin.value(),
+            'token_grouping': self.token_group_check.isChecked(),
+            'context_tokens': self.context_tokens_spin.value(),
+            'max_output_tokens': self.output_tokens_spin.value(),
+            'rpm': self.rpm_spin.value(),
+            'tpm': self.tpm_spin.value(),
+            'max_retries': self.retries_spin.value()
         }
 
+    def on_token_grouping_toggled(self, checked):
+        self.chunk_size_spin.setEnabled(not checked)
+        self.context_tokens_spin.setEnabled(checked)
+        self.output_tokens_spin.setEnabled(checked)
+
     def on_history_selected(self, index):
         if index >= 0:
             s = self.history_combo.itemData(index)
@@ -343,7 +443,7 @@ class MainWindow(QMainWindow):
     def prepare_chunks_only(self):
         result = self.init_processor_and_chunks()
         if result:
-            self.status_label.setText("分块与分组完成。")
+            self.status_label.setText(f"分块与分组完成。{self.format_memory_stats()}")
             self.btn_translate_sel.setEnabled(True)
             self.btn_output.setEnabled(True)
 
@@ -362,52 +462,53 @@ class MainWindow(QMainWindow):
             if not autoload:
                 self.status_label.setText(f"正在执行分块解析...")
             
+            # 分组时查询翻译记忆（与当前模型/提示词/温度绑定）
+            memory = None
+            if not autoload:
+                memory = self.processor.open_memory(settings['model'], settings['prompt'], settings['temp'])
+            
+            grouper = None
+            if not autoload:
+                stats = self.processor.group_stats
+                grouper = build_grouper(settings, stats)
+                if isinstance(grouper, TokenGrouper):
+                    self.update_status(grouper.counter.describe())
+                if stats.scale(settings['model']) < 1:
+                    self.update_status(f"模型历史校验失败率 {stats.failure_rate(settings['model']):.0%}，"
+                                       f"分组大小自动缩小为设置值的 {stats.scale(settings['model']):.0%}")
             ext = os.path.splitext(file_path)[1].lower()
             if ext == ".docx":
                 self.current_mode = "docx_anchor"
                 cache_data = self.processor.process_docx_anchor_init(
-                    file_path, settings['chunk_size'], only_load=autoload, callback=self.update_status
+                    file_path, settings['chunk_size'], only_load=autoload, callback=self.update_status, memory=memory, grouper=grouper
                 )
             elif ext == ".epub":
                 self.current_mode = "epub_anchor"
                 cache_data = self.processor.process_epub_anchor_init(
-                    file_path, settings['chunk_size'], only_load=autoload, callback=self.update_status
+                    file_path, settings['chunk_size'], only_load=autoload, callback=self.update_status, memory=memory, grouper=grouper
                 )
             else:
                 self.update_status(f"错误: 不支持的文件格式: {ext}")
                 return False
+            if memory:
+                memory.close()
             
             if cache_data is None:
                 if autoload: return False
                 # Should have been handled by processor raising error or returning None if logic failed
                 return False
 
-            self.flat_chunks = []
-            self.group_table.setRowCount(0)
-            self.group_table.blockSignals(True)
-            
-            row = 0
-            for f_i, f_data in enumerate(cache_data["files"]):
-                for c_i, c_data in enumerate(f_data["chunks"]):
-                    self.flat_chunks.append((f_i, c_i))
-                    
-                    self.group_table.insertRow(row)
-                    # ID
-                    self.group_table.setItem(row, 0, QTableWidgetItem(str(row + 1)))
-                    # Status
-                    status_str = "已翻译" if c_data["trans"] else "未翻译"
-                    self.group_table.setItem(row, 1, QTableWidgetItem(status_str))
-                    # Preview
-                    preview = c_data["orig"][:50].replace("\n", " ") + "..."
-                    self.group_table.setItem(row, 2, QTableWidgetItem(preview))
-                    
-                    row += 1
-            
-            self.group_table.blockSignals(False)
+            # 表格只持有缓存数据的引用，各行内容在显示时才计算
             self.current_cache_data = cache_data
+            # 编辑器中的内容属于旧的缓存数据，不再写回
+            if hasattr(self, 'current_indices'):
+                del self.current_indices
+            self.edited_chunks.clear()
+            self.group_model.set_cache_data(cache_data)
+            self.flat_chunks = self.group_model.flat_chunks
             
             # Select first row if exists
-            if row > 0:
+            if self.flat_chunks:
                 self.group_table.selectRow(0)
             
             if autoload:
@@ -421,12 +522,11 @@ class MainWindow(QMainWindow):
                 QMessageBox.critical(self, "错误", f"分块处理失败: {e}")
             return False
 
+    def selected_group_rows(self):
+        return sorted(index.row() for index in self.group_table.selectionModel().selectedRows())
+
     def on_group_selection_changed(self):
-        selected_items = self.group_table.selectedItems()
-        if not selected_items: return
-        
-        # Determine unique rows
-        rows = sorted(list(set(item.row() for item in selected_items)))
+        rows = self.selected_group_rows()
         if not rows: return
         
         # Preview first selected row
@@ -440,31 +540,15 @@ class MainWindow(QMainWindow):
     def update_block_table(self, group_idx):
         if not hasattr(self, 'flat_chunks') or not self.current_cache_data: return
         
-        f_idx, g_idx = self.flat_chunks[group_idx]
-        group = self.current_cache_data["files"][f_idx]["chunks"][g_idx]
-        block_indices = group.get("block_indices", [])
-        
-        self.block_table.setRowCount(0)
-        self.block_table.blockSignals(True)
-        for i, b_idx in enumerate(block_indices):
-            self.block_table.insertRow(i)
-            self.block_table.setItem(i, 0, QTableWidgetItem(str(b_idx + 1)))
-            
-            block_meta = self.current_cache_data["all_blocks"][b_idx]
-            preview = block_meta["text"][:100].replace("\n", " ")
-            self.block_table.setItem(i, 1, QTableWidgetItem(preview))
-        self.block_table.blockSignals(False)
+        group = self.group_model.chunk(group_idx)
+        self.block_model.set_group(self.current_cache_data, group.get("block_indices", []))
 
     def load_group_into_editor(self, flat_idx):
         if not hasattr(self, 'flat_chunks') or not self.flat_chunks: return
         
         # 1. Before loading new, SYNC current editor content back to memory 
-        # (Only if we were already viewing/editing something)
-        if hasattr(self, 'current_indices') and self.current_cache_data:
-             old_f_idx, old_c_idx = self.current_indices
-             # Update the in-memory structure with what's currently in the trans text edit
-             # This ensures that even without clicking "Save", the changes aren't lost when clicking other rows
-             self.current_cache_data["files"][old_f_idx]["chunks"][old_c_idx]["trans"] = self.trans_text_edit.toPlainText()
+        # This ensures that even without clicking "Save", the changes aren't lost when clicking other rows
+        self.sync_editor_to_memory()
         
         ch_idx, ck_idx = self.flat_chunks[flat_idx]
         cache_data = self.current_cache_data
@@ -472,7 +556,11 @@ class MainWindow(QMainWindow):
         if cache_data and ch_idx < len(cache_data["files"]):
             chunk = cache_data["files"][ch_idx]["chunks"][ck_idx]
             self.orig_text_edit.setPlainText(chunk["orig"])
-            self.trans_text_edit.setPlainText(chunk["trans"])
+            if flat_idx in self.stream_texts:
+                # 正在流式翻译的分组：显示已刷新的部分，剩余增量由 flush_stream 继续追加
+                self.trans_text_edit.setPlainText("".join(self.stream_texts[flat_idx]))
+            else:
+                self.trans_text_edit.setPlainText(chunk["trans"])
             self.current_indices = (ch_idx, ck_idx)
             self.current_flat_idx_view = flat_idx # track which row is in editor
             self.status_label.setText(f"查看：ID {flat_idx + 1}")
@@ -482,8 +570,7 @@ class MainWindow(QMainWindow):
         if not self.init_processor_and_chunks(): return # Ensure init (though mostly redundant if already loaded)
         
         # Get selected rows
-        selected_items = self.group_table.selectedItems()
-        rows = sorted(list(set(item.row() for item in selected_items)))
+        rows = self.selected_group_rows()
         
         if not rows:
             QMessageBox.warning(self, "提示", "请先在列表中选择要翻译的块")
@@ -495,7 +582,9 @@ class MainWindow(QMainWindow):
             settings['api_url'], 
             settings['model'], 
             settings['temp'], 
-            settings['prompt']
+            settings['prompt'],
+            capabilities=EndpointCapabilities(self.cache_path_edit.text()),
+            scheduler=build_scheduler(settings)
         )
         
         file_path = self.epub_path_edit.text()
@@ -513,6 +602,8 @@ class MainWindow(QMainWindow):
             settings['chunk_size'],
             context_rounds=settings['context_rounds'],
             target_indices=rows, # Pass list of flat indices
+            max_workers=settings['max_workers'],
+            history_tokens=settings['history_tokens'],
         )
         self.worker.progress.connect(self.on_progress)
         self.worker.finished.connect(self.on_finished)
@@ -537,7 +628,9 @@ class MainWindow(QMainWindow):
             settings['api_url'], 
             settings['model'], 
             settings['temp'], 
-            settings['prompt']
+            settings['prompt'],
+            capabilities=EndpointCapabilities(self.cache_path_edit.text()),
+            scheduler=build_scheduler(settings)
         )
 
         file_path = self.epub_path_edit.text()
@@ -552,7 +645,9 @@ class MainWindow(QMainWindow):
             translator, 
             file_path,
             settings['chunk_size'],
-            context_rounds=settings['context_rounds']
+            context_rounds=settings['context_rounds'],
+            max_workers=settings['max_workers'],
+            history_tokens=settings['history_tokens']
             # No target_indices = Process ALL from Resume point
         )
         self.worker.progress.connect(self.on_progress)
@@ -563,59 +658,134 @@ class MainWindow(QMainWindow):
 
     def stop_translation(self):
         if self.processor:
-            self.processor.status = "stopped"
+            self.processor.stop()
             self.status_label.setText("正在停止...")
 
     def on_progress(self, current_idx, total, orig, trans, is_finished):
+        """
+        流式过程中 trans 为增量：只放入该分组的待刷新缓冲，由 stream_timer 按固定帧率
+        追加到编辑器；空增量表示流式中断后重新请求，清空该分组已显示的部分。
+        分组完成时 trans 为完整译文，一次性写入。
+        """
+        self.stream_total = total
+        self.stream_last_idx = current_idx
+        if not is_finished and not trans:
+            # 流式响应中断后重新请求：丢弃该分组此前的增量与编辑器中的部分译文
+            self.stream_pending.pop(current_idx, None)
+            if current_idx in self.stream_texts:
+                self.stream_texts[current_idx] = []
+            if getattr(self, 'current_flat_idx_view', None) == current_idx:
+                self.trans_text_edit.clear()
+            return
+        if not is_finished:
+            if current_idx not in self.stream_texts:
+                # 新分组开始：标记状态并自动跟随到该行
+                self.stream_texts[current_idx] = []
+                self.group_model.set_status(current_idx, "翻译中...")
+                if self.group_table.currentIndex().row() != current_idx:
+                    self.group_table.selectRow(current_idx)
+            self.stream_pending.setdefault(current_idx, []).append(trans)
+            if not self.stream_timer.isActive():
+                self.stream_timer.start()
+            return
+
+        self.stream_texts.pop(current_idx, None)
+        self.stream_pending.pop(current_idx, None)
+
+        if not trans:
+            # 请求失败：缓存中未写入译文，恢复编辑器并标记状态
+            self.group_model.set_status(current_idx, "请求失败")
+            if getattr(self, 'current_flat_idx_view', None) == current_idx and self.current_cache_data:
+                f_idx, c_idx = self.flat_chunks[current_idx]
+                self.trans_text_edit.setPlainText(self.current_cache_data["files"][f_idx]["chunks"][c_idx]["trans"])
+            self.status_label.setText(f"总进度: {current_idx+1}/{total} (本块请求失败，下次运行时自动重试)")
+            return
+
         # 1. Update In-Memory Cache (Critical for Review)
-        if hasattr(self, 'flat_chunks') and hasattr(self, 'current_cache_data'):
+        # 校验失败的译文带 VALIDATION_ERROR_PREFIX，与 process_run 写入缓存的 is_error 一致
+        is_error = trans.startswith(Processor.VALIDATION_ERROR_PREFIX)
+        if hasattr(self, 'flat_chunks') and self.current_cache_data:
             f_idx, c_idx = self.flat_chunks[current_idx]
-            if self.current_cache_data:
-                self.current_cache_data["files"][f_idx]["chunks"][c_idx]["trans"] = trans
-        
-        # 2. Update Table Status
-        if current_idx < self.group_table.rowCount():
-             status_item = self.group_table.item(current_idx, 1)
-             if status_item:
-                 status_item.setText("翻译中..." if not is_finished else "已翻译")
+            chunk = self.current_cache_data["files"][f_idx]["chunks"][c_idx]
+            chunk["trans"] = trans
+            chunk["is_error"] = is_error
+            if not is_error and "error" in chunk:
+                chunk["error"] = ""
+            if "retryable" in chunk:
+                chunk["retryable"] = False
+
+        # 2. Update Table Status：表格引用同一份缓存数据，按分组字段显示已翻译 / 校验失败
+        self.group_model.refresh_row(current_idx)
         
         # 3. Auto-follow: Select the row being translated
-        # Check if we need to switch view
-        cur_row = self.group_table.currentRow()
-        if cur_row != current_idx:
+        if self.group_table.currentIndex().row() != current_idx:
             self.group_table.selectRow(current_idx)
             # The signal will handle loading text into editor and updating block table
-        else:
+        elif getattr(self, 'current_flat_idx_view', None) == current_idx:
             # If already selected, just update the text manually because signal might not fire
-            self.orig_text_edit.setPlainText(orig)
             self.trans_text_edit.setPlainText(trans)
         
-        if is_finished:
-            self.status_label.setText(f"总进度: {current_idx+1}/{total} (本块已完成)")
+        self.status_label.setText(f"总进度: {current_idx+1}/{total} (本块已完成)")
+
+    def flush_stream(self):
+        """按帧把各分组累积的增量一次性追加到编辑器"""
+        view_idx = getattr(self, 'current_flat_idx_view', None)
+        for idx, deltas in self.stream_pending.items():
+            text = "".join(deltas)
+            if idx in self.stream_texts:
+                self.stream_texts[idx].append(text)
+            if idx == view_idx:
+                scrollbar = self.trans_text_edit.verticalScrollBar()
+                at_bottom = scrollbar.value() >= scrollbar.maximum()
+                cursor = QTextCursor(self.trans_text_edit.document())
+                cursor.movePosition(QTextCursor.End)
+                cursor.insertText(text)
+                if at_bottom:
+                    scrollbar.setValue(scrollbar.maximum())
+        self.stream_pending.clear()
+        if self.stream_texts:
+            self.status_label.setText(f"总进度: {self.stream_last_idx+1}/{self.stream_total} (正在翻译...)")
         else:
-            self.status_label.setText(f"总进度: {current_idx+1}/{total} (正在翻译...)")
+            self.stream_timer.stop()
+
+    def sync_editor_to_memory(self):
+        """把编辑器中的译文写回内存副本，内容有改动的分组记入 edited_chunks 等待保存"""
+        if not hasattr(self, 'current_indices') or not self.current_cache_data:
+            return
+        if getattr(self, 'current_flat_idx_view', None) in self.stream_texts:
+            # 正在流式翻译的分组，编辑器中只是部分译文
+            return
+        ch_idx, ck_idx = self.current_indices
+        chunk = self.current_cache_data["files"][ch_idx]["chunks"][ck_idx]
+        text = self.trans_text_edit.toPlainText()
+        if chunk["trans"] != text:
+            chunk["trans"] = text
+            self.edited_chunks.add((ch_idx, ck_idx))
+
+    def flush_manual_edits(self):
+        """将有改动的分组逐个写入缓存日志，返回保存的分组数"""
+        self.sync_editor_to_memory()
+        if not self.processor or not self.current_cache_data or not self.edited_chunks:
+            return 0
+        cache_file = self.processor.get_cache_filename(self.epub_path_edit.text())
+        for ch_idx, ck_idx in sorted(self.edited_chunks):
+            # 只写入被修改的分组：运行中工作线程已写入的其他分组不会被界面上的旧副本覆盖
+            trans = self.current_cache_data["files"][ch_idx]["chunks"][ck_idx]["trans"]
+            self.processor.save_manual_edit(cache_file, ch_idx, ck_idx, trans)
+        count = len(self.edited_chunks)
+        self.edited_chunks.clear()
+        return count
 
     def save_manual_edit(self):
         if not self.processor or not self.current_cache_data:
             QMessageBox.warning(self, "警告", "没有加载的文件或缓存。")
             return
-            
-        file_path = self.epub_path_edit.text()
-        cache_file = self.processor.get_cache_filename(file_path)
-        
-        # 1. Sync current editor content to memory first
-        if hasattr(self, 'current_indices'):
-            ch_idx, ck_idx = self.current_indices
-            self.current_cache_data["files"][ch_idx]["chunks"][ck_idx]["trans"] = self.trans_text_edit.toPlainText()
-            
-            # Update table preview just in case
-            if hasattr(self, 'current_flat_idx_view'):
-                row = self.current_flat_idx_view
-                self.group_table.item(row, 1).setText("已翻译" if self.trans_text_edit.toPlainText() else "未翻译")
 
-        # 2. Save the entire in-memory data to disk
-        self.processor.save_cache(cache_file, self.current_cache_data)
-        self.status_label.setText(f"所有手动修改已保存到缓存文件。")
+        count = self.flush_manual_edits()
+        # Update table preview just in case
+        if hasattr(self, 'current_flat_idx_view'):
+            self.group_model.refresh_row(self.current_flat_idx_view)
+        self.status_label.setText(f"已保存 {count} 个分组的手动修改。" if count else "没有需要保存的手动修改。")
 
     def clear_cache(self):
         file_path = self.epub_path_edit.text()
@@ -626,14 +796,12 @@ class MainWindow(QMainWindow):
         cache_dir = self.cache_path_edit.text()
         proc = Processor(cache_dir)
         cache_file = proc.get_cache_filename(file_path)
-        cache_path = os.path.join(cache_dir, cache_file)
         
         reply = QMessageBox.question(self, '确认清除', '确定要清除当前书籍的翻译缓存吗？这将导致翻译重新开始。',
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
+            if proc.delete_cache(cache_file):
                 QMessageBox.information(self, "成功", "缓存已清除。")
                 self.init_processor_and_chunks() # Refresh table
             else:
@@ -646,21 +814,65 @@ class MainWindow(QMainWindow):
         self.btn_output.setEnabled(True)
         self.btn_clear_cache.setEnabled(True)
         
-        # Refresh table statuses just in case
-        if hasattr(self, 'processor'):
-             # We could reload cache to verify, but simple UI update is enough usually
-             pass
+        # 运行期间未保存的手动修改先写入日志，下面重新加载缓存时才不会丢失
+        self.flush_manual_edits()
+        
+        # 丢弃被中止分组的流式缓冲
+        self.stream_timer.stop()
+        self.stream_pending.clear()
+        self.stream_texts.clear()
+
+        # 并发模式下 UI 内存副本只跟随了译文，状态字段以磁盘缓存为准
+        self.reload_cache_data()
         
         if complete:
-            self.save_manual_edit()
             if self.worker and hasattr(self.worker, 'target_indices') and self.worker.target_indices:
                 self.status_label.setText(f"选中块翻译完成。")
             else:
-                self.status_label.setText("全部翻译任务已完成！")
+                self.status_label.setText(f"全部翻译任务已完成！{self.format_memory_stats()}{self.format_usage_stats()}")
                 QMessageBox.information(self, "完成", "翻译已结束。")
         else:
             self.status_label.setText("任务已中止。")
 
+    def format_memory_stats(self):
+        """翻译记忆命中率摘要"""
+        stats = (self.current_cache_data or {}).get("memory_stats")
+        if not stats:
+            return ""
+        carried = f" 修订版沿用原译文 {stats['carried']} 块。" if stats.get("carried") else ""
+        if not stats.get("lookups"):
+            return carried
+        rate = stats["hits"] / stats["lookups"] * 100
+        return (f" 翻译记忆命中 {stats['hits']}/{stats['lookups']} ({rate:.1f}%)，"
+                f"书内重复块 {stats.get('duplicates', 0)} 个。{carried}")
+
+    def format_usage_stats(self):
+        """累计 token 用量与前缀缓存命中率摘要"""
+        stats = (self.current_cache_data or {}).get("usage_stats")
+        if not stats or not stats.get("input"):
+            return ""
+        rate = stats.get("cached", 0) / stats["input"] * 100
+        return f" 输入 {stats['input']} tokens（缓存命中 {rate:.1f}%），输出 {stats.get('output', 0)} tokens。"
+
+    def reload_cache_data(self):
+        """从磁盘重新加载缓存并刷新分组状态列"""
+        if not self.processor:
+            return
+        file_path = self.epub_path_edit.text()
+        cache_data = self.processor.load_cache(self.processor.get_cache_filename(file_path))
+        if not cache_data:
+            return
+        if sum(len(f["chunks"]) for f in cache_data["files"]) != len(self.flat_chunks):
+            # 运行中有分组被自动拆分，重建分组表
+            self.init_processor_and_chunks(autoload=True)
+            return
+        self.current_cache_data = cache_data
+        self.group_model.refresh_all(cache_data)
+        self.block_model.cache_data = cache_data
+        if hasattr(self, 'current_indices'):
+            ch_idx, ck_idx = self.current_indices
+            self.trans_text_edit.setPlainText(cache_data["files"][ch_idx]["chunks"][ck_idx]["trans"])
+
     def on_error(self, message):
         self.btn_start.setEnabled(True)
         self.btn_stop.setEnabled(False)
@@ -692,7 +904,7 @@ class MainWindow(QMainWindow):
 
         try:
             self.status_label.setText("正在导出...")
-            msg = self.processor.finalize_translation(file_path, output_path, target_format)
+            msg = self.processor.finalize_translation(file_path, output_path, target_format, callback=self.update_status)
             
             self.status_label.setText("导出成功")
             QMessageBox.information(self, "成功", f"导出完成！\n{msg}")
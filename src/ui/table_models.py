@@ -0,0 +1,137 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+from src.core.processor import Processor
+
+
+def group_status_text(c_data):
+    if c_data.get("retryable"):
+        return "待重试"
+    if c_data.get("error") and not c_data["trans"]:
+        return "请求失败"
+    if c_data.get("is_error"):
+        return "校验失败"
+    return "已翻译" if c_data["trans"] else "未翻译"
+
+
+class GroupTableModel(QAbstractTableModel):
+    """
+    分组表模型：直接读取缓存数据，不为每行创建 item。
+    ID / 状态 / 预览只在视图请求可见行时计算，进度更新通过 set_status / refresh_row
+    只发出单行的 dataChanged，因此数万分组的缓存也能立即打开。
+    """
+
+    HEADERS = ["ID", "状态", "分组预览"]
+    PREVIEW_CHARS = 50
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache_data = None
+        self.flat_chunks = []
+        # 运行中的临时状态（如“翻译中...”），优先于缓存中的状态显示
+        self.status_overrides = {}
+
+    def set_cache_data(self, cache_data):
+        self.beginResetModel()
+        self.cache_data = cache_data
+        self.flat_chunks = [(f_i, c_i) for f_i, f_data in enumerate(cache_data["files"])
+                            for c_i in range(len(f_data["chunks"]))] if cache_data else []
+        self.status_overrides = {}
+        self.endResetModel()
+
+    def chunk(self, row):
+        f_i, c_i = self.flat_chunks[row]
+        return self.cache_data["files"][f_i]["chunks"][c_i]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.flat_chunks)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        row, col = index.row(), index.column()
+        if col == 0:
+            return str(row + 1)
+        if col == 1:
+            return self.status_overrides.get(row) or group_status_text(self.chunk(row))
+        return self.chunk(row)["orig"][:self.PREVIEW_CHARS].replace("\n", " ") + "..."
+
+    def set_status(self, row, text):
+        """临时覆盖一行的状态文字"""
+        if 0 <= row < len(self.flat_chunks):
+            self.status_overrides[row] = text
+            self._status_changed(row, row)
+
+    def refresh_row(self, row):
+        """清除临时状态，按缓存数据重新显示一行"""
+        if 0 <= row < len(self.flat_chunks):
+            self.status_overrides.pop(row, None)
+            self._status_changed(row, row)
+
+    def refresh_all(self, cache_data):
+        """分组结构不变时替换缓存数据并刷新状态列"""
+        self.cache_data = cache_data
+        self.status_overrides = {}
+        if self.flat_chunks:
+            self._status_changed(0, len(self.flat_chunks) - 1)
+
+    def _status_changed(self, first, last):
+        self.dataChanged.emit(self.index(first, 1), self.index(last, 1), [Qt.DisplayRole])
+
+
+class BlockTableModel(QAbstractTableModel):
+    """组内分块表模型：选中分组变化时只替换块索引列表，预览与所属文件按需计算"""
+
+    HEADERS = ["ID", "内容预览"]
+    PREVIEW_CHARS = 100
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache_data = None
+        self.block_indices = []
+        # 所属文件的查找表，随 cache_data 替换而重建（见 file_index）
+        self._file_index = None
+        self._file_index_data = None
+
+    def set_group(self, cache_data, block_indices):
+        self.beginResetModel()
+        self.cache_data = cache_data
+        self.block_indices = list(block_indices)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.block_indices)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        b_idx = self.block_indices[index.row()]
+        if role == Qt.DisplayRole:
+            if index.column() == 0:
+                return str(b_idx + 1)
+            return self.cache_data["all_blocks"][b_idx]["text"][:self.PREVIEW_CHARS].replace("\n", " ")
+        if role == Qt.ToolTipRole and index.column() == 1:
+            return Processor.file_of_block(self.cache_data, b_idx, self.file_index())
+        return None
+
+    def file_index(self):
+        """当前缓存数据的文件查找表；界面直接替换 cache_data 时也会在下次查询时重建"""
+        if self._file_index_data is not self.cache_data:
+            self._file_index = Processor.file_index(self.cache_data)
+            self._file_index_data = self.cache_data
+        return self._file_index
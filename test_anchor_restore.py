@@ -0,0 +1,122 @@
+import sys
+import os
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bs4 import BeautifulSoup
+from src.core.anchor_parser import AnchorTokenizer
+from src.core.epub_anchor_processor import EPubAnchorProcessor
+from src.core.docx_anchor_processor import DocxAnchorProcessor
+
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def test_tokenizer_tree():
+    tok = AnchorTokenizer()
+    nodes = tok.parse("a⟦b⟦c⟧⦗1⦘⟧⦗2⦘⦗3⦘d", {1, 2, 3})
+    assert nodes == ["a", ("container", 2, ["b", ("container", 1, ["c"], "c")], "b⟦c⟧⦗1⦘"), ("solo", 3), "d"]
+
+
+def test_tokenizer_invalid_markers_are_text():
+    tok = AnchorTokenizer()
+    # 未知编号、缺少锚点的容器与未闭合括号都按原文保留
+    assert tok.parse("x⟦y⟧⦗9⦘ ⟦z⟧ ⟦open ⦗ 1⦘", {1}) == ["x⟦y⟧⦗9⦘ ⟦z⟧ ⟦open ⦗ 1⦘"]
+    # 锚点不能越出所在容器
+    assert tok.parse("⟦⟦a⟧⟧⦗1⦘", {1}) == [("container", 1, ["⟦a⟧"], "⟦a⟧")]
+
+
+def test_restore_html_round_trip():
+    html = '<p>Hello <b>bold <i>it</i></b> and <a href="x">link</a><br/> end</p>'
+    proc = EPubAnchorProcessor()
+    soup = BeautifulSoup(html, 'html.parser')
+    block = proc.create_blocks_from_soup(soup)[0]
+    proc.restore_html(block, block['text'], soup)
+    assert str(soup) == html
+
+    soup = BeautifulSoup(html, 'html.parser')
+    block = proc.create_blocks_from_soup(soup)[0]
+    proc.restore_html(block, "你好 ⟦粗体 ⟦斜⟧⦗1⦘⟧⦗2⦘ 和 ⟦链接⟧⦗3⦘⦗4⦘ 结束", soup)
+    assert str(soup) == '<p>你好 <b>粗体 <i>斜</i></b> 和 <a href="x">链接</a><br/> 结束</p>'
+
+
+def test_restore_xml_keeps_namespace_and_terminates():
+    xml = (f'<w:document {W_NS}><w:body><w:p><w:r><w:t>Plain </w:t></w:r>'
+           '<w:r><w:rPr><w:b/></w:rPr><w:t>bold</w:t></w:r><w:r><w:br/></w:r></w:p></w:body></w:document>')
+    proc = DocxAnchorProcessor()
+    soup = BeautifulSoup(xml, 'xml')
+    block = proc.create_blocks_from_soup(soup)[0]
+    proc.restore_xml(block, "普通 ⟦粗⟧⦗1⦘⦗2⦘", soup)
+    assert '<w:r><w:rPr><w:b/></w:rPr><w:t>粗</w:t></w:r><w:r><w:br/></w:r>' in str(soup)
+
+    # 未知锚点与未闭合括号按普通文本写入新的 run，而不是陷入死循环
+    soup = BeautifulSoup(xml, 'xml')
+    block = proc.create_blocks_from_soup(soup)[0]
+    proc.restore_xml(block, "普通 ⟦粗⟧⦗7⦘ ⟦未闭合", soup)
+    assert '<w:t xml:space="preserve">普通 ⟦粗⟧⦗7⦘ ⟦未闭合</w:t>' in str(soup)
+
+
+def test_response_parser_handles_cycled_delimiters():
+    proc = EPubAnchorProcessor()
+    # 超过分隔符池长度时分隔符会循环，第 41 块不能匹配到第 1 块
+    blocks = [{"text": f"b{i}"} for i in range(len(proc.BLOCK_DELIMS) + 5)]
+    response = "前言\n" + proc.format_for_ai(blocks).replace("b", "译") + "\n附注"
+    texts, ok = proc.validate_and_parse_response(response, blocks)
+    assert ok and texts == [f"译{i}" for i in range(len(blocks))]
+
+    # 缺少第 41 块时其后的块不会顺延错位
+    missing = response.replace(proc.get_block_delimiters(40)[0] + "译40" + proc.get_block_delimiters(40)[1], "")
+    texts, failure = proc.validate_response(missing, blocks)
+    assert texts is None and failure["block"] == 40
+
+
+def test_response_parser_reports_failures():
+    proc = DocxAnchorProcessor()
+    blocks = [{"text": "a"}, {"text": "b"}]
+    d0, d1 = proc.get_block_delimiters(0)[0], proc.get_block_delimiters(1)[0]
+    assert proc.validate_response(f"{d0}a{d0}{d1}b{d1}", blocks)[1]["block"] is None
+    assert proc.validate_response(f"⟬{d0}a{d0}⟭", blocks)[1]["block"] == 1
+    assert proc.validate_response(f"⟬{d0}a{d1}b{d1}⟭", blocks)[1]["block"] == 0
+    assert proc.validate_response(f"⟬{d0}a{d0}{d1}b⟭", blocks)[1]["block"] == 1
+    assert proc.validate_and_parse_response(f"⟬ {d0} a {d0}\n{d1}b{d1} ⟭", blocks) == (["a", "b"], True)
+
+
+def test_response_salvage_keeps_parsable_blocks():
+    proc = EPubAnchorProcessor()
+    blocks = [{"text": f"b{i}"} for i in range(len(proc.BLOCK_DELIMS) + 3)]
+    response = proc.format_for_ai(blocks)
+    d1, d2 = proc.get_block_delimiters(1)[0], proc.get_block_delimiters(2)[0]
+    # 第 2 块缺少结束分隔符、第 3 块整块丢失，其余块（含分隔符循环后的块）仍能取回
+    broken = response.replace(f"b1{d1}", "b1").replace(f"{d2}b2{d2}\n", "")
+    texts = proc.salvage_response(broken, blocks)
+    assert texts[1] is None and texts[2] is None
+    assert [t for k, t in enumerate(texts) if k not in (1, 2)] == [b["text"] for k, b in enumerate(blocks) if k not in (1, 2)]
+    # 缺少分组标记时同样可以取回
+    assert proc.salvage_response(response.strip("⟬⟭"), blocks) == [b["text"] for b in blocks]
+
+
+def test_response_missing_anchors_fail_validation():
+    proc = EPubAnchorProcessor()
+    # 缓存中的块只记录锚点数，刚提取的块带 formats，两种写法结果一致
+    for blocks in ([{"text": "a⟦b⟧⦗1⦘⦗2⦘", "anchors": 2}, {"text": "c", "anchors": 0}],
+                   [{"text": "a⟦b⟧⦗1⦘⦗2⦘", "formats": [{"id": "⦗1⦘"}, {"id": "⦗2⦘"}]}, {"text": "c", "formats": []}]):
+        assert proc.validate_response(proc.format_for_ai([{"text": "甲⟦乙⟧⦗1⦘⦗2⦘"}, {"text": "丙"}]), blocks)[1] is None
+        lost = proc.format_for_ai([{"text": "甲乙⦗2⦘"}, {"text": "丙"}])
+        texts, failure = proc.validate_response(lost, blocks)
+        assert texts is None and failure["block"] == 0 and "1" in failure["reason"]
+        # 补救时只有丢失锚点的块需要重新请求
+        assert proc.salvage_response(lost, blocks) == [None, "丙"]
+        # 导出按结构校验，已接受的译文照常使用
+        assert proc.validate_and_parse_response(lost, blocks) == (["甲乙⦗2⦘", "丙"], True)
+
+
+if __name__ == "__main__":
+    test_tokenizer_tree()
+    test_tokenizer_invalid_markers_are_text()
+    test_restore_html_round_trip()
+    test_restore_xml_keeps_namespace_and_terminates()
+    test_response_parser_handles_cycled_delimiters()
+    test_response_parser_reports_failures()
+    test_response_salvage_keeps_parsable_blocks()
+    test_response_missing_anchors_fail_validation()
+    print("ALL TESTS PASSED!")
@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.epub_anchor_processor import EPubAnchorProcessor
+
+TAGS = list(EPubAnchorProcessor.TRANSLATABLE_TAGS)
+
+
+def legacy_blocks(soup):
+    """单遍实现之前的块识别逻辑，作为回归基准"""
+    result = []
+    for element in soup.find_all(TAGS):
+        has_translatable_child = any(child.name in TAGS for child in element.find_all(TAGS, recursive=False))
+        if has_translatable_child:
+            direct_text = "".join([t for t in element.find_all(string=True, recursive=False) if t.strip()])
+            if not direct_text:
+                continue
+        result.append(element)
+    return result
+
+
+CASES = [
+    '<html><body><p>One <b>two</b></p><p>&#160;</p><p></p></body></html>',
+    # 容器只有带直接文本时才成为块，其中的子块同样保留
+    '<html><body><div><p>inner</p></div><div>direct <p>nested</p> tail</div></body></html>',
+    '<html><body><section><div><div><article><p>deep</p></article></div></div></section></body></html>',
+    '<html><body><ul><li>item <ul><li>sub <p>para</p></li></ul></li></ul></body></html>',
+    '<html><body><table><caption>cap</caption><tr><th>h</th><td><p>cell</p></td></tr></table></body></html>',
+    # 注释与仅含空白的文本节点
+    '<html><body><div><!-- note --><p>x</p></div><div>\n  <p>y</p>\n</div></body></html>',
+    '<html><body><div><span>inline only</span></div><blockquote><p>q</p>said</blockquote></body></html>',
+    '<html><body><aside><footer><cite>c</cite></footer></aside><dl><dt>t</dt><dd>d</dd></dl>'
+    '<figure><img src="a.png"/><figcaption>fig</figcaption></figure><h1>T</h1><h6>t6</h6></body></html>',
+]
+
+
+def test_single_pass_matches_legacy_discovery():
+    proc = EPubAnchorProcessor()
+    for case in CASES:
+        for backend in EPubAnchorProcessor.PARSER_BACKENDS:
+            soup = proc.parse_markup(case, backend)
+            expected = legacy_blocks(soup)
+            blocks = proc.create_blocks_from_soup(soup)
+            assert [b['element'] for b in blocks] == expected, (backend, case)
+            assert [b['text'] for b in blocks] == [proc.extract_block_with_local_ids(e)[0] for e in expected]
+
+
+XHTML = '''<?xml version="1.0" encoding="utf-8" standalone="no"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xmlns:svg="http://www.w3.org/2000/svg" xml:lang="en">
+<head><title>T</title><script src="a.js"></script><style>p { color: red }</style></head>
+<body><DIV Class="x  y">Text <B>bold</B><br/></DIV>
+<p><svg:svg viewBox="0 0 1 1"><svg:rect width="1"/></svg:svg> tail</p>
+<p epub:type="note">n <a href="#x" id="y"></a>&#160;&amp;<!-- c --></p>
+<P><svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1 1"><rect/></svg> and <Span xmlns:m="urn:m" m:Attr="v">s</Span></P>
+</body></html>
+<!-- trailing -->
+'''
+
+
+def test_backends_agree_on_namespaced_and_mixed_case_xhtml():
+    proc = EPubAnchorProcessor()
+    # 格式良好的文件由 lxml 只解析一次，不回退到 html.parser
+    assert proc._parse_xml_as_html(XHTML) is not None
+    results = {}
+    for backend in EPubAnchorProcessor.PARSER_BACKENDS:
+        soup = proc.parse_markup(XHTML, backend)
+        blocks = [(b['text'], b['formats']) for b in proc.create_blocks_from_soup(soup)]
+        restored, _ = proc.restore_document(XHTML, ["T" + text for text, _ in blocks], backend)
+        results[backend] = (blocks, str(soup), restored)
+    assert results["lxml"] == results["html.parser"]
+
+    blocks, serialized, restored = results["lxml"]
+    # 大写标签按块识别，带前缀的 svg 按普通容器处理，非空元素写出闭合标签
+    assert blocks[0][0] == "Text ⟦bold⟧⦗1⦘⦗2⦘"
+    assert blocks[1][0] == "⟦⦗1⦘⟧⦗2⦘ tail"
+    assert '<script src="a.js"></script>' in restored and '<svg:rect width="1"></svg:rect>' in restored
+    assert restored.endswith("<!-- trailing -->\n")
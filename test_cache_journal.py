@@ -0,0 +1,95 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+
+
+def make_book(tmp_path, paragraphs=40):
+    path = str(tmp_path / "book.epub")
+    body = "".join(f"<p>Paragraph {i}.</p>" for i in range(paragraphs))
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        z.writestr('OEBPS/chap1.xhtml', f'<html xmlns="http://www.w3.org/1999/xhtml"><body>{body}</body></html>')
+    processor = Processor(str(tmp_path / "cache"))
+    cache_data = processor.process_epub_anchor_init(path, 60)
+    return processor, processor.get_cache_filename(path), cache_data
+
+
+def finish_group(processor, cache_file, cache_data, c_idx, trans):
+    cache_data["files"][0]["chunks"][c_idx]["trans"] = trans
+    cache_data["current_flat_idx"] = c_idx + 1
+    processor.save_chunk(cache_file, cache_data, 0, c_idx)
+
+
+def test_journal_is_replayed_after_a_crash(tmp_path):
+    processor, cache_file, cache_data = make_book(tmp_path)
+    finish_group(processor, cache_file, cache_data, 0, "first")
+    finish_group(processor, cache_file, cache_data, 1, "second")
+
+    # 模拟崩溃：不写完整缓存，由新的 Processor 加载
+    reloaded = Processor(processor.cache_dir).load_cache(cache_file)
+    chunks = reloaded["files"][0]["chunks"]
+    assert [chunks[0]["trans"], chunks[1]["trans"], chunks[2]["trans"]] == ["first", "second", ""]
+    assert reloaded["current_flat_idx"] == 2
+    # 重放不改变原文与块索引
+    assert chunks[0]["orig"] == cache_data["files"][0]["chunks"][0]["orig"]
+
+
+def test_truncated_and_corrupt_lines_are_skipped(tmp_path):
+    processor, cache_file, cache_data = make_book(tmp_path)
+    finish_group(processor, cache_file, cache_data, 0, "first")
+    journal = processor.get_journal(cache_file).path
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write('not json\n{"f":0,"c":1,"chunk":{"trans":"half')
+
+    processor = Processor(processor.cache_dir)
+    reloaded = processor.load_cache(cache_file)
+    assert reloaded["files"][0]["chunks"][0]["trans"] == "first"
+    assert reloaded["files"][0]["chunks"][1]["trans"] == ""
+
+    # 写了一半的行之后追加的记录仍然有效
+    finish_group(processor, cache_file, reloaded, 2, "third")
+    reloaded = Processor(processor.cache_dir).load_cache(cache_file)
+    assert reloaded["files"][0]["chunks"][2]["trans"] == "third"
+    assert reloaded["current_flat_idx"] == 3
+
+
+def test_journal_is_compacted_every_n_entries(tmp_path):
+    processor, cache_file, cache_data = make_book(tmp_path)
+    journal = processor.get_journal(cache_file).path
+    for n in range(Processor.JOURNAL_COMPACT_EVERY - 1):
+        finish_group(processor, cache_file, cache_data, 0, f"v{n}")
+    assert os.path.exists(journal)
+    finish_group(processor, cache_file, cache_data, 0, "compacted")
+    assert not os.path.exists(journal)
+
+    # 压缩后的完整缓存不依赖日志
+    with open(os.path.join(processor.cache_dir, cache_file), encoding='utf-8') as f:
+        assert '"compacted"' in f.read()
+    finish_group(processor, cache_file, cache_data, 1, "after")
+    assert os.path.exists(journal)
+
+
+def test_save_cache_clears_journal_only_after_replace(tmp_path, monkeypatch):
+    processor, cache_file, cache_data = make_book(tmp_path)
+    finish_group(processor, cache_file, cache_data, 0, "first")
+    journal = processor.get_journal(cache_file).path
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        processor.save_cache(cache_file, cache_data)
+    monkeypatch.undo()
+    # 完整缓存没有写成，日志必须保留
+    assert os.path.exists(journal)
+    assert Processor(processor.cache_dir).load_cache(cache_file)["files"][0]["chunks"][0]["trans"] == "first"
+
+    processor.save_cache(cache_file, cache_data)
+    assert not os.path.exists(journal)
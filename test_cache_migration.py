@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+from test_helpers import make_epub, PrefixTranslator
+
+CHAPTERS = {
+    'OEBPS/a.xhtml': ["First <b>bold</b> line", "Plain line"],
+    'OEBPS/b.xhtml': ["Second <i>italic</i> and <b>bold</b>", "Another line", "Last line"],
+}
+
+
+def to_v2(data):
+    """改写为版本 3 之前的缓存：all_blocks 带 formats，逐块的 block_to_file，无 cache_version"""
+    legacy = dict(data)
+    legacy.pop("cache_version")
+    legacy.pop("journal_generation")
+    legacy["all_blocks"] = [{"text": b["text"], "formats": [{"id": f"⦗{n}⦘"} for n in range(1, b["anchors"] + 1)]}
+                            for b in data["all_blocks"]]
+    legacy["block_to_file"] = {str(b_idx): f["rel_path"] for f in legacy.pop("file_ranges")
+                               for b_idx in range(*f["block_range"])}
+    return legacy
+
+
+def test_v2_cache_is_migrated_on_load(tmp_path):
+    path = str(tmp_path / "book.epub")
+    make_epub(path, parts=CHAPTERS)
+    cache_dir = str(tmp_path / "cache")
+    processor = Processor(cache_dir)
+    processor.process_epub_anchor_init(path, 2000)
+    assert processor.process_run(path, PrefixTranslator(), use_memory=False)
+    cache_file = processor.get_cache_filename(path)
+    expected = processor.load_cache(cache_file)
+
+    with open(os.path.join(cache_dir, cache_file), 'w', encoding='utf-8') as f:
+        json.dump(to_v2(expected), f, ensure_ascii=False)
+
+    processor = Processor(cache_dir)
+    migrated = processor.load_cache(cache_file)
+    # 迁移后写回的缓存为第 1 代
+    assert migrated == dict(expected, journal_generation=1)
+    assert migrated["file_ranges"] == [{"rel_path": "OEBPS/a.xhtml", "block_range": [0, 2]},
+                                       {"rel_path": "OEBPS/b.xhtml", "block_range": [2, 5]}]
+    assert [processor.file_of_block(migrated, b) for b in range(6)] == ["OEBPS/a.xhtml"] * 2 + ["OEBPS/b.xhtml"] * 3 + [None]
+    # 迁移结果已写回，再次加载不再经过迁移
+    with open(os.path.join(cache_dir, cache_file), 'r', encoding='utf-8') as f:
+        assert json.load(f) == migrated
+
+    output = str(tmp_path / "out.epub")
+    processor.finalize_translation(path, output)
+    with zipfile.ZipFile(output) as z:
+        a = z.read('OEBPS/a.xhtml').decode('utf-8')
+        b = z.read('OEBPS/b.xhtml').decode('utf-8')
+    assert "<p>TFirst <b>bold</b> line</p>" in a and "<p>TPlain line</p>" in a
+    assert "<p>TSecond <i>italic</i> and <b>bold</b></p>" in b and "<p>TLast line</p>" in b
+
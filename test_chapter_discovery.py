@@ -0,0 +1,96 @@
+import os
+import sys
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.epub_anchor_processor import EPubAnchorProcessor
+from src.core.processor import Processor
+
+CONTAINER = ('<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+             '<rootfiles><rootfile full-path="OPS/package.opf" media-type="application/oebps-package+xml"/>'
+             '</rootfiles></container>')
+
+
+def page(body):
+    return f'<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml"><head><title>t</title></head><body>{body}</body></html>'
+
+
+def make_book(path, with_opf=True):
+    parts = {
+        # 文件名含 toc / cover / nav，按文件名过滤时会被误跳过
+        'OPS/text/synopsis_toc_notes.xhtml': page('<p>Synopsis</p>'),
+        'OPS/text/cover.xhtml': page('<div><img src="../img/cover.jpg" alt="Cover"/></div>'),
+        # 文件名本身含 %，manifest 中的 href 需 URL 解码
+        'OPS/text/ch%202.xhtml': page('<p>Second</p>'),
+        'OPS/text/a_first.xhtml': page('<h1>First</h1><p>Body</p>'),
+        'OPS/text/notes.xhtml': page('<p>Note</p>'),
+        'OPS/nav.xhtml': page('<nav><ol><li>First</li></ol></nav>'),
+    }
+    opf = ('<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0"><manifest>'
+           '<item id="nav" href="nav.xhtml" properties="nav" media-type="application/xhtml+xml"/>'
+           '<item id="cover" href="text/cover.xhtml" media-type="application/xhtml+xml"/>'
+           '<item id="c1" href="text/a_first.xhtml" media-type="application/xhtml+xml"/>'
+           '<item id="c2" href="text/ch%25202.xhtml" media-type="application/xhtml+xml"/>'
+           '<item id="syn" href="text/synopsis_toc_notes.xhtml" media-type="application/xhtml+xml"/>'
+           '<item id="notes" href="text/notes.xhtml" media-type="application/xhtml+xml"/>'
+           '<item id="img" href="img/cover.jpg" media-type="image/jpeg"/>'
+           '</manifest><spine><itemref idref="cover"/><itemref idref="syn"/><itemref idref="c1"/>'
+           '<itemref idref="c2" linear="no"/></spine></package>')
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        if with_opf:
+            z.writestr('META-INF/container.xml', CONTAINER)
+            z.writestr('OPS/package.opf', opf)
+        for name, text in parts.items():
+            z.writestr(name, text)
+
+
+def test_spine_order_then_unlisted_documents(tmp_path):
+    path = str(tmp_path / "book.epub")
+    make_book(path)
+    proc = EPubAnchorProcessor()
+    proc.open_epub(path)
+    try:
+        files = proc.get_xhtml_files()
+    finally:
+        proc.archive.close()
+    # spine 顺序（含 linear="no"），再是未列入 spine 的内容文档；导航文档不翻译
+    assert files == ['OPS/text/cover.xhtml', 'OPS/text/synopsis_toc_notes.xhtml', 'OPS/text/a_first.xhtml',
+                     'OPS/text/ch%202.xhtml', 'OPS/text/notes.xhtml']
+
+
+def test_text_less_pages_are_skipped_and_missing_opf_falls_back(tmp_path):
+    assert not EPubAnchorProcessor.has_text(page('<div><img src="a.png"/></div><!-- <p>x</p> --><p>&nbsp;</p>').encode())
+    assert EPubAnchorProcessor.has_text(page('<p><b>x</b></p>').encode())
+
+    path = str(tmp_path / "book.epub")
+    make_book(path)
+    cache_data = Processor(str(tmp_path / "cache")).process_epub_anchor_init(path, 2000)
+    assert [b["text"] for b in cache_data["all_blocks"]] == ["Synopsis", "First", "Body", "Second", "Note"]
+
+    make_book(path, with_opf=False)
+    proc = EPubAnchorProcessor()
+    proc.open_epub(path)
+    try:
+        files = proc.get_xhtml_files()
+    finally:
+        proc.archive.close()
+    assert 'OPS/text/a_first.xhtml' in files and 'OPS/text/cover.xhtml' not in files
+
+
+def test_opf_without_existing_documents_falls_back_to_scan(tmp_path, capsys):
+    path = str(tmp_path / "book.epub")
+    # manifest 的 href 全部失效，spine 只引用图片
+    opf = ('<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0"><manifest>'
+           '<item id="c1" href="text/missing.xhtml" media-type="application/xhtml+xml"/>'
+           '<item id="img" href="img/cover.jpg" media-type="image/jpeg"/>'
+           '</manifest><spine><itemref idref="img"/><itemref idref="c1"/></spine></package>')
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        z.writestr('META-INF/container.xml', CONTAINER)
+        z.writestr('OPS/package.opf', opf)
+        z.writestr('OPS/text/chapter.xhtml', page('<p>Only chapter</p>'))
+    cache_data = Processor(str(tmp_path / "cache")).process_epub_anchor_init(path, 2000)
+    assert [b["text"] for b in cache_data["all_blocks"]] == ["Only chapter"]
+    assert "falling back to file scan" in capsys.readouterr().out
@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+import cli
+from mock_llm_server import MockLLMServer
+from src.core.metrics import metrics
+from test_helpers import make_epub
+
+MAX_REQUESTS = 3
+
+
+def test_two_books_share_the_request_limit(tmp_path):
+    books = [str(tmp_path / name) for name in ("a.epub", "b.epub")]
+    for path in books:
+        make_epub(path, [f"Paragraph {i} of {os.path.basename(path)} with <b>some</b> words." for i in range(40)])
+    report = str(tmp_path / "report.json")
+    try:
+        with MockLLMServer(latency=0.05) as server:
+            code = cli.main([*books, "--config", str(tmp_path / "config.json"),
+                             "--cache-dir", str(tmp_path / "cache"), "--output-dir", str(tmp_path / "out"),
+                             "--api-key", "test", "--api-url", server.url, "--model", "mock",
+                             "--chunk-size", "200", "--context-rounds", "0", "--workers", "4",
+                             "--books", "2", "--max-requests", str(MAX_REQUESTS), "--rpm", "0", "--tpm", "0",
+                             "--no-memory", "--metrics-json", report])
+    finally:
+        # --metrics-json 打开了全局统计，不影响其他测试
+        metrics.enable(False)
+        metrics.reset()
+    assert code == 0
+    # 两本书各 4 个并发分组，同时进行的请求仍受全局上限约束
+    assert 1 < server.max_concurrent <= MAX_REQUESTS
+    with open(report, encoding='utf-8') as f:
+        summary = json.load(f)
+    assert [b["completed"] for b in summary["books"]] == [True, True]
+    assert all(b["groups"] > 4 and not b["failed_groups"] for b in summary["books"])
+    # 校验统计由两本书共用，保存的样本数覆盖全部分组而不是后保存的那本书
+    with open(tmp_path / "cache" / "group_stats.json", encoding='utf-8') as f:
+        assert json.load(f)["mock"]["samples"] == sum(b["groups"] for b in summary["books"])
+    for path in books:
+        output = tmp_path / "out" / f"translated_{os.path.basename(path)}"
+        with zipfile.ZipFile(output) as z:
+            assert "Paragraph 39 of" in z.read('OEBPS/chap1.xhtml').decode('utf-8')
@@ -0,0 +1,261 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+from test_helpers import make_epub
+from src.core.cache_journal import CacheJournal
+from src.core.request_scheduler import RequestScheduler
+
+
+class StubTranslator:
+    """把原文原样作为译文返回，记录每个分组开始与结束的顺序；blocker 中的分组等待 release 后才返回"""
+
+    model = "stub"
+    system_prompt = "system"
+    temperature = 0.0
+
+    def __init__(self, groups, delay=0.01):
+        self.index = {orig: i for i, orig in enumerate(groups)}
+        self.delay = delay
+        self.events = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.blocked = {}
+
+    def block(self, i):
+        self.blocked[i] = threading.Event()
+
+    def translate_chunk(self, text, history=None, usage=None, on_restart=None):
+        i = self.index[text]
+        with self.lock:
+            self.events.append(("start", i))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        if i in self.blocked:
+            self.blocked[i].wait(5)
+        time.sleep(self.delay)
+        with self.lock:
+            self.events.append(("end", i))
+            self.active -= 1
+        yield text
+
+
+def setup(tmp_path):
+    path = str(tmp_path / "book.epub")
+    make_epub(path, 60)
+    processor = Processor(str(tmp_path / "cache"))
+    cache_data = processor.process_epub_anchor_init(path, 120)
+    groups = [c["orig"] for c in cache_data["files"][0]["chunks"]]
+    assert len(groups) >= 8
+    return path, processor, groups
+
+
+def test_context_rounds_orders_dependent_groups(tmp_path):
+    path, processor, groups = setup(tmp_path)
+    translator = StubTranslator(groups)
+    assert processor.process_run(path, translator, context_rounds=2, max_workers=4, use_memory=False)
+    position = {event: k for k, event in enumerate(translator.events)}
+    # 每个分组只在其上下文窗口内的前序分组完成后才开始
+    for i in range(1, len(groups)):
+        for hi in range(max(0, i - 2), i):
+            assert position[("end", hi)] < position[("start", i)]
+    cache_data = processor.load_cache(processor.get_cache_filename(path))
+    assert cache_data["current_flat_idx"] == len(groups)
+    assert all(c["trans"] == c["orig"] for c in cache_data["files"][0]["chunks"])
+
+    # 没有上下文依赖时各分组并行
+    path2 = str(tmp_path / "book2.epub")
+    make_epub(path2, 60)
+    processor.process_epub_anchor_init(path2, 120)
+    translator = StubTranslator(groups, delay=0.05)
+    assert processor.process_run(path2, translator, context_rounds=0, max_workers=4, use_memory=False)
+    assert translator.max_active > 1
+
+
+def test_resume_point_stops_at_first_unfinished_group(tmp_path):
+    path, processor, groups = setup(tmp_path)
+    translator = StubTranslator(groups)
+    translator.block(2)
+    result = {}
+    run = threading.Thread(target=lambda: result.setdefault(
+        "completed", processor.process_run(path, translator, context_rounds=0, max_workers=3, use_memory=False)))
+    run.start()
+    # 等其余分组完成后停止，被阻塞的分组 2 未完成
+    deadline = time.time() + 5
+    while sum(1 for e in translator.events if e[0] == "end") < len(groups) - 1 and time.time() < deadline:
+        time.sleep(0.01)
+    processor.stop()
+    translator.blocked[2].set()
+    run.join(5)
+    assert result["completed"] is False
+
+    cache_data = processor.load_cache(processor.get_cache_filename(path))
+    chunks = cache_data["files"][0]["chunks"]
+    # 断点停在第一个未完成的分组，之后已完成的分组结果仍然保存
+    assert cache_data["current_flat_idx"] == 2
+    assert not chunks[2]["trans"]
+    assert all(c["trans"] for k, c in enumerate(chunks) if k != 2)
+
+    translator = StubTranslator(groups)
+    assert processor.process_run(path, translator, context_rounds=0, max_workers=3, use_memory=False)
+    cache_data = processor.load_cache(processor.get_cache_filename(path))
+    assert ("start", 2) in translator.events
+    assert cache_data["current_flat_idx"] == len(groups)
+    assert all(c["trans"] == c["orig"] for c in cache_data["files"][0]["chunks"])
+
+
+def test_manual_edit_during_run_is_journaled_not_overwritten(tmp_path):
+    path, processor, groups = setup(tmp_path)
+    cache_file = processor.get_cache_filename(path)
+    translator = StubTranslator(groups)
+    translator.block(len(groups) - 1)
+    run = threading.Thread(target=processor.process_run, args=(path, translator),
+                           kwargs={"context_rounds": 0, "max_workers": 2, "use_memory": False})
+    run.start()
+    deadline = time.time() + 5
+    while ("end", 0) not in translator.events and time.time() < deadline:
+        time.sleep(0.01)
+    processor.save_manual_edit(cache_file, 0, 0, "edited")
+    translator.blocked[len(groups) - 1].set()
+    run.join(5)
+
+    cache_data = processor.load_cache(cache_file)
+    chunks = cache_data["files"][0]["chunks"]
+    assert chunks[0]["trans"] == "edited"
+    # 工作线程写入的其他分组没有被覆盖
+    assert all(c["trans"] == c["orig"] for c in chunks[1:])
+    assert cache_data["current_flat_idx"] == len(groups)
+
+
+class SplittingTranslator:
+    """多块分组返回无法解析的响应，迫使分组对半拆分；每次请求计 10 个输入 token"""
+
+    model = "stub"
+    system_prompt = "system"
+    temperature = 0.0
+
+    def translate_chunk(self, text, history=None, usage=None, on_restart=None):
+        if usage is not None:
+            usage["input"] = 10
+        # 分组标记与首尾各占一行，多于 3 行即不止一个块
+        yield "garbage" if text.count("\n") > 2 else text
+
+
+def test_split_group_keeps_usage_on_first_piece(tmp_path):
+    path = str(tmp_path / "book.epub")
+    make_epub(path, 2)
+    processor = Processor(str(tmp_path / "cache"))
+    cache_data = processor.process_epub_anchor_init(path, 2000)
+    assert len(cache_data["files"][0]["chunks"]) == 1
+
+    assert processor.process_run(path, SplittingTranslator(), context_rounds=0, use_memory=False)
+    cache_data = processor.load_cache(processor.get_cache_filename(path))
+    chunks = cache_data["files"][0]["chunks"]
+    assert [c["block_indices"] for c in chunks] == [[0], [1]]
+    assert not any(c["is_error"] for c in chunks)
+    # 整组请求与两次拆分请求的用量合计保留在第一段上
+    assert chunks[0]["usage"] == {"input": 30, "requests": 3}
+    assert "usage" not in chunks[1]
+    assert cache_data["usage_stats"] == chunks[0]["usage"]
+
+
+class RecordingTranslator:
+    """原样返回译文，记录请求过的分组原文"""
+
+    model = "stub"
+    system_prompt = "system"
+    temperature = 0.0
+
+    def __init__(self):
+        self.requested = []
+
+    def translate_chunk(self, text, history=None, usage=None, on_restart=None):
+        self.requested.append(text)
+        yield text
+
+
+def split_book(tmp_path):
+    """两个分组 [0, 1] 与 [2]，第一个分组在运行中被拆分，拆分尚未写成独立分组"""
+    path = str(tmp_path / "book.epub")
+    make_epub(path, 3)
+    processor = Processor(str(tmp_path / "cache"))
+    cache_data = processor.process_epub_anchor_init(path, 80)
+    assert [c["block_indices"] for c in cache_data["files"][0]["chunks"]] == [[0, 1], [2]]
+    assert processor.process_run(path, SplittingTranslator(), context_rounds=0, use_memory=False)
+    return path, processor, processor.get_cache_filename(path)
+
+
+def test_pending_splits_are_applied_before_indices_reach_callers(tmp_path):
+    path, _, cache_file = split_book(tmp_path)
+    processor = Processor(str(tmp_path / "cache"))
+    chunks = processor.load_cache(cache_file)["files"][0]["chunks"]
+    assert [c["block_indices"] for c in chunks] == [[0], [1], [2]]
+    # target_indices 按加载后的编号选中原来的第二个分组
+    translator = RecordingTranslator()
+    assert processor.process_run(path, translator, target_indices=[2], use_memory=False)
+    assert translator.requested == [chunks[2]["orig"]]
+
+
+def test_journal_from_before_a_split_is_not_replayed_after_crash(tmp_path, monkeypatch):
+    _, processor, cache_file = split_book(tmp_path)
+    # 拆分写成独立分组之前的手动修改，编号 (0, 1) 指向原来的第二个分组
+    processor.save_manual_edit(cache_file, 0, 1, "edited")
+
+    def crash(self):
+        raise OSError("crash")
+    # 拆分后的缓存已原子替换，清空日志之前进程退出
+    monkeypatch.setattr(CacheJournal, "clear", crash)
+    try:
+        Processor(str(tmp_path / "cache")).load_cache(cache_file)
+    except OSError:
+        pass
+    monkeypatch.undo()
+
+    chunks = Processor(str(tmp_path / "cache")).load_cache(cache_file)["files"][0]["chunks"]
+    assert [c["block_indices"] for c in chunks] == [[0], [1], [2]]
+    assert chunks[2]["trans"] == "edited"
+    assert chunks[1]["trans"] != "edited"
+
+
+def test_shared_scheduler_is_reset_only_when_asked(tmp_path):
+    path, processor, groups = setup(tmp_path)
+    translator = StubTranslator(groups, delay=0)
+    translator.scheduler = RequestScheduler()
+    # 命令行多本书共用调度器：Ctrl-C 之后才开始的书不能清除停止请求
+    translator.scheduler.cancel()
+    processor.process_run(path, translator, target_indices=[0], use_memory=False, reset_scheduler=False)
+    assert translator.scheduler.cancelled
+    processor.process_run(path, translator, target_indices=[0], use_memory=False)
+    assert not translator.scheduler.cancelled
+
+
+class RestartingTranslator:
+    """第一次尝试产出部分译文后中断，重新请求前调用 on_restart，再完整返回原文"""
+
+    model = "stub"
+    system_prompt = "system"
+    temperature = 0.0
+
+    def translate_chunk(self, text, history=None, usage=None, on_restart=None):
+        yield text[:5]
+        on_restart()
+        yield text
+
+
+def test_stream_restart_is_forwarded_to_progress_callback(tmp_path):
+    path = str(tmp_path / "book.epub")
+    make_epub(path, 2)
+    processor = Processor(str(tmp_path / "cache"))
+    processor.process_epub_anchor_init(path, 2000)
+    events = []
+    assert processor.process_run(path, RestartingTranslator(), use_memory=False,
+                                 callback=lambda i, total, orig, text, done: events.append((text, done)))
+    final = events[-1][0]
+    # 空增量之后的增量才是最终译文，界面据此丢弃中断前显示的部分
+    assert events[:3] == [(final[:5], False), ("", False), (final, False)]
+    assert events[-1] == (final, True)
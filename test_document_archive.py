@@ -0,0 +1,239 @@
+import io
+import os
+import sys
+import zlib
+import struct
+import zipfile
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core import document_archive
+from src.core.document_archive import DocumentArchive
+from src.core.processor import Processor
+from test_helpers import CHAPTER, make_epub, PrefixTranslator
+
+IMAGE = bytes(range(256)) * 64
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+class Unseekable(io.RawIOBase):
+    """不可回退的输出流：zipfile 写入时为每个成员附加数据描述符"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def write_zip(path, members, data_descriptors=False, zip64=False, mimetype_compress=zipfile.ZIP_STORED):
+    out = Unseekable() if data_descriptors else open(path, 'wb')
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=mimetype_compress)
+        for name, data in members.items():
+            with z.open(name, 'w', force_zip64=zip64) as f:
+                f.write(data)
+    if data_descriptors:
+        with open(path, 'wb') as f:
+            f.write(out.buffer.getvalue())
+    else:
+        out.close()
+
+
+def zipcrypto(data, password, check_byte):
+    """传统 PKWARE 加密（ZipCrypto），返回 12 字节加密头 + 密文"""
+    def crc(value, byte):
+        return zlib.crc32(bytes([byte]), value ^ 0xFFFFFFFF) ^ 0xFFFFFFFF
+
+    keys = [0x12345678, 0x23456789, 0x34567890]
+
+    def update(byte):
+        keys[0] = crc(keys[0], byte)
+        keys[1] = ((keys[1] + (keys[0] & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+        keys[2] = crc(keys[2], keys[1] >> 24)
+
+    for byte in password:
+        update(byte)
+    out = bytearray()
+    for byte in bytes(11) + bytes([check_byte]) + data:
+        temp = keys[2] | 2
+        out.append(byte ^ (((temp * (temp ^ 1)) >> 8) & 0xFF))
+        update(byte)
+    return bytes(out)
+
+
+def append_encrypted(path, name, data, password, data_descriptor=False):
+    """在 zip 末尾追加一个不压缩的加密成员（zipfile 不支持写入加密成员）"""
+    with zipfile.ZipFile(path) as z:
+        infos = z.infolist()
+    with open(path, 'rb') as f:
+        raw = f.read()
+    info = zipfile.ZipInfo(name, date_time=(2020, 1, 1, 10, 30, 0))
+    info.flag_bits = 0x09 if data_descriptor else 0x01
+    info.CRC = zlib.crc32(data)
+    # 使用数据描述符时校验字节取自 DOS 修改时间的高字节
+    check_byte = (10 << 11 | 30 << 5) >> 8 if data_descriptor else info.CRC >> 24
+    payload = zipcrypto(data, password, check_byte)
+    info.compress_size = len(payload)
+    info.file_size = len(data)
+    info.header_offset = raw.find(b'PK\x01\x02')
+    body = raw[:info.header_offset] + info.FileHeader() + payload
+    if data_descriptor:
+        body += struct.pack('<LLLL', 0x08074b50, info.CRC, info.compress_size, info.file_size)
+    with open(path, 'wb') as f:
+        f.write(body)
+    # 重新写出中央目录：原有成员加新成员
+    with zipfile.ZipFile(path, 'a') as z:
+        z.filelist = infos + [info]
+        z.NameToInfo = {i.filename: i for i in z.filelist}
+        z.start_dir = len(body)
+        z._didModify = True
+
+
+def repack(tmp_path, source, modified=None):
+    archive = DocumentArchive()
+    archive.open(source)
+    for name, text in (modified or {}).items():
+        archive.write_part(name, text)
+    output = str(tmp_path / "out.epub")
+    archive.repack(output, stored_first='mimetype')
+    archive.close()
+    return output
+
+
+def assert_same_members(source, output, skip=(), password=None):
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(output) as out:
+        if password:
+            src.setpassword(password)
+            out.setpassword(password)
+        assert out.testzip() is None
+        assert out.namelist()[0] == 'mimetype'
+        assert out.getinfo('mimetype').compress_type == zipfile.ZIP_STORED
+        for info in src.infolist():
+            if info.filename not in skip:
+                assert out.read(info.filename) == src.read(info.filename), info.filename
+
+
+def test_archive_round_trip_keeps_unmodified_members(tmp_path):
+    source = str(tmp_path / "book.epub")
+    write_zip(source, {CHAPTER: b"<p>old</p>", "OEBPS/image.png": IMAGE})
+    archive = DocumentArchive()
+    archive.open(source)
+    assert archive.has_part(CHAPTER) and not archive.has_part("OEBPS/missing.xhtml")
+    assert archive.read_part(CHAPTER) == "<p>old</p>"
+    archive.write_part(CHAPTER, "<p>new</p>")
+    # 修改只保存在内存中，读取返回修改后的内容
+    assert archive.read_part(CHAPTER) == "<p>new</p>"
+    output = str(tmp_path / "out.epub")
+    archive.repack(output, stored_first='mimetype')
+    archive.close()
+
+    assert_same_members(source, output, skip={CHAPTER})
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(output) as out:
+        assert out.read(CHAPTER) == b"<p>new</p>"
+        # 未修改的成员原样复制压缩数据
+        assert out.getinfo("OEBPS/image.png").compress_size == src.getinfo("OEBPS/image.png").compress_size
+
+
+def test_repack_members_with_data_descriptors_and_zip64(tmp_path):
+    for options in ({"data_descriptors": True}, {"zip64": True}):
+        source = str(tmp_path / "book.epub")
+        write_zip(source, {CHAPTER: b"<p>old</p>", "OEBPS/image.png": IMAGE}, **options)
+        output = repack(tmp_path, source, {CHAPTER: "<p>new</p>"})
+        assert_same_members(source, output, skip={CHAPTER})
+        with zipfile.ZipFile(output) as out:
+            assert not out.getinfo("OEBPS/image.png").flag_bits & 0x08
+
+
+def test_compressed_mimetype_is_rewritten_stored(tmp_path):
+    source = str(tmp_path / "book.epub")
+    write_zip(source, {CHAPTER: b"<p>old</p>"}, mimetype_compress=zipfile.ZIP_DEFLATED)
+    assert_same_members(source, repack(tmp_path, source))
+
+
+def test_encrypted_member_is_copied_as_is(tmp_path):
+    for data_descriptor in (False, True):
+        source = str(tmp_path / "book.epub")
+        write_zip(source, {CHAPTER: b"<p>old</p>"})
+        append_encrypted(source, "OEBPS/secret.bin", b"secret data" * 10, b"pw", data_descriptor)
+        output = repack(tmp_path, source, {CHAPTER: "<p>new</p>"})
+        assert_same_members(source, output, skip={CHAPTER}, password=b"pw")
+
+
+def test_repack_falls_back_when_zipfile_internals_are_missing(tmp_path, monkeypatch):
+    source = str(tmp_path / "book.epub")
+    write_zip(source, {CHAPTER: b"<p>old</p>", "OEBPS/image.png": IMAGE}, data_descriptors=True)
+    monkeypatch.delattr(zipfile, "_strip_extra")
+    output = repack(tmp_path, source, {CHAPTER: "<p>new</p>"})
+    assert_same_members(source, output, skip={CHAPTER})
+
+
+
+def test_repack_uses_plain_copy_on_untested_python(tmp_path, monkeypatch):
+    source = str(tmp_path / "book.epub")
+    write_zip(source, {CHAPTER: b"<p>old</p>", "OEBPS/image.png": IMAGE}, data_descriptors=True)
+    monkeypatch.setattr(document_archive, "_RAW_COPY_PYTHON_VERSIONS", ())
+    monkeypatch.setattr(DocumentArchive, "_copy_raw", lambda *args: pytest.fail("未验证的 Python 版本不应原样复制"))
+    output = repack(tmp_path, source, {CHAPTER: "<p>new</p>"})
+    assert_same_members(source, output, skip={CHAPTER})
+
+
+def test_raw_copy_is_enabled_on_this_python():
+    # 当前解释器不在列表中时提醒：需验证后加入 _RAW_COPY_PYTHON_VERSIONS
+    if sys.version_info[:2] not in document_archive._RAW_COPY_PYTHON_VERSIONS:
+        pytest.skip(f"Python {sys.version_info[0]}.{sys.version_info[1]} 尚未验证原样复制")
+    with zipfile.ZipFile(io.BytesIO(), 'w') as zipf:
+        assert DocumentArchive._raw_copy_supported(zipf)
+
+
+def make_books(tmp_path):
+    epub = str(tmp_path / "book.epub")
+    make_epub(epub, [f"Line {i} with <b>bold</b> text." for i in range(10)], extra={"OEBPS/image.png": IMAGE})
+    docx = str(tmp_path / "doc.docx")
+    runs = "".join(f'<w:p><w:r><w:t>Line {i} </w:t></w:r><w:r><w:rPr><w:b/></w:rPr><w:t>bold</w:t></w:r></w:p>'
+                   for i in range(10))
+    with zipfile.ZipFile(docx, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', '<Types/>')
+        z.writestr('word/document.xml', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                                        f'<w:document {W_NS}><w:body>{runs}</w:body></w:document>')
+        z.writestr('word/media/image1.png', IMAGE)
+    return epub, docx
+
+
+def test_storage_modes_export_the_same_book(tmp_path):
+    """直接读取归档与完整解压两种模式导出结果逐成员一致；解压模式下原文件删除后仍可从解压目录导出"""
+    epub, docx = make_books(tmp_path)
+    for source, init, part in ((epub, Processor.process_epub_anchor_init, CHAPTER),
+                               (docx, Processor.process_docx_anchor_init, "word/document.xml")):
+        outputs = {}
+        for storage in Processor.STORAGE_MODES:
+            processor = Processor(str(tmp_path / f"cache_{storage}"), storage=storage)
+            cache_data = init(processor, source, 2000)
+            assert (cache_data["working_dir"] is None) == (storage == "archive")
+            assert processor.process_run(source, PrefixTranslator(), use_memory=False)
+            outputs[storage] = str(tmp_path / f"{storage}_{os.path.basename(source)}")
+            processor.finalize_translation(source, outputs[storage])
+
+        with zipfile.ZipFile(outputs["archive"]) as a, zipfile.ZipFile(outputs["extract"]) as e:
+            assert sorted(a.namelist()) == sorted(e.namelist())
+            for name in a.namelist():
+                assert a.read(name) == e.read(name), name
+        with zipfile.ZipFile(source) as src, zipfile.ZipFile(outputs["archive"]) as a:
+            assert "TLine 9" in a.read(part).decode("utf-8")
+            # 未翻译的成员（图片等）原样保留
+            assert all(a.read(n) == src.read(n) for n in src.namelist() if n != part)
+
+        moved = source + ".moved"
+        os.replace(source, moved)
+        try:
+            fallback = str(tmp_path / f"fallback_{os.path.basename(source)}")
+            processor.finalize_translation(source, fallback)
+            with zipfile.ZipFile(outputs["extract"]) as e, zipfile.ZipFile(fallback) as f:
+                assert {n: f.read(n) for n in f.namelist()} == {n: e.read(n) for n in e.namelist()}
+        finally:
+            os.replace(moved, source)
@@ -0,0 +1,90 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core import grouping
+from src.core.grouping import TokenCounter, CharGrouper, TokenGrouper, build_grouper
+from src.core.group_stats import GroupStats
+
+
+def test_estimate_counts_cjk_and_anchors_higher_than_chars_suggest():
+    est = TokenCounter.estimate
+    assert est("abcd" * 10) == 10
+    assert est("中文翻译") == 4
+    # 锚点密集的文本按字符数会被严重低估
+    assert est("⟦a⟧⦗1⦘⟦b⟧⦗2⦘") == 2 * TokenCounter.ANCHOR_TOKENS + 4 * TokenCounter.SYMBOL_TOKENS + 1
+
+
+
+def test_failed_encoding_load_falls_back_to_estimate(monkeypatch, capsys):
+    class OfflineTiktoken:
+        """编码表需要下载、离线时加载失败的 tiktoken"""
+        @staticmethod
+        def encoding_for_model(model):
+            raise KeyError(model)
+
+        @staticmethod
+        def get_encoding(name):
+            raise OSError("network unreachable")
+
+    monkeypatch.setattr(grouping, "tiktoken", OfflineTiktoken)
+    counter = TokenCounter("some-model")
+    assert not counter.exact and counter.name == "estimate"
+    assert counter.count("中文翻译") == 4
+    assert "falling back to estimated token counts" in capsys.readouterr().out
+    assert "估算" in counter.describe()
+
+    monkeypatch.setattr(grouping, "tiktoken", None)
+    assert not TokenCounter().exact
+    settings = {"model": "m", "chunk_size": 1000, "token_grouping": True, "context_tokens": 8000,
+                "max_output_tokens": 4000, "prompt": "", "context_rounds": 1}
+    assert build_grouper(settings).describe()["tokenizer"] == "estimate"
+
+
+def test_char_grouper_keeps_greedy_behaviour():
+    blocks = [{"text": "x" * n, "size": n} for n in (40, 50, 30, 200, 10)]
+    groups = CharGrouper(100).group(range(len(blocks)), blocks)
+    assert groups == [[0, 1], [2], [3], [4]]
+
+
+def test_token_grouper_budget_and_fill():
+    counter = TokenCounter()
+    counter.encoding = None  # 固定使用估算，结果与是否安装 tiktoken 无关
+    grouper = TokenGrouper(counter, context_tokens=10000, max_output_tokens=100000,
+                           prompt="", context_rounds=1, output_ratio=1.0, fill=1.0)
+    # 受上下文窗口约束：10000 / ((1 + 1) * (1 + 1))
+    assert grouper.budget() == 2500
+    grouper.max_output_tokens = 1000
+    assert grouper.budget() == 1000
+
+    blocks = [{"text": "中" * 300, "size": 300} for _ in range(10)]
+    groups = grouper.group(range(10), blocks)
+    for g in groups:
+        assert sum(grouper.measure(blocks[i]) for i in g) <= grouper.budget()
+    assert [i for g in groups for i in g] == list(range(10))
+    assert grouper.describe()["mode"] == "tokens"
+
+
+def test_group_stats_shrink_groups_for_failing_models(tmp_path):
+    stats = GroupStats(str(tmp_path))
+    settings = {"model": "weak", "chunk_size": 1000}
+    for _ in range(GroupStats.MIN_SAMPLES - 1):
+        stats.record("weak", False)
+    # 样本不足时不调整
+    assert build_grouper(settings, stats).max_chars == 1000
+    for _ in range(GroupStats.MIN_SAMPLES):
+        stats.record("weak", False)
+        stats.record("strong", True)
+    assert build_grouper(settings, stats).max_chars == int(1000 * GroupStats.MIN_SCALE)
+    assert build_grouper(dict(settings, model="strong"), stats).max_chars == 1000
+
+    stats.save()
+    assert GroupStats(str(tmp_path)).scale("weak") == GroupStats.MIN_SCALE
+
+
+if __name__ == "__main__":
+    test_estimate_counts_cjk_and_anchors_higher_than_chars_suggest()
+    test_char_grouper_keeps_greedy_behaviour()
+    test_token_grouper_budget_and_fill()
+    print("ALL TESTS PASSED!")
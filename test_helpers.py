@@ -0,0 +1,39 @@
+"""测试共用的样书构造与桩翻译器"""
+import zipfile
+
+CHAPTER = "OEBPS/chap1.xhtml"
+
+
+def make_epub(path, paragraphs=10, parts=None, extra=None):
+    """
+    写出最小的 EPUB：mimetype 与 XHTML 内容文档，没有 OPF（按文件扫描发现章节）。
+    paragraphs 为段落数（生成 "Paragraph i with some words."）或各段的 HTML 列表，写入 CHAPTER；
+    parts 为 {部件路径: 段落} 时写出多个章节。extra 为其他成员 {路径: 内容}。
+    """
+    if parts is None:
+        parts = {CHAPTER: paragraphs}
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        for name, content in parts.items():
+            if isinstance(content, int):
+                content = [f"Paragraph {i} with some words." for i in range(content)]
+            body = "".join(f"<p>{text}</p>" for text in content)
+            z.writestr(name, f'<html xmlns="http://www.w3.org/1999/xhtml"><body>{body}</body></html>')
+        for name, data in (extra or {}).items():
+            z.writestr(name, data)
+
+
+class PrefixTranslator:
+    """把分组内每个块“翻译”为 T + 原文，记录请求次数"""
+
+    model = "stub"
+    system_prompt = "system"
+    temperature = 0.0
+
+    def __init__(self):
+        self.requests = 0
+
+    def translate_chunk(self, text, history=None, usage=None, on_restart=None):
+        self.requests += 1
+        lines = text.split("\n")
+        yield "\n".join([lines[0]] + [line[0] + "T" + line[1:] for line in lines[1:-1]] + [lines[-1]])
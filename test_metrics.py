@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.metrics import Metrics
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    with metrics.span("parse", bytes=10) as span:
+        span.add("blocks", 3)
+    metrics.record("restore_html", 1.0)
+    metrics.count("retries")
+    assert metrics.report() == {"stages": {}, "events": {}}
+
+
+def test_spans_counters_and_prometheus_export(tmp_path):
+    metrics = Metrics()
+    metrics.enable()
+    for size in (10, 20):
+        with metrics.span("parse", bytes=size) as span:
+            span.add("blocks", 2)
+    metrics.record("restore_html", 0.5, blocks=4)
+    metrics.count("retries", 3)
+
+    report = metrics.report()
+    assert report["stages"]["parse"]["calls"] == 2
+    assert report["stages"]["parse"]["counters"] == {"bytes": 30, "blocks": 4}
+    assert report["stages"]["restore_html"]["max_seconds"] == 0.5
+    assert report["events"] == {"retries": 3}
+
+    path = tmp_path / "metrics.prom"
+    metrics.write_prometheus(str(path), labels={"book": 'a "b"'})
+    text = path.read_text(encoding="utf-8")
+    assert '# TYPE epub_translator_stage_seconds_total counter' in text
+    assert 'epub_translator_stage_calls_total{stage="parse",book="a \\"b\\""} 2' in text
+    assert 'epub_translator_stage_items_total{stage="parse",item="bytes",book="a \\"b\\""} 30' in text
+    assert 'epub_translator_events_total{event="retries",book="a \\"b\\""} 3' in text
@@ -0,0 +1,39 @@
+import os
+import sys
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+from test_helpers import make_epub, PrefixTranslator
+
+CHAPTERS = 5
+
+
+def chapters():
+    """多个章节，段落中带粗体与链接等锚点"""
+    return {f'OEBPS/chap{c}.xhtml': [f'Chapter {c} line {i} with <b>bold</b> and <a href="#n{i}">note</a>.'
+                                     for i in range(20)] for c in range(CHAPTERS)}
+
+
+def read_members(path):
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+
+def test_process_pool_restore_matches_sequential(tmp_path):
+    path = str(tmp_path / "book.epub")
+    make_epub(path, parts=chapters())
+    processor = Processor(str(tmp_path / "cache"))
+    processor.process_epub_anchor_init(path, 1000)
+    assert processor.process_run(path, PrefixTranslator(), use_memory=False)
+
+    outputs = {}
+    for workers in (1, 3):
+        outputs[workers] = str(tmp_path / f"out_{workers}.epub")
+        processor.finalize_translation(path, outputs[workers], max_workers=workers)
+        assert sorted(p for p, _, _ in processor.last_restore_timings) == [f"OEBPS/chap{c}.xhtml" for c in range(CHAPTERS)]
+
+    sequential = read_members(outputs[1])
+    assert read_members(outputs[3]) == sequential
+    assert b"<p>TChapter 4 line 19 with <b>bold</b>" in sequential["OEBPS/chap4.xhtml"]
@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+from src.core.request_builder import RequestBuilder
+from src.core.grouping import TokenCounter
+
+
+def make_cache(proc, groups):
+    """groups: 每组的块原文列表，译文为原文加前缀"""
+    cached_data = {"all_blocks": [], "files": [{"chunks": []}]}
+    for texts in groups:
+        start = len(cached_data["all_blocks"])
+        blocks = [{"text": t, "anchors": 0} for t in texts]
+        cached_data["all_blocks"].extend(blocks)
+        cached_data["files"][0]["chunks"].append({
+            "orig": proc.format_for_ai(blocks),
+            "trans": proc.format_for_ai([{"text": "T" + t} for t in texts]),
+            "block_indices": list(range(start, start + len(texts))),
+        })
+    return cached_data
+
+
+def test_messages_keep_stable_prefix():
+    builder = RequestBuilder("system")
+    history = [("o1", "t1"), ("o2", "t2")]
+    first = builder.build("current", history)
+    second = builder.build("next", history)
+    assert [m["content"] for m in first] == ["system", "o1", "t1", "o2", "t2", "current"]
+    assert first[:-1] == second[:-1]
+
+
+def test_history_is_oldest_first_and_trimmed_to_budget(tmp_path):
+    processor = Processor(str(tmp_path))
+    proc = processor.epub_anchor_processor
+    groups = [[f"g{g}b{b} " + "word " * 20 for b in range(4)] for g in range(3)]
+    cached_data = make_cache(proc, groups)
+    flat_list = [(0, c) for c in range(3)]
+
+    full = processor._build_history(proc, cached_data, flat_list, 3, 2)
+    assert [h[0] for h in full] == [cached_data["files"][0]["chunks"][c]["orig"] for c in (1, 2)]
+
+    newest = cached_data["files"][0]["chunks"][2]
+    last = groups[1][-1]
+    last_block = TokenCounter.estimate(last) + TokenCounter.estimate("T" + last) + 6 * TokenCounter.SYMBOL_TOKENS
+    budget = TokenCounter.estimate(newest["orig"]) + TokenCounter.estimate(newest["trans"]) + last_block
+    trimmed = processor._build_history(proc, cached_data, flat_list, 3, 2, history_tokens=budget)
+    # 最近的分组完整保留，更早的分组只保留末尾放得下的块，并重新编号为完整分组
+    assert trimmed[-1] == (newest["orig"], newest["trans"])
+    assert len(trimmed) == 2
+    texts, failure = proc.validate_response(trimmed[0][1], [{"text": t} for t in groups[1][-1:]])
+    assert failure is None and texts == ["T" + groups[1][-1].strip()]
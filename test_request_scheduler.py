@@ -0,0 +1,223 @@
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.request_scheduler import RateLimiter, CircuitBreaker, RequestScheduler, TranslationError
+from src.core.endpoint_capabilities import EndpointCapabilities
+from src.core.translator import Translator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None, message=None):
+        super().__init__(f"Error code: {status_code} - {message or 'error'}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def test_rate_limiter_waits_once_bucket_is_empty():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=2, clock=clock)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    # 第三次请求需要等待补充一个额度：60 / 2 秒
+    assert limiter.reserve() == pytest.approx(30.0)
+    clock.now = 60.0
+    assert limiter.reserve() == 0
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.wait_time() == pytest.approx(10)
+    clock.now = 10
+    assert breaker.state == "half_open"
+    # 只放行一个试探请求
+    assert breaker.wait_time() == 0
+    assert breaker.wait_time() > 0
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_scheduler_retries_transient_errors_with_retry_after():
+    waits = []
+    scheduler = RequestScheduler(max_retries=3, sleep=waits.append)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise StatusError(429, {"retry-after": "2"})
+        return "ok"
+
+    assert scheduler.call(fn) == "ok"
+    assert waits == [2.0, 2.0]
+    assert scheduler.retries == 2
+
+
+def test_scheduler_gives_up_as_retryable_and_does_not_retry_client_errors():
+    scheduler = RequestScheduler(max_retries=2, base_delay=0.01, sleep=lambda s: None)
+    with pytest.raises(TranslationError) as info:
+        scheduler.call(lambda: (_ for _ in ()).throw(StatusError(503)))
+    assert info.value.retryable and info.value.status_code == 503
+
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(TranslationError) as info:
+        scheduler.call(bad_request)
+    assert not info.value.retryable
+    assert len(calls) == 1
+
+
+def test_client_errors_leave_the_breaker_unchanged():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    scheduler = RequestScheduler(max_retries=0, breaker=breaker, sleep=lambda s: None)
+    with pytest.raises(TranslationError):
+        scheduler.call(lambda: (_ for _ in ()).throw(StatusError(503)))
+    with pytest.raises(TranslationError):
+        scheduler.call(lambda: (_ for _ in ()).throw(StatusError(400)))
+    assert breaker.failures == 1
+    with pytest.raises(TranslationError):
+        scheduler.call(lambda: (_ for _ in ()).throw(StatusError(503)))
+    assert breaker.state == "open"
+
+    # 半开试探得到 400：不恢复，但交还试探名额
+    clock.now = 10
+    with pytest.raises(TranslationError):
+        scheduler.call(lambda: (_ for _ in ()).throw(StatusError(400)))
+    assert breaker.state == "half_open"
+    assert breaker.wait_time() == 0
+
+
+def delta(text, finish_reason=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason)],
+                           usage=None)
+
+
+class DroppingClient:
+    """第一次请求在产出部分内容后断开，之后正常返回"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return self.stream(self.calls)
+
+    def stream(self, call):
+        yield delta("Hel")
+        if call == 1:
+            raise ConnectionError("connection reset")
+        yield delta("lo", finish_reason="stop")
+
+
+def test_dropped_stream_is_retried_in_the_same_run():
+    waits = []
+    scheduler = RequestScheduler(max_retries=2, sleep=waits.append)
+    translator = Translator("key", "http://test", "model", 0.3, "system", scheduler=scheduler,
+                            capabilities=EndpointCapabilities())
+    translator.client = DroppingClient()
+    parts = []
+    for partial in translator.translate_chunk("text", on_restart=parts.clear):
+        parts.append(partial)
+    assert "".join(parts) == "Hello"
+    assert translator.client.calls == 2
+    assert len(waits) == 1 and scheduler.retries == 1
+    assert scheduler.breaker.failures == 0
+
+
+class ThrottledClient:
+    """throttled 为 True 时第一次请求返回 429（Retry-After 5 秒），之后正常返回"""
+
+    def __init__(self, throttled):
+        self.throttled = throttled
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        if self.throttled:
+            self.throttled = False
+            raise StatusError(429, headers={"Retry-After": "5"})
+        return iter([delta("ok", finish_reason="stop")])
+
+
+def test_request_limiter_is_released_during_backoff():
+    limiter = threading.BoundedSemaphore(1)
+    during_backoff = []
+
+    def sleep(seconds):
+        # 被限流的分组退避期间，另一个分组仍能拿到唯一的名额并完成请求
+        if limiter.acquire(timeout=1):
+            limiter.release()
+            during_backoff.append("".join(other.translate_chunk("other")))
+
+    scheduler = RequestScheduler(max_retries=2, sleep=sleep)
+    throttled, other = [Translator("key", "http://test", "model", 0.3, "system", request_limiter=limiter,
+                                   scheduler=scheduler, capabilities=EndpointCapabilities()) for _ in range(2)]
+    throttled.client = ThrottledClient(True)
+    other.client = ThrottledClient(False)
+    assert "".join(throttled.translate_chunk("text")) == "ok"
+    assert during_backoff == ["ok"]
+
+
+class VariantClient:
+    """拒绝嵌套对象写法的 thinking 参数；context_error 时对任何写法都返回上下文超长的 400"""
+
+    def __init__(self, context_error=False):
+        self.context_error = context_error
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        extra_body = kwargs.get("extra_body") or {}
+        self.requests.append(extra_body)
+        if self.context_error:
+            raise StatusError(400, message="This model's maximum context length is 8192 tokens")
+        if isinstance(extra_body.get("thinking"), dict):
+            raise StatusError(400, message="Unsupported parameter: thinking.type")
+        return iter([delta("ok", finish_reason="stop")])
+
+
+def make_translator(client):
+    translator = Translator("key", "http://test", "model", 0.3, "system",
+                            scheduler=RequestScheduler(max_retries=2, sleep=lambda s: None),
+                            capabilities=EndpointCapabilities())
+    translator.client = client
+    return translator
+
+
+def test_only_parameter_rejections_probe_other_request_variants():
+    translator = make_translator(VariantClient())
+    assert "".join(translator.translate_chunk("text")) == "ok"
+    assert translator.capabilities.get("http://test", "model") == "thinking_string+usage"
+    assert len(translator.client.requests) == 2
+    # 之后直接使用记住的写法
+    assert "".join(translator.translate_chunk("text")) == "ok"
+    assert len(translator.client.requests) == 3
+
+    translator = make_translator(VariantClient(context_error=True))
+    with pytest.raises(TranslationError) as info:
+        list(translator.translate_chunk("text"))
+    assert info.value.status_code == 400 and not info.value.retryable
+    assert len(translator.client.requests) == 1
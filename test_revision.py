@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+from test_helpers import make_epub
+
+
+def translate_all(processor, path):
+    """把每个分组“翻译”为原文加前缀 T"""
+    cache_file = processor.get_cache_filename(path)
+    cache_data = processor.load_cache(cache_file)
+    proc = processor.epub_anchor_processor
+    for chunk in cache_data["files"][0]["chunks"]:
+        blocks = [cache_data["all_blocks"][idx] for idx in chunk["block_indices"]]
+        chunk["trans"] = proc.format_for_ai([{"text": "T" + b["text"]} for b in blocks])
+    processor.save_cache(cache_file, cache_data)
+
+
+def test_revised_source_only_regroups_changed_blocks(tmp_path):
+    path = str(tmp_path / "book.epub")
+    original = [f"Paragraph {i} <b>bold</b>." for i in range(40)]
+    make_epub(path, original)
+    processor = Processor(str(tmp_path / "cache"))
+    processor.process_epub_anchor_init(path, 200)
+    translate_all(processor, path)
+
+    # 修订版：改动一段、插入一段、删除一段
+    revised = list(original)
+    revised[5] = "Paragraph 5 was rewritten."
+    revised.insert(20, "A brand new paragraph.")
+    del revised[30]
+    make_epub(path, revised)
+
+    cache_data = processor.process_epub_anchor_init(path, 200)
+    regrouped = [idx for chunk in cache_data["files"][0]["chunks"] for idx in chunk["block_indices"]]
+    assert regrouped == [5, 20]
+    assert cache_data["memory_stats"]["carried"] == len(revised) - 2
+    assert cache_data["prefilled"]["21"] == "T" + cache_data["all_blocks"][21]["text"]
+
+    # 源文件未再变化时直接使用缓存
+    assert processor.process_epub_anchor_init(path, 200) == processor.load_cache(processor.get_cache_filename(path))
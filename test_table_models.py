@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QApplication
+
+from src.core.processor import Processor
+from src.ui.table_models import GroupTableModel, BlockTableModel
+
+app = QApplication.instance() or QApplication([])
+
+
+def make_cache():
+    chunks = [
+        {"orig": "⟬\nfirst line\n⟭", "trans": "", "block_indices": [0]},
+        {"orig": "⟬\n" + "x" * 80 + "\n⟭", "trans": "done", "block_indices": [1, 2]},
+        {"orig": "⟬\nthird\n⟭", "trans": "", "block_indices": [3], "error": "timeout"},
+    ]
+    return {
+        "files": [{"chunks": chunks[:2]}, {"chunks": chunks[2:]}],
+        "all_blocks": [{"text": f"block {i}\nline", "anchors": 0} for i in range(4)],
+        "file_ranges": [{"rel_path": "a.xhtml", "block_range": [0, 3]}, {"rel_path": "b.xhtml", "block_range": [3, 4]}],
+    }
+
+
+def test_group_model_rows_and_single_row_updates():
+    cache_data = make_cache()
+    model = GroupTableModel()
+    assert model.rowCount() == 0
+    model.set_cache_data(cache_data)
+    assert (model.rowCount(), model.columnCount()) == (3, 3)
+    assert model.headerData(1, Qt.Horizontal) == "状态"
+    assert [model.data(model.index(row, 1)) for row in range(3)] == ["未翻译", "已翻译", "请求失败"]
+    assert model.data(model.index(2, 0)) == "3"
+    assert model.data(model.index(1, 2)) == "⟬ " + "x" * (GroupTableModel.PREVIEW_CHARS - 2) + "..."
+    assert model.data(model.index(0, 1), Qt.ToolTipRole) is None
+
+    changed = []
+    model.dataChanged.connect(lambda first, last, roles: changed.append((first.row(), last.row(), first.column(), last.column())))
+    model.set_status(0, "翻译中...")
+    assert model.data(model.index(0, 1)) == "翻译中..."
+    # 进度更新只通知这一行的状态列
+    assert changed == [(0, 0, 1, 1)]
+
+    cache_data["files"][0]["chunks"][0].update(trans="译文", is_error=True)
+    model.refresh_row(0)
+    assert model.data(model.index(0, 1)) == "校验失败"
+    assert changed[-1] == (0, 0, 1, 1)
+
+    model.set_status(5, "越界")
+    assert len(changed) == 2
+
+
+def test_block_model_previews_and_file_tooltips(monkeypatch):
+    builds = []
+    file_index = Processor.file_index
+    monkeypatch.setattr(Processor, "file_index", staticmethod(lambda data: builds.append(1) or file_index(data)))
+    cache_data = make_cache()
+    model = BlockTableModel()
+    model.set_group(cache_data, [1, 2, 3])
+    assert (model.rowCount(), model.columnCount()) == (3, 2)
+    assert model.data(model.index(0, 0)) == "2"
+    assert model.data(model.index(2, 1)) == "block 3 line"
+    assert [model.data(model.index(row, 1), Qt.ToolTipRole) for row in range(3)] == ["a.xhtml", "a.xhtml", "b.xhtml"]
+    # 查找表每份缓存数据只构建一次，替换缓存数据后重建
+    assert len(builds) == 1
+    model.cache_data = dict(cache_data, file_ranges=[{"rel_path": "c.xhtml", "block_range": [0, 4]}])
+    assert model.data(model.index(0, 1), Qt.ToolTipRole) == "c.xhtml"
+    assert len(builds) == 2
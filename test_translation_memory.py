@@ -0,0 +1,94 @@
+import os
+import sys
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.processor import Processor
+from test_helpers import make_epub, PrefixTranslator
+
+PARAGRAPHS = [
+    "Chapter <b>One</b>",
+    "Unique first paragraph.",
+    "Running header",
+    "Unique second paragraph.",
+    "Running header",
+    "Chapter <b>One</b>",
+    # 锚点文本相同但格式不同，不与上面的块共用译文
+    "Chapter <i>One</i>",
+    "Running header",
+]
+
+
+def grouped_indices(cache_data):
+    return sorted(idx for f in cache_data["files"] for c in f["chunks"] for idx in c["block_indices"])
+
+
+def test_duplicates_are_translated_once_and_copied_at_export(tmp_path):
+    path = str(tmp_path / "book.epub")
+    make_epub(path, PARAGRAPHS)
+    processor = Processor(str(tmp_path / "cache"))
+    cache_data = processor.process_epub_anchor_init(path, 2000)
+    assert grouped_indices(cache_data) == [0, 1, 2, 3, 6]
+    assert cache_data["block_refs"] == {"4": 2, "5": 0, "7": 2}
+    assert cache_data["memory_stats"]["duplicates"] == 3
+
+    assert processor.process_run(path, PrefixTranslator(), use_memory=False)
+    output = str(tmp_path / "out.epub")
+    processor.finalize_translation(path, output)
+    with zipfile.ZipFile(output) as z:
+        html = z.read('OEBPS/chap1.xhtml').decode('utf-8')
+    assert html.count("<p>TRunning header</p>") == 3
+    assert html.count("<p>TChapter <b>One</b></p>") == 2
+    assert "<p>TChapter <i>One</i></p>" in html
+
+
+def test_memory_hits_skip_grouping_and_second_book_is_served_from_sqlite(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    path = str(tmp_path / "book.epub")
+    make_epub(path, PARAGRAPHS)
+    processor = Processor(cache_dir)
+    processor.process_epub_anchor_init(path, 2000)
+    translator = PrefixTranslator()
+    assert processor.process_run(path, translator)
+    assert translator.requests == 1
+
+    # 另一本书：已翻译过的块命中翻译记忆，只有新块进入分组
+    path2 = str(tmp_path / "book2.epub")
+    make_epub(path2, PARAGRAPHS + ["A new paragraph."])
+    processor = Processor(cache_dir)
+    memory = processor.open_memory(translator.model, translator.system_prompt, translator.temperature)
+    cache_data = processor.process_epub_anchor_init(path2, 2000, memory=memory)
+    memory.close()
+    assert grouped_indices(cache_data) == [8]
+    assert cache_data["prefilled"]["1"] == "TUnique first paragraph."
+    assert cache_data["memory_stats"]["hits"] == 8
+
+    # 分组全部命中时运行中也不再请求：同一本书重新初始化（不传 memory）后再运行
+    processor.delete_cache(processor.get_cache_filename(path))
+    processor.process_epub_anchor_init(path, 2000)
+    translator = PrefixTranslator()
+    assert processor.process_run(path, translator)
+    assert translator.requests == 0
+    cache_data = processor.load_cache(processor.get_cache_filename(path))
+    assert cache_data["files"][0]["chunks"][0]["trans"]
+    stats = cache_data["memory_stats"]
+    assert stats["hits"] == stats["lookups"] == len(grouped_indices(cache_data))
+
+
+def test_partial_memory_hits_are_not_counted(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    path = str(tmp_path / "book.epub")
+    make_epub(path, ["Known paragraph."])
+    processor = Processor(cache_dir)
+    processor.process_epub_anchor_init(path, 2000)
+    assert processor.process_run(path, PrefixTranslator())
+
+    # 同一分组中一块命中记忆、一块未命中：整组仍需请求，命中率不应虚高
+    path2 = str(tmp_path / "book2.epub")
+    make_epub(path2, ["Known paragraph.", "New paragraph."])
+    processor.process_epub_anchor_init(path2, 2000)
+    translator = PrefixTranslator()
+    assert processor.process_run(path2, translator)
+    assert translator.requests == 1
+    assert processor.load_cache(processor.get_cache_filename(path2))["memory_stats"] == {"lookups": 2, "hits": 0, "duplicates": 0}